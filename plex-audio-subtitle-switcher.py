@@ -3,10 +3,44 @@ from plexapi.myplex import MyPlexAccount
 from plexapi.exceptions import NotFound
 from plexapi.exceptions import BadRequest
 from plexapi.media import AudioStream
+from plexapi.media import Media
 from plexapi.media import SubtitleStream
+from plexapi import TIMEOUT as PLEXAPI_TIMEOUT
+from requests.adapters import BaseAdapter
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from functools import partial
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from datetime import datetime
+from datetime import timedelta
+from email.parser import BytesParser
+from email.policy import HTTP
 from shutil import copyfile
+from types import SimpleNamespace
+from itertools import islice
+from urllib.parse import quote
+from xml.etree import ElementTree
+import argparse
+import atexit
+import cProfile
+import csv
 import getpass
+import heapq
+import ipaddress
+import json
+import os
+import pstats
+import re
 import sys
+import threading
+import time
+import tracemalloc
 import requests
 import configparser
 
@@ -18,12 +52,186 @@ except ImportError:
     except ImportError:
         import pyreadline3 as readline
 
+# Number of episodes requested per page while batch-applying streams. Only
+# this many episodes are held in memory at once, however long the series is.
+EPISODE_WINDOW = 50
+
+# Number of show titles requested per page when listing or searching a
+# library, and the most titles offered when tab-completing a show.
+SHOW_WINDOW = 200
+COMPLETION_LIMIT = 200
+
+# Number of distinct (template, stream layout) results kept by MatchCache.
+MATCH_CACHE_SIZE = 4096
+
+# Default number of pooled connections kept open to each Plex server.
+POOL_SIZE = 10
+
+# Seconds between progress lines when output is not a terminal.
+PROGRESS_LOG_INTERVAL = 10
+
+# Number of recent parts and requests that throughput and latency are
+# averaged over in progress output.
+PROGRESS_WINDOW = 50
+
+# Characters of quiet-mode output buffered before being written at once.
+OUTPUT_BUFFER_SIZE = 65536
+
+# Number of reloaded episodes kept by EpisodeCache in daemon mode.
+EPISODE_CACHE_SIZE = 5000
+
+# Default port of the daemon's local HTTP API.
+DAEMON_PORT = 32500
+
+# Number of finished jobs the daemon keeps the state of.
+DAEMON_JOB_HISTORY = 100
+
+# Seconds the webhook receiver waits for more new episodes of a show before
+# applying its tracks, so a season added at once is handled as one batch.
+WEBHOOK_DELAY = 5
+
+# File the tracks chosen for each show are kept in, for new episodes.
+TEMPLATE_FILE = "show_templates.json"
+
+# File the connection each server last answered on is kept in, so it can be
+# tried first on the next online sign-in.
+CONNECTION_FILE = "connections.json"
+
+# Seconds a candidate connection to a server has to answer during online
+# sign-in, and seconds the remembered connection is tried alone before the
+# others join the race.
+CONNECT_TIMEOUT = 10
+CONNECT_HEAD_START = 0.5
+
+# Codec names preference rules recognize. Other words are title words.
+RULE_CODECS = frozenset([
+    "aac", "ac3", "eac3", "dca", "dts", "flac", "mp3", "opus", "pcm",
+    "truehd", "vorbis", "ass", "dvd_subtitle", "mov_text", "pgs", "srt",
+    "ssa", "vobsub", "webvtt"])
+
+# Default seconds a GET response is reused without asking the server, and
+# number of responses kept per server.
+CACHE_TTL = 30
+CACHE_SIZE = 512
+
+# Default seconds any one request to a server may take.
+REQUEST_TIMEOUT = 30
+
+# Slow GETs are sent a second time once they have taken longer than this
+# percentile of the last HEDGE_WINDOW GET latencies, after HEDGE_MIN_SAMPLES
+# have been seen. At most HEDGE_BUDGET of GETs are sent twice.
+HEDGE_PERCENTILE = 0.95
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_BUDGET = 0.05
+
+# Default seconds after which a fetch or write is logged as slow, and number
+# of the slowest calls listed in a run's summary.
+SLOW_CALL = 5
+SLOW_CALL_TOP = 10
+
+# Query string for fetching only what matching needs from an episode: its
+# media, parts and streams. Elements and fields the server can leave out are
+# excluded, and optional extras are not requested.
+STREAMS_QUERY = (
+    "?checkFiles=0&includeChapters=0&includeMarkers=0&includeExtras=0"
+    "&includeRelated=0&includeOnDeck=0&includePopularLeaves=0"
+    "&includeConcerts=0&includePreferences=0"
+    "&excludeElements=Role,Director,Writer,Producer,Genre,Country,"
+    "Collection,Label,Guid,Rating,Image,UltraBlurColors,Chapter,Marker,Field"
+    "&excludeFields=summary,thumb,art,parentThumb,grandparentThumb,"
+    "grandparentArt,grandparentTheme")
+
+# Bytes of a response read at a time when it is parsed as it downloads.
+PARSE_CHUNK_SIZE = 65536
+
+# Number of written parts read back per request when verifying a run, and
+# times a part whose tracks were not applied is written again.
+VERIFY_WINDOW = 50
+VERIFY_RETRIES = 2
+
+# Columns of an audit file, one row per MediaPart.
+AUDIT_FIELDS = [
+    "library", "show", "season", "episode", "title", "ratingKey", "part",
+    "file", "audio", "subtitles", "selectedAudio", "selectedSubtitles",
+    "flags"]
+
+# Default file name prefix of the reports written by --profile, and number of
+# functions and allocation sites listed in them.
+PROFILE_PREFIX = "profile"
+PROFILE_TOP = 30
+
+# Folder that stream selection snapshots are written to before each run.
+SNAPSHOT_FOLDER = "snapshots"
+
+# Title words that are spelled several ways across releases, mapped to the
+# spelling normalizeTitle() uses. Words mapped to "" are dropped.
+TITLE_TOKEN_ALIASES = {
+    "cc": "sdh",
+    "hi": "sdh",
+    "sub": "subs",
+    "subtitle": "subs",
+    "subtitles": "subs",
+    "stream": "",
+    "track": "",
+}
+
 
 ###############################################################################
 # Classes
 ###############################################################################
 
 
+class ApplyResult:
+    """ Container class holding the outcome of an :func:`applyTemplates` run.
+
+        Attributes:
+            audioSet (int): Number of parts whose audio stream was set.
+            failed (list<str>): Episodes whose parts could not be written.
+            parts (int): Number of parts processed.
+            subtitlesSet (int): Number of parts whose subtitles were set or
+                disabled.
+            unmatched (list<str>): Episodes in which a template had no match.
+            unverified (list<str>): Episodes whose tracks were read back as
+                not set, if the run was verified.
+            verified (int): Number of parts whose tracks were read back as
+                set, if the run was verified.
+    """
+
+    def __init__(self):
+        # Initialize variables
+        self.audioSet = 0
+        self.failed = []
+        self.parts = 0
+        self.subtitlesSet = 0
+        self.unmatched = []
+        self.unverified = []
+        self.verified = 0
+
+    def record(self, match, adjustAudio=True, adjustSubtitles=True):
+        """ Count a written :class:`PartMatch`."""
+        self.parts += 1
+        name = episodeToString(match.episode)
+        if match.error is not None:
+            self.failed.append(name)
+            return
+        unmatched = False
+        if match.audioStream:
+            self.audioSet += 1
+        elif adjustAudio:
+            unmatched = True
+        if match.resetSubtitles or match.subtitleStream:
+            self.subtitlesSet += 1
+        elif adjustSubtitles:
+            unmatched = True
+        if unmatched:
+            self.unmatched.append(name)
+        if match.verified:
+            self.verified += 1
+        elif match.verified is False:
+            self.unverified.append(name)
+
+
 class AudioStreamInfo:
     """ Container class to hold info about an AudioStream
 
@@ -36,6 +244,7 @@ class AudioStreamInfo:
                 :class:`~plexapi.media.AudioStream` in MediaPart.audioStreams()
             codec (str): Codec of the stream (ex: srt, ac3, mpeg4).
             languageCode (str): Ascii code for language (ex: eng, tha).
+            normalizedTitle (str): Title after :func:`normalizeTitle`.
             title (str): Title of the audio stream.
     """
 
@@ -46,8 +255,775 @@ class AudioStreamInfo:
         self.audioStreamsIndex = audioStreamsIndex
         self.codec = audioStream.codec
         self.languageCode = audioStream.languageCode
+        self.normalizedTitle = normalizeTitle(audioStream.title)
         self.title = audioStream.title
 
+    def matchKey(self):
+        """ Return a hashable tuple of every field :func:`matchAudio` reads
+            from this template."""
+        return (self.title, self.languageCode, self.codec,
+                self.audioChannelLayout, self.audioStreamsIndex)
+
+
+class BatchProgress:
+    """ Displays how far along a batch run is: episodes done out of the
+        total, current episodes per second, rolling request latency and ETA.
+        An episode is done once every MediaPart of every version of it is.
+        On a terminal the status line is redrawn in place; otherwise a
+        progress line is printed every PROGRESS_LOG_INTERVAL seconds. Safe to
+        share between threads.
+
+        Attributes:
+            done (int): Number of episodes finished.
+            total (int): Number of episodes expected, from the season
+                listings.
+    """
+
+    def __init__(self, total, stream=None):
+        # Initialize variables
+        self.done = 0
+        self.total = total
+        self._completions = deque(maxlen=PROGRESS_WINDOW)
+        self._latencies = deque(maxlen=PROGRESS_WINDOW)
+        self._lastLog = time.monotonic()
+        self._lock = threading.Lock()
+        self._partsLeft = {}
+        self._stream = stream or sys.stdout
+        self._isTerminal = self._stream.isatty()
+        self._statusShown = False
+
+    def _status(self):
+        """ Return the current progress as a single line."""
+        now = time.monotonic()
+        rate = 0.0
+        if self._completions:
+            firstTime, firstDone = self._completions[0]
+            if now > firstTime:
+                rate = (self.done - firstDone) / (now - firstTime)
+        latency = 0.0
+        if self._latencies:
+            latency = sum(self._latencies) / len(self._latencies)
+        remaining = max(self.total - self.done, 0)
+        eta = str(timedelta(seconds=int(remaining / rate))) if rate else "?"
+        percent = 100 * self.done / self.total if self.total else 100
+        return ("%d/%d episodes (%.0f%%) | %.1f episodes/s | latency %.0f ms "
+                "| ETA %s" % (self.done, self.total, percent, rate,
+                              latency * 1000, eta))
+
+    def advance(self, episodes=1):
+        """ Count finished episodes and refresh the display."""
+        with self._lock:
+            self.done += episodes
+            self._completions.append((time.monotonic(), self.done))
+            if self._isTerminal:
+                self._stream.write("\r%s\x1b[K" % self._status())
+                self._statusShown = True
+            elif time.monotonic() - self._lastLog >= PROGRESS_LOG_INTERVAL:
+                self._lastLog = time.monotonic()
+                self._stream.write("Progress: %s\n" % self._status())
+            self._stream.flush()
+
+    def advancePart(self, episode):
+        """ Count a finished MediaPart of an episode, and the episode once
+            every part of every version of it is finished."""
+        with self._lock:
+            remaining = self._partsLeft.pop(episode.ratingKey, None)
+            if remaining is None:
+                remaining = sum(len(media.parts) for media in episode.media)
+            if remaining > 1:
+                self._partsLeft[episode.ratingKey] = remaining - 1
+                return
+        self.advance()
+
+    def clear(self):
+        """ Remove the status line so other output can be printed."""
+        with self._lock:
+            if self._statusShown:
+                self._stream.write("\r\x1b[K")
+                self._stream.flush()
+                self._statusShown = False
+
+    def finish(self):
+        """ Print the final progress line."""
+        with self._lock:
+            if self._statusShown:
+                self._stream.write("\r\x1b[K")
+                self._statusShown = False
+            self._stream.write("Finished: %s\n" % self._status())
+            self._stream.flush()
+
+    def recordRequest(self, seconds):
+        """ Add a request's latency to the rolling average."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+
+class CachingAdapter(BaseAdapter):
+    """ Transport adapter that keeps recent GET responses of another adapter
+        in memory, per URL and user token. A repeat GET is answered from
+        memory for ttl seconds; after that it is revalidated with
+        If-None-Match/If-Modified-Since if the response had an ETag or
+        Last-Modified header. Writes drop the cached responses they affect:
+        those containing the written MediaPart, or all of them for other
+        writes. Streamed GETs are passed through, as their body is read as
+        it arrives. Safe to share between threads.
+
+        Attributes:
+            adapter (:class:`requests.adapters.BaseAdapter`): Adapter that
+                sends requests the cache can't answer.
+            hits (int): GETs answered from memory.
+            maxSize (int): Maximum number of responses kept.
+            misses (int): GETs sent to the server in full.
+            revalidations (int): Expired responses the server confirmed are
+                unchanged.
+            ttl (float): Seconds a response is served without asking the
+                server.
+    """
+
+    def __init__(self, adapter, ttl=CACHE_TTL, maxSize=CACHE_SIZE):
+        super().__init__()
+
+        # Initialize variables
+        self.adapter = adapter
+        self.hits = 0
+        self.maxSize = maxSize
+        self.misses = 0
+        self.revalidations = 0
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._partKeys = {}
+
+    def _forget(self, key):
+        """ Drop a cached response. Call with the lock held."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for partId in entry["parts"]:
+                keys = self._partKeys.get(partId)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._partKeys[partId]
+
+    @staticmethod
+    def _response(entry, request):
+        """ Return a new response built from a cached entry."""
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = requests.structures.CaseInsensitiveDict(
+            entry["headers"])
+        response._content = entry["content"]
+        response._content_consumed = True
+        response.encoding = entry["encoding"]
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+    def hitRate(self):
+        """ Return the fraction of GETs answered without a full response."""
+        total = self.hits + self.revalidations + self.misses
+        return (self.hits + self.revalidations) / total if total else 0.0
+
+    def invalidate(self, url):
+        """ Drop the cached responses a write to url affects."""
+        partMatch = re.search(r"/library/parts/(\d+)", url)
+        with self._lock:
+            if partMatch:
+                for key in list(self._partKeys.get(partMatch.group(1), ())):
+                    self._forget(key)
+            else:
+                self._entries.clear()
+                self._partKeys.clear()
+
+    def send(self, request, **kwargs):
+        """ Answer a GET from memory if possible, otherwise send request."""
+        if request.method != "GET":
+            response = self.adapter.send(request, **kwargs)
+            self.invalidate(request.url)
+            return response
+
+        # Streamed responses are parsed as they arrive, so aren't kept
+        if kwargs.get("stream"):
+            return self.adapter.send(request, **kwargs)
+
+        key = (request.url, request.headers.get("X-Plex-Token"))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if time.monotonic() - entry["storedAt"] < self.ttl:
+                    self.hits += 1
+                    return self._response(entry, request)
+
+        # Ask the server whether an expired response is still current
+        if entry is not None:
+            if "ETag" in entry["headers"]:
+                request.headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                request.headers["If-Modified-Since"] = \
+                    entry["headers"]["Last-Modified"]
+        response = self.adapter.send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.revalidations += 1
+                entry["storedAt"] = time.monotonic()
+            return self._response(entry, request)
+
+        with self._lock:
+            self.misses += 1
+        if response.status_code == 200:
+            entry = {
+                "status": response.status_code,
+                "headers": dict(response.headers),
+                "content": response.content,
+                "encoding": response.encoding,
+                "parts": set(re.findall(r'<Part\b[^>]*?\bid="(\d+)"',
+                                        response.text)),
+                "storedAt": time.monotonic(),
+            }
+            with self._lock:
+                self._forget(key)
+                self._entries[key] = entry
+                for partId in entry["parts"]:
+                    self._partKeys.setdefault(partId, set()).add(key)
+                while len(self._entries) > self.maxSize:
+                    self._forget(next(iter(self._entries)))
+        return response
+
+
+class Cassette:
+    """ Plex API traffic saved to a file of JSON lines, one per request. In
+        "record" mode every response is added to the file with tokens
+        removed. In "replay" mode responses are served from the file, each
+        after its recorded latency times speed, so a run can be repeated
+        offline. Safe to share between threads.
+
+        Attributes:
+            mode (str): "record" or "replay".
+            path (str): Path of the cassette file.
+            speed (float): Factor recorded latencies are multiplied by when
+                replaying; 0 for no delay.
+    """
+
+    def __init__(self, path, mode="record", speed=1.0):
+        # Initialize variables
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._file = None
+
+        if mode == "record":
+            self._file = open(path, "w", encoding="utf8")
+        else:
+            with open(path, encoding="utf8") as cassetteFile:
+                for line in cassetteFile:
+                    entry = json.loads(line)
+                    self._responses.setdefault(
+                        (entry["method"], entry["url"]), deque()).append(entry)
+
+    @staticmethod
+    def sanitize(text):
+        """ Return text with Plex tokens replaced by "REDACTED"."""
+        text = re.sub(r'((?:auth|access|authentication)?[Tt]oken'
+                      r'(?:="|":\s*"))[^"]*', r"\1REDACTED", text)
+        return re.sub(r"(X-Plex-Token=)[^&\s\"']*", r"\1REDACTED", text)
+
+    def close(self):
+        """ Finish writing the cassette file."""
+        if self._file is not None:
+            self._file.close()
+
+    def record(self, request, response, seconds):
+        """ Add a response and its latency to the cassette."""
+        entry = {
+            "method": request.method,
+            "url": self.sanitize(request.url),
+            "status": response.status_code,
+            "contentType": response.headers.get("Content-Type", ""),
+            "content": self.sanitize(
+                response.content.decode("utf8", "replace")),
+            "seconds": round(seconds, 4),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def replay(self, request):
+        """ Return the recorded response to request, after its recorded
+            latency. Requests made more often than recorded get the last
+            response again."""
+        key = (request.method, self.sanitize(request.url))
+        with self._lock:
+            entries = self._responses.get(key)
+            if not entries:
+                raise requests.ConnectionError(
+                    "%s %s is not in cassette '%s'." % (key + (self.path,)))
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        if self.speed > 0:
+            time.sleep(entry["seconds"] * self.speed)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = requests.structures.CaseInsensitiveDict(
+            {"Content-Type": entry["contentType"]})
+        response._content = entry["content"].encode("utf8")
+        response._content_consumed = True
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=entry["seconds"])
+        return response
+
+
+class CassetteAdapter(BaseAdapter):
+    """ Transport adapter that records the traffic of another adapter to a
+        :class:`Cassette`, or answers from the cassette when replaying.
+
+        Attributes:
+            adapter (:class:`requests.adapters.BaseAdapter`): Adapter that
+                sends requests when recording.
+            cassette (:class:`Cassette`): Where traffic is saved.
+    """
+
+    def __init__(self, cassette, adapter=None):
+        super().__init__()
+
+        # Initialize variables
+        self.adapter = adapter
+        self.cassette = cassette
+
+    def close(self):
+        if self.adapter is not None:
+            self.adapter.close()
+
+    def send(self, request, **kwargs):
+        """ Send request, or replay its response."""
+        if self.cassette.mode == "replay":
+            return self.cassette.replay(request)
+        started = time.monotonic()
+        response = self.adapter.send(request, **kwargs)
+        self.cassette.record(request, response, time.monotonic() - started)
+        return response
+
+
+class ConnectionStore:
+    """ The connection each server last answered on, kept in a JSON file
+        keyed by the server's machine identifier. Safe to share between
+        threads.
+
+        Attributes:
+            path (str): Path of the JSON file.
+    """
+
+    def __init__(self, path=CONNECTION_FILE):
+        # Initialize variables
+        self.path = path
+        self._lock = threading.Lock()
+        self._uris = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as connectionFile:
+                self._uris = json.load(connectionFile)
+
+    def get(self, machineIdentifier):
+        """ Return the URI the server last answered on, or None."""
+        with self._lock:
+            return self._uris.get(machineIdentifier)
+
+    def save(self, machineIdentifier, uri):
+        """ Remember the URI the server answered on."""
+        with self._lock:
+            if self._uris.get(machineIdentifier) == uri:
+                return
+            self._uris[machineIdentifier] = uri
+
+            # Write a new file and swap it in, so a crash never leaves a
+            # half-written one behind
+            with open(self.path + ".tmp", "w", encoding="utf8") as newFile:
+                json.dump(self._uris, newFile, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+
+class DaemonJob:
+    """ Container class to hold the state of a job submitted to the daemon
+
+        Attributes:
+            error (str): Why the job failed, if it did.
+            finished (float): time.time() the job ended, or None.
+            id (int): Number identifying the job.
+            progress (:class:`BatchProgress`): Episodes done out of the
+                total.
+            result (:class:`ApplyResult`): Outcome once the job is done.
+            seasons (list<int>): Season numbers modified.
+            show (:class:`~plexapi.video.Show`): The show modified.
+            snapshot (:class:`StreamSnapshot`): Previous streams of every part
+                modified, or None when writing for home users.
+            started (float): time.time() the job was submitted.
+            state (str): "queued", "running", "done" or "failed".
+    """
+
+    def __init__(self, jobId, show, seasons, progress, snapshot):
+        # Initialize variables
+        self.error = None
+        self.finished = None
+        self.id = jobId
+        self.progress = progress
+        self.result = None
+        self.seasons = seasons
+        self.show = show
+        self.snapshot = snapshot
+        self.started = time.time()
+        self.state = "queued"
+
+    def toDict(self):
+        """ Return the job's state as a JSON-serializable dict."""
+        job = {
+            "id": self.id,
+            "state": self.state,
+            "show": self.show.title,
+            "seasons": self.seasons,
+            "done": self.progress.done,
+            "total": self.progress.total,
+            "seconds": round((self.finished or time.time()) - self.started,
+                             3),
+            "snapshot": self.snapshot and self.snapshot.path,
+        }
+        if self.result is not None:
+            job.update({
+                "parts": self.result.parts,
+                "audioSet": self.result.audioSet,
+                "subtitlesSet": self.result.subtitlesSet,
+                "unmatched": self.result.unmatched,
+                "failed": self.result.failed,
+            })
+        if self.error is not None:
+            job["error"] = self.error
+        return job
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """ Answers requests to the daemon's local HTTP API. Request and response
+        bodies are JSON.
+
+        Endpoints:
+            GET /libraries: Titles of the shows in each TV library.
+            POST /webhook: Receives Plex webhooks. Episodes added to a show
+                are set to the tracks last chosen for it.
+            GET /jobs: State of every recent job.
+            GET /jobs/<id>: State of one job.
+            POST /jobs: Submit a job. Returns its state.
+            POST /preview: The streams a job would set, without setting them.
+
+        Only /webhook is served to other computers, since the API has no
+        sign-in of its own; the rest answer 403 unless the request comes
+        from this computer.
+
+        Jobs and previews take the show and tracks to match as:
+            {"library": "TV Shows", "show": "Avatar: The Last Airbender",
+             "seasons": [1, 2], "sample": [1, 1], "audio": 2, "subtitles": 5}
+
+        "sample" is the [season, episode] the track numbers refer to (default
+        = first episode of the first season), numbered as printed by
+        :func:`printStreams`. "seasons" defaults to every season. Leave out
+        "audio" or "subtitles" to leave those tracks untouched, or pass -1 as
+        "subtitles" to disable subtitles.
+    """
+
+    def _isLocal(self):
+        """ Return True if the request comes from this computer."""
+        address = ipaddress.ip_address(self.client_address[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return address.is_loopback
+
+    def _readBody(self):
+        """ Return the raw request body."""
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _readJson(self):
+        """ Return the request body parsed as JSON."""
+        try:
+            return json.loads(self._readBody() or b"{}")
+        except ValueError:
+            raise ValueError("Request body is not valid JSON.")
+
+    def _send(self, status, body):
+        """ Send body as a JSON response."""
+        data = json.dumps(body).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        switcher = self.server.switcher
+        jobMatch = re.fullmatch(r"/jobs/(\d+)", self.path)
+        try:
+            if not self._isLocal():
+                self._send(403, {"error": "Only /webhook is served to other "
+                                          "computers."})
+            elif self.path == "/libraries":
+                self._send(200, switcher.libraries())
+            elif self.path == "/jobs":
+                self._send(200, switcher.jobs())
+            elif jobMatch:
+                job = switcher.job(int(jobMatch.group(1)))
+                if job is None:
+                    self._send(404, {"error": "No such job."})
+                else:
+                    self._send(200, job)
+            else:
+                self._send(404, {"error": "Unknown endpoint."})
+        except (requests.RequestException, BadRequest) as error:
+            self._send(502, {"error": str(error)})
+        except Exception as error:
+            self._send(500, {"error": "Unexpected error: %s" % error})
+
+    def do_POST(self):
+        switcher = self.server.switcher
+        try:
+            if self.path != "/webhook" and not self._isLocal():
+                self._send(403, {"error": "Only /webhook is served to other "
+                                          "computers."})
+            elif self.path == "/jobs":
+                self._send(202, switcher.submit(self._readJson()))
+            elif self.path == "/preview":
+                self._send(200, switcher.preview(self._readJson()))
+            elif self.path == "/webhook":
+                payload = parseWebhook(self.headers.get("Content-Type", ""),
+                                       self._readBody())
+                self._send(200, {"queued": switcher.webhook(payload)})
+            else:
+                self._send(404, {"error": "Unknown endpoint."})
+        except ValueError as error:
+            self._send(400, {"error": str(error)})
+        except (requests.RequestException, BadRequest) as error:
+            self._send(502, {"error": str(error)})
+        except Exception as error:
+            self._send(500, {"error": "Unexpected error: %s" % error})
+
+
+class EpisodeCache:
+    """ Least-recently-used cache of reloaded episodes of one server, so a
+        long-running process can skip fetching stream metadata again. A
+        cached episode is only reused while its updatedAt matches the one in
+        the episode listing, so replaced or re-analyzed files are refetched.
+
+        Attributes:
+            hits (int): Number of episodes answered from the cache.
+            maxSize (int): Maximum number of episodes kept.
+            misses (int): Number of episodes that had to be reloaded.
+    """
+
+    def __init__(self, maxSize=EPISODE_CACHE_SIZE):
+        # Initialize variables
+        self.hits = 0
+        self.maxSize = maxSize
+        self.misses = 0
+        self._episodes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, episode):
+        """ Cache an episode that was fetched with its streams."""
+        with self._lock:
+            self._episodes[episode.ratingKey] = episode
+            self._episodes.move_to_end(episode.ratingKey)
+            if len(self._episodes) > self.maxSize:
+                self._episodes.popitem(last=False)
+
+    def reload(self, episode):
+        """ Return episode with its streams loaded, reusing the cached copy
+            if the episode has not changed since."""
+        key = episode.ratingKey
+        with self._lock:
+            cached = self._episodes.get(key)
+            if cached is not None and cached.updatedAt == episode.updatedAt:
+                self.hits += 1
+                self._episodes.move_to_end(key)
+                return cached
+            self.misses += 1
+        fetchStreams(episode)
+        self.add(episode)
+        return episode
+
+
+class HedgingAdapter(BaseAdapter):
+    """ Transport adapter that bounds how long requests of another adapter
+        take. Every request gets a timeout, which replaces plexapi's default
+        one, shortened to what is left before the run :data:`deadline`, and
+        none are sent once it has passed. A GET
+        that takes longer than HEDGE_PERCENTILE of recent GETs is sent a
+        second time and whichever copy answers first is used, so one slow
+        response (e.g. the server is busy making thumbnails) doesn't hold up
+        the run. Safe to share between threads.
+
+        Attributes:
+            adapter (:class:`requests.adapters.BaseAdapter`): Adapter that
+                sends the requests.
+            hedged (int): GETs sent a second time.
+            hedgeWins (int): Hedged GETs the second copy answered first.
+            requests (int): GETs sent.
+            timeout (float): Seconds a request may take, unless the caller
+                asks for a shorter or longer one than plexapi's default.
+    """
+
+    def __init__(self, adapter, timeout=REQUEST_TIMEOUT, hedge=True,
+                 poolSize=POOL_SIZE):
+        super().__init__()
+
+        # Initialize variables
+        self.adapter = adapter
+        self.hedged = 0
+        self.hedgeWins = 0
+        self.requests = 0
+        self.timeout = timeout
+        self._executor = None
+        self._latencies = deque(maxlen=HEDGE_WINDOW)
+        self._lock = threading.Lock()
+        if hedge:
+            self._executor = ThreadPoolExecutor(max_workers=poolSize * 2)
+
+    @staticmethod
+    def _closeLoser(future):
+        """ Close the response of a copy of a GET that was not used, so a
+            streamed one gives its connection back to the pool."""
+        if future.exception() is None:
+            future.result().close()
+
+    def _hedgeDelay(self):
+        """ Return seconds to wait before sending a GET again, or None if it
+            shouldn't be. Call with the lock held."""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES or \
+                self.hedged >= HEDGE_BUDGET * self.requests:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[int(HEDGE_PERCENTILE * (len(latencies) - 1))]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.adapter.close()
+
+    def send(self, request, **kwargs):
+        """ Send request within its timeout, hedging slow GETs."""
+        # plexapi sends its own default with every request, so only other
+        # timeouts were asked for by the caller
+        timeout = self.timeout
+        if isinstance(kwargs.get("timeout"), (int, float)) and \
+                kwargs["timeout"] != PLEXAPI_TIMEOUT:
+            timeout = kwargs["timeout"]
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.Timeout("Run deadline passed.",
+                                       request=request)
+            timeout = min(timeout, remaining)
+        kwargs["timeout"] = timeout
+        if request.method != "GET" or self._executor is None:
+            return self.adapter.send(request, **kwargs)
+
+        # Send the GET, and again if it is slow to answer
+        with self._lock:
+            self.requests += 1
+            delay = self._hedgeDelay()
+        started = time.monotonic()
+        first = self._executor.submit(self.adapter.send, request, **kwargs)
+        pending = {first}
+        if delay is not None and not wait(pending, timeout=delay)[0]:
+            with self._lock:
+                self.hedged += 1
+            pending.add(self._executor.submit(
+                self.adapter.send, request.copy(), **kwargs))
+
+        # Use the first copy that answers
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    with self._lock:
+                        self._latencies.append(time.monotonic() - started)
+                        if future is not first:
+                            self.hedgeWins += 1
+                    for loser in (done | pending) - {future}:
+                        loser.add_done_callback(self._closeLoser)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+class MatchCache:
+    """ Least-recently-used cache of :func:`matchAudio` and
+        :func:`matchSubtitles` results. Matching only depends on the template
+        and on the fields of the candidate streams, so a result can be reused
+        for any MediaPart with the same stream layout, even in another show.
+
+        Attributes:
+            hits (int): Number of matches answered from the cache.
+            maxSize (int): Maximum number of results kept.
+            misses (int): Number of matches that had to be computed.
+    """
+
+    def __init__(self, maxSize=MATCH_CACHE_SIZE):
+        # Initialize variables
+        self.hits = 0
+        self.maxSize = maxSize
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+
+    def _match(self, key, streams, matcher):
+        """ Return the stream in streams chosen for key, calling matcher and
+            storing the chosen position on a cache miss."""
+        with self._lock:
+            cached = key in self._results
+            if cached:
+                self.hits += 1
+                self._results.move_to_end(key)
+                position = self._results[key]
+            else:
+                self.misses += 1
+        if not cached:
+            stream = matcher()
+            position = None
+            if stream is not None:
+                position = [s.id for s in streams].index(stream.id)
+            with self._lock:
+                self._results[key] = position
+                if len(self._results) > self.maxSize:
+                    self._results.popitem(last=False)
+        return streams[position] if position is not None else None
+
+    def hitRate(self):
+        """ Return the fraction of matches answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def matchAudio(self, episodePart, template):
+        """ Cached version of :func:`matchAudio`."""
+        streams = episodePart.audioStreams()
+        key = ("audio", template.matchKey(), tuple(
+            (s.title, s.languageCode, s.codec, s.audioChannelLayout)
+            for s in streams))
+        return self._match(key, streams,
+                           lambda: matchAudio(episodePart, template))
+
+    def matchSubtitles(self, episodePart, template):
+        """ Cached version of :func:`matchSubtitles`."""
+        streams = episodePart.subtitleStreams()
+        key = ("subtitle", template.matchKey(), tuple(
+            (s.title, s.languageCode, s.codec, s.forced, s.index >= 0)
+            for s in streams))
+        return self._match(key, streams,
+                           lambda: matchSubtitles(episodePart, template))
+
 
 class OrganizedStreams:
     """ Container class that stores AudioStreams and SubtitleStreams while
@@ -56,6 +1032,8 @@ class OrganizedStreams:
         Attributes:
             audioStreams (list<:class:`~plexapi.media.AudioStream`>): List of
                 all AudioStreams in MediaPart
+            audioTitleIndex (dict): AudioStreams keyed by (normalized title,
+                language code), in file order.
             externalSubs (list<:class:`~plexapi.media.SubtitleStream`>): List
             of all SubtitleStreams that are located in the MediaPart externally
             internalSubs (list<:class:`~plexapi.media.SubtitleStream`>): List
@@ -65,6 +1043,8 @@ class OrganizedStreams:
                 streams belong to
             subtitleStreams (list<:class:`~plexapi.media.SubtitleStream`>):
                 List of all SubtitleStreams in MediaPart
+            subtitleTitleIndex (dict): SubtitleStreams keyed by (normalized
+                title, language code), in file order.
     """
 
     def __init__(self, mediaPart):
@@ -83,6 +1063,22 @@ class OrganizedStreams:
             else:
                 self.externalSubs.append(stream)
 
+        # Index streams by normalized title for title matching
+        self.audioTitleIndex = self._buildTitleIndex(self.audioStreams)
+        self.subtitleTitleIndex = self._buildTitleIndex(self.subtitleStreams)
+
+    @staticmethod
+    def _buildTitleIndex(streams):
+        """ Return streams grouped by (normalized title, language code),
+            skipping streams without a title."""
+        index = {}
+        for stream in streams:
+            title = normalizeTitle(stream.title)
+            if title:
+                index.setdefault((title, stream.languageCode),
+                                 []).append(stream)
+        return index
+
     def allStreams(self):
         """ Return a list of all :class:`~plexapi.media.AudioStream` and
             :class:`~plexapi.media.SubtitleStream`> in MediaPart."""
@@ -121,6 +1117,570 @@ class OrganizedStreams:
         return False
 
 
+class PartMatch:
+    """ Container class to hold the streams chosen for a single MediaPart as it
+        moves through the batch pipeline.
+
+        Attributes:
+            audioStream (:class:`~plexapi.media.AudioStream`): AudioStream to
+                set as default, or None if no audio match was found.
+            episode (:class:`~plexapi.video.Episode`): Episode the part
+                belongs to.
+            error (Exception): Error raised while writing the part, if any.
+            part (:class:`~plexapi.media.MediaPart`): MediaPart to modify.
+            resetSubtitles (bool): True if subtitles will be disabled.
+            subtitleStream (:class:`~plexapi.media.SubtitleStream`):
+                SubtitleStream to set as default, or None if no subtitle match
+                was found.
+            verified (bool): True if the server was read back with the
+                streams set, False if not, None if not checked.
+    """
+
+    def __init__(self, episode, part):
+        # Initialize variables
+        self.audioStream = None
+        self.episode = episode
+        self.error = None
+        self.part = part
+        self.resetSubtitles = False
+        self.subtitleStream = None
+        self.verified = None
+
+
+class PartRecord:
+    """ Lightweight stand-in for a :class:`~plexapi.media.MediaPart`, read
+        from a response by :func:`parsePartRecords`. Its streams have the
+        names and types of plexapi's stream attributes, so it can be matched
+        with :func:`matchAudio`, :func:`matchSubtitles` or a
+        :class:`MatchCache` like a MediaPart.
+
+        Attributes:
+            episode (dict): Attributes of the Video element the part belongs
+                to, e.g. ratingKey, title and parentIndex.
+            file (str): Path of the part's file on the server.
+            id (int): Id of the MediaPart.
+            mediaId (int): Id of the Media version the part belongs to.
+            streams (list<:class:`types.SimpleNamespace`>): Audio and subtitle
+                streams of the part, in file order.
+    """
+
+    def __init__(self, episode, mediaId, elem):
+        # Initialize variables
+        self.episode = episode
+        self.file = elem.get("file")
+        self.id = int(elem.get("id"))
+        self.mediaId = mediaId
+        self.streams = []
+
+    def addStream(self, elem):
+        """ Add the stream of a Stream element. Video streams are skipped."""
+        streamType = int(elem.get("streamType") or 0)
+        if streamType not in (AudioStream.STREAMTYPE,
+                              SubtitleStream.STREAMTYPE):
+            return
+        stream = SimpleNamespace(
+            id=int(elem.get("id")), streamType=streamType,
+            index=int(elem.get("index", "-1")),
+            languageCode=elem.get("languageCode"), codec=elem.get("codec"),
+            title=elem.get("title"), selected=elem.get("selected") == "1")
+        if streamType == AudioStream.STREAMTYPE:
+            stream.audioChannelLayout = elem.get("audioChannelLayout")
+        else:
+            stream.forced = elem.get("forced") == "1"
+        self.streams.append(stream)
+
+    def audioStreams(self):
+        """ Return the audio streams of the part."""
+        return [stream for stream in self.streams
+                if stream.streamType == AudioStream.STREAMTYPE]
+
+    def subtitleStreams(self):
+        """ Return the subtitle streams of the part."""
+        return [stream for stream in self.streams
+                if stream.streamType == SubtitleStream.STREAMTYPE]
+
+
+class RateLimitAdapter(HTTPAdapter):
+    """ Transport adapter with its own connection pool that spaces out
+        requests so that no more than rateLimit are sent per second.
+
+        Attributes:
+            rateLimit (float): Maximum requests per second, 0 for no limit.
+    """
+
+    def __init__(self, rateLimit=0, **kwargs):
+        super().__init__(**kwargs)
+
+        # Initialize variables
+        self.rateLimit = rateLimit
+        self._lock = threading.Lock()
+        self._nextSend = 0.0
+
+    def send(self, request, **kwargs):
+        """ Wait for this request's turn, then send it."""
+        if self.rateLimit > 0:
+            with self._lock:
+                now = time.monotonic()
+                sendAt = max(now, self._nextSend)
+                self._nextSend = sendAt + 1.0 / self.rateLimit
+            if sendAt > now:
+                time.sleep(sendAt - now)
+        return super().send(request, **kwargs)
+
+
+class RunOutput:
+    """ Single writer for the per-part output of batch runs. Lines are
+        printed as they happen on a terminal; otherwise, e.g. over a pipe or
+        in a log, they are buffered and written out in large blocks. In
+        quiet mode per-part success lines are not printed, other output is
+        buffered, and :func:`summary` ends the run with a count and the list
+        of episodes without matches or that failed. A verbose per-part log
+        can also be written to a file.
+
+        Attributes:
+            confirmed (int): Parts read back as set since the last summary,
+                or None if nothing was verified.
+            failures (list<str>): Problems recorded since the last summary.
+            logPath (str): Path of the per-part log, or None.
+            quiet (bool): True if per-part success lines are suppressed.
+            slowCall (float): Seconds after which a call is logged as slow.
+            slowCalls (int): Slow calls since the last summary.
+            successes (int): Success lines recorded since the last summary.
+    """
+
+    def __init__(self, quiet=False, logPath=None, slowCall=SLOW_CALL):
+        # Initialize variables
+        self.confirmed = None
+        self.failures = []
+        self.logPath = logPath
+        self.quiet = quiet
+        self.slowCall = slowCall
+        self.slowCalls = 0
+        self.successes = 0
+        self._slowest = []
+        self._buffer = []
+        self._bufferSize = 0
+        self._buffered = quiet or not sys.stdout.isatty()
+        self._lock = threading.Lock()
+        self._log = None
+
+        # Line buffered, so outputs of concurrent daemon jobs can share it
+        if logPath:
+            self._log = open(logPath, "a", buffering=1, encoding="utf8")
+
+    def _write(self, line):
+        """ Write a line to stdout, buffering it unless it is shown on a
+            terminal as it happens. Call with the lock held."""
+        if not self._buffered:
+            print(line)
+            return
+        self._buffer.append(line + "\n")
+        self._bufferSize += len(line) + 1
+        if self._bufferSize >= OUTPUT_BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """ Write out buffered lines."""
+        if self._buffer:
+            sys.stdout.write("".join(self._buffer))
+            sys.stdout.flush()
+            self._buffer = []
+            self._bufferSize = 0
+
+    def _logLine(self, line):
+        """ Write a timestamped line to the log file, if there is one."""
+        if self._log:
+            self._log.write("%s %s\n" % (
+                datetime.now().isoformat(timespec="seconds"), line))
+
+    def close(self):
+        """ Write out buffered lines and close the log file."""
+        with self._lock:
+            self._flush()
+            if self._log:
+                self._log.close()
+                self._log = None
+
+    def confirm(self, count):
+        """ Count parts whose tracks were read back as set."""
+        with self._lock:
+            self.confirmed = (self.confirmed or 0) + count
+
+    def flush(self):
+        """ Write out buffered lines without ending the run."""
+        with self._lock:
+            self._flush()
+
+    def problem(self, line):
+        """ Output a line about an episode that was not matched or failed.
+            Quiet mode lists these in the summary instead."""
+        with self._lock:
+            self.failures.append(line)
+            self._logLine(line)
+            if not self.quiet:
+                self._write(line)
+
+    def slow(self, seconds, endpoint, episode):
+        """ Log a call that took longer than slowCall seconds. The slowest
+            are listed in the summary."""
+        if seconds < self.slowCall:
+            return
+        line = "Slow call: %s for '%s %s' took %.1f s" % (
+            endpoint, episode.grandparentTitle, episodeToString(episode),
+            seconds)
+        with self._lock:
+            self.slowCalls += 1
+            self._logLine(line)
+            entry = (seconds, line)
+            if len(self._slowest) < SLOW_CALL_TOP:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def success(self, line):
+        """ Output a per-part success line. Quiet mode only logs it."""
+        with self._lock:
+            self.successes += 1
+            self._logLine(line)
+            if not self.quiet:
+                self._write(line)
+
+    def summary(self):
+        """ Print a compact summary of the run and start counting anew."""
+        with self._lock:
+            verified = ""
+            if self.confirmed is not None:
+                verified = " %d parts verified," % self.confirmed
+            self._write("Summary: %d tracks set,%s %d problems." % (
+                self.successes, verified, len(self.failures)))
+            if self.quiet:
+                for line in self.failures:
+                    self._write("\t%s" % line)
+            if self.slowCalls:
+                self._write("%d calls took over %g s. Slowest:" % (
+                    self.slowCalls, self.slowCall))
+                for seconds, line in sorted(self._slowest, reverse=True):
+                    self._write("\t%s" % line)
+            self._flush()
+            if self._log:
+                self._log.flush()
+            self.confirmed = None
+            self.failures = []
+            self.slowCalls = 0
+            self.successes = 0
+            self._slowest = []
+
+
+class RunProfiler:
+    """ CPU and memory profile of a run, for --profile. cProfile records
+        every thread for the whole run, and a tracemalloc snapshot is taken
+        at the end of each phase (sign-in, selection, apply). :func:`close`
+        writes the combined cProfile stats to "<prefix>.pstats" and a report
+        to "<prefix>.txt": time per phase, self time grouped into XML
+        parsing, matching, network and waiting, the functions with the most
+        cumulative time, and the top allocations of each phase.
+
+        Attributes:
+            phases (list<tuple>): (name, seconds, allocation statistics) of
+                each phase ended so far.
+            prefix (str): Path of the reports, without extension.
+    """
+
+    def __init__(self, prefix=PROFILE_PREFIX):
+        # Initialize variables
+        self.phases = []
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._phaseStarted = time.monotonic()
+        self._streamClassLines = {
+            AudioStreamInfo.__init__.__code__.co_firstlineno,
+            OrganizedStreams.__init__.__code__.co_firstlineno,
+            SubtitleStreamInfo.__init__.__code__.co_firstlineno}
+
+        # Start tracing memory, then profile this thread and every new one.
+        # From Python 3.12, one profile sees every thread and no second one
+        # can be enabled.
+        tracemalloc.start()
+        self._snapshot = tracemalloc.take_snapshot()
+        self._profile = cProfile.Profile()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profileThread)
+        self._profile.enable()
+
+    def _profileThread(self, frame, event, arg):
+        """ Start a profile for a new thread, on its first event."""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _area(self, function):
+        """ Return where a function's self time goes, from its
+            (file, line, name) key."""
+        path, line, name = function
+        path = path.replace("\\", "/")
+        if "/plexapi/" in path or "/xml/" in path or "XMLParser" in name:
+            return "XML parsing and plexapi objects"
+        if path == __file__.replace("\\", "/") and (
+                name.startswith("match") or name.startswith("_match") or
+                name in ("findTitleMatch", "normalizeTitle") or
+                name == "__init__" and line in self._streamClassLines):
+            return "Matching"
+        if any(part in path for part in (
+                "/requests/", "/urllib3/", "/http/", "/socket.py",
+                "/ssl.py")) or "_socket" in name or "_ssl" in name:
+            return "Network"
+        if name == "<built-in method builtins.input>" or \
+                "getpass" in path or "acquire" in name or \
+                "_queue" in name or "/threading.py" in path or \
+                "/concurrent/" in path:
+            return "Waiting on input or other threads"
+        return "Other"
+
+    def close(self):
+        """ End the last phase and write the reports."""
+        threading.setprofile(None)
+        self._profile.disable()
+        self.mark("exit")
+        tracemalloc.stop()
+
+        # Combine the profiles of every thread
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            for profile in self._profiles:
+                profile.create_stats()
+                if profile.stats:
+                    stats.add(profile)
+        stats.dump_stats(self.prefix + ".pstats")
+
+        # Group self time by area
+        areas = {}
+        for function, (calls, primitive, selfTime, cumulative,
+                       callers) in stats.stats.items():
+            area = self._area(function)
+            areas[area] = areas.get(area, 0.0) + selfTime
+        totalTime = sum(areas.values()) or 1.0
+
+        with open(self.prefix + ".txt", "w", encoding="utf8") as report:
+            report.write("Phases:\n")
+            for name, seconds, allocations in self.phases:
+                report.write("\t%-12s %8.2f s\n" % (name, seconds))
+            report.write("\nSelf time by area, every thread:\n")
+            for area, seconds in sorted(areas.items(), key=lambda a: -a[1]):
+                report.write("\t%-36s %8.2f s %5.1f%%\n" % (
+                    area, seconds, 100 * seconds / totalTime))
+            report.write("\nFunctions with the most cumulative time:\n")
+            stats.stream = report
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+            report.write("Top allocations of each phase:\n")
+            for name, seconds, allocations in self.phases:
+                report.write("\t%s:\n" % name)
+                for statistic in allocations:
+                    report.write("\t\t%s\n" % statistic)
+        print("Profile written to '%s.pstats' and '%s.txt'." % (
+            self.prefix, self.prefix))
+
+    def mark(self, name):
+        """ End the phase called name, recording its duration and the
+            memory allocated during it."""
+        snapshot = tracemalloc.take_snapshot()
+        now = time.monotonic()
+        allocations = snapshot.compare_to(self._snapshot, "lineno")
+        self.phases.append((name, now - self._phaseStarted,
+                            allocations[:PROFILE_TOP]))
+        self._snapshot = snapshot
+        self._phaseStarted = now
+
+
+class StreamSnapshot:
+    """ Records the audio and subtitle streams selected in each MediaPart
+        before it is modified, so a run can be rolled back with
+        :func:`rollbackSnapshot`. Each part is written to the file as one
+        "partId<TAB>audioStreamId<TAB>subtitleStreamId" line (0 = none) before
+        any change is made to it. The id of a stream type the run doesn't
+        change is left empty, so rolling back leaves it alone. A part
+        recorded more than once is restored from its first line, so no
+        per-part state is kept while recording.
+
+        Selections are recorded as seen by the account that reads the
+        streams, so runs that write for home users take no snapshot.
+
+        Attributes:
+            path (str): Path of the snapshot file.
+    """
+
+    def __init__(self, path, plexServer):
+        # Initialize variables
+        self.path = path
+        self._lock = threading.Lock()
+
+        # Create file, noting which server it belongs to
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._file = open(path, "a", encoding="utf8")
+        if self._file.tell() == 0:
+            self._file.write("# snapshot\t%s\t%s\n" % (
+                plexServer.machineIdentifier, plexServer.friendlyName))
+            self._file.flush()
+
+    def close(self):
+        """ Close the snapshot file."""
+        self._file.close()
+
+    def record(self, part, audio=True, subtitles=True):
+        """ Write the streams currently selected in a
+            :class:`~plexapi.media.MediaPart`. Only the stream types that
+            will be changed are recorded."""
+        audioId = subtitleId = ""
+        if audio:
+            audioId = 0
+            for stream in part.audioStreams():
+                if stream.selected:
+                    audioId = stream.id
+        if subtitles:
+            subtitleId = 0
+            for stream in part.subtitleStreams():
+                if stream.selected:
+                    subtitleId = stream.id
+        with self._lock:
+            self._file.write("%d\t%s\t%s\n" % (part.id, audioId, subtitleId))
+            self._file.flush()
+
+
+class StreamRule:
+    """ Declarative preferences for one kind of stream, compiled into a
+        decision table. Used in place of an :class:`AudioStreamInfo` or
+        :class:`SubtitleStreamInfo` template; see :func:`parseRules` for the
+        syntax.
+
+        Attributes:
+            excluded (frozenset): Conditions a chosen stream may not meet.
+            preferred (tuple): (condition, weight) pairs that break ties
+                between streams of the same row. Earlier preferences weigh
+                more than all later ones together.
+            rows (tuple): (languageCode, conditions) pairs, best first. A
+                stream is chosen by the first row whose language it has (None
+                for any language) and whose conditions it all meets.
+            text (str): The rule as written.
+    """
+
+    def __init__(self, text):
+        # Initialize variables
+        self.text = text.strip()
+        rows = None
+        required = set()
+        excluded = set()
+        preferred = []
+
+        for clause in self.text.split(","):
+            words = clause.split()
+            if not words:
+                continue
+            keyword = words[0].lower()
+            if keyword == "prefer":
+                preferred.extend(condition
+                                 for condition in self._conditions(words[1:])
+                                 if condition not in preferred)
+            elif keyword in ("not", "no"):
+                excluded.update(self._conditions(words[1:]))
+            elif rows is None:
+                # First plain clause ranks languages, e.g. "eng full > eng"
+                rows = []
+                for alternative in clause.split(">"):
+                    words = alternative.split()
+                    if not words:
+                        raise ValueError("Empty choice in '%s'." % clause)
+                    language = words[0].lower()
+                    if language in ("any", "*"):
+                        language = None
+                    elif not re.fullmatch(r"[a-z]{2,3}", language):
+                        raise ValueError("'%s' is not a language code."
+                                         % words[0])
+                    rows.append((language,
+                                 frozenset(self._conditions(words[1:]))))
+            else:
+                # Later plain clauses apply to every language
+                required.update(self._conditions(words))
+        if rows is None:
+            raise ValueError("Rule '%s' has no languages." % self.text)
+
+        self.excluded = frozenset(excluded)
+        self.preferred = tuple(
+            (condition, 2 ** (len(preferred) - i - 1))
+            for i, condition in enumerate(preferred))
+        self.rows = tuple((language, conditions | required)
+                          for language, conditions in rows)
+
+    @staticmethod
+    def _conditions(words):
+        """ Return the (field, value) conditions named by words, in the order
+            they are written. Preferences are weighed by that order."""
+        conditions = []
+        for word in words:
+            word = word.lower()
+            if word == "forced":
+                conditions.append(("forced", True))
+            elif word in ("internal", "embedded"):
+                conditions.append(("location", "Internal"))
+            elif word == "external":
+                conditions.append(("location", "External"))
+            elif word in ("stereo", "mono", "2.0", "1.0") or re.fullmatch(
+                    r"\d\.\d", word):
+                conditions.append(("layout", {"2.0": "stereo",
+                                              "1.0": "mono"}.get(word, word)))
+            elif word in RULE_CODECS:
+                conditions.append(("codec", word))
+            else:
+                conditions.extend(("title", token)
+                                  for token in normalizeTitle(word).split())
+        return conditions
+
+    @staticmethod
+    def _facts(stream):
+        """ Return the set of (field, value) conditions a stream meets."""
+        facts = {("codec", stream.codec),
+                 ("location",
+                  "Internal" if (stream.index or 0) >= 0 else "External")}
+        layout = getattr(stream, "audioChannelLayout", None)
+        if layout:
+            facts.add(("layout", layout.split("(")[0]))
+        if getattr(stream, "forced", False):
+            facts.add(("forced", True))
+        facts.update(("title", token)
+                     for token in normalizeTitle(stream.title).split())
+        return facts
+
+    def match(self, streams):
+        """ Return the stream the rule chooses from streams, or None. Every
+            stream is looked at once."""
+        chosen = None
+        chosenRank = None
+        for position, stream in enumerate(streams):
+            facts = self._facts(stream)
+            if self.excluded & facts:
+                continue
+            for row, (language, conditions) in enumerate(self.rows):
+                if language in (None, stream.languageCode) \
+                        and conditions <= facts:
+                    break
+            else:
+                continue
+            score = sum(weight for condition, weight in self.preferred
+                        if condition in facts)
+            rank = (row, -score, position)
+            if chosenRank is None or rank < chosenRank:
+                chosen = stream
+                chosenRank = rank
+        return chosen
+
+    def matchKey(self):
+        """ Return a hashable tuple of the compiled rule, for
+            :class:`MatchCache`."""
+        return ("rule", self.rows, self.excluded, self.preferred)
+
+
 class SubtitleStreamInfo:
     """ Container class to hold info about a SubtitleStream
 
@@ -133,6 +1693,7 @@ class SubtitleStreamInfo:
             languageCode (str): Ascii code for language (ex: eng, tha).
             location (str): "Internal" if subtitle is embedded in the video,
                 "External" if it is not.
+            normalizedTitle (str): Title after :func:`normalizeTitle`.
             subtitleStreamsIndex (int): Index of this
                 :class:`~plexapi.media.SubtitleStream` in
                 MediaPart.subtitleStreams().
@@ -146,15 +1707,840 @@ class SubtitleStreamInfo:
         self.forced = subtitleStream.forced
         self.languageCode = subtitleStream.languageCode
         self.location = "Internal" if subtitleStream.index >= 0 else "External"
+        self.normalizedTitle = normalizeTitle(subtitleStream.title)
         self.subtitleStreamsIndex = subtitleStreamsIndex
         self.title = subtitleStream.title
 
+    def matchKey(self):
+        """ Return a hashable tuple of every field :func:`matchSubtitles`
+            reads from this template."""
+        return (self.title, self.languageCode, self.codec, self.forced,
+                self.location, self.subtitleStreamsIndex)
+
+
+class SwitcherDaemon:
+    """ State shared by every request to the daemon: one signed-in server,
+        warm caches of shows, stream metadata and match results, and the
+        worker pool jobs run on.
+
+        Attributes:
+            episodeCache (:class:`EpisodeCache`): Reloaded episodes.
+            executor (:class:`~concurrent.futures.ThreadPoolExecutor`): Pool
+                that jobs run on.
+            matchCache (:class:`MatchCache`): Match results.
+            plexServer (:class:`~plexapi.server.PlexServer`): The server
+                signed into.
+            servers (list<:class:`~plexapi.server.PlexServer`>): Servers to
+                write through, one per user (default = plexServer).
+            templates (:class:`TemplateStore`): Tracks last chosen for each
+                show, applied to new episodes.
+            webhooks (:class:`WebhookQueue`): New episodes waiting to be
+                applied.
+            workers (int): Number of episodes each job fetches and writes at
+                once.
+    """
+
+    def __init__(self, plexServer, servers=None, workers=1):
+        # Initialize variables
+        self.episodeCache = EpisodeCache()
+        self.executor = ThreadPoolExecutor(max_workers=POOL_SIZE)
+        self.matchCache = MatchCache()
+        self.plexServer = plexServer
+        self.servers = servers
+        self.templates = TemplateStore()
+        self.webhooks = WebhookQueue(self.submitNew)
+        self.workers = workers
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._nextId = 1
+        self._nullStream = open(os.devnull, "w")
+        self._shows = {}
+
+        # Warm up the show cache
+        for library in plexServer.library.sections():
+            if library.type == "show":
+                self.loadLibrary(library)
+
+    def _prepare(self, request):
+        """ Return (show, seasons, audioTemplate, subtitleTemplate,
+            resetSubtitles) for a job or preview request."""
+        show = self.findShow(request.get("library"), request.get("show"))
+        try:
+            seasons = [int(s) for s in request.get("seasons") or
+                       [s.index for s in show.seasons()]]
+            sample = request.get("sample")
+            if sample:
+                episode = show.episode(season=int(sample[0]),
+                                       episode=int(sample[1]))
+            else:
+                episode = next(iterEpisodes(show, seasons[:1], 1))
+        except (TypeError, IndexError, StopIteration, NotFound):
+            raise ValueError("Sample episode is not in '%s'." % show.title)
+
+        # Build templates from the sample episode's tracks
+        episodePart = self.episodeCache.reload(episode).media[0].parts[0]
+        streams = OrganizedStreams(episodePart)
+        audioIndex = request.get("audio")
+        subIndex = request.get("subtitles")
+        if audioIndex is not None and not (
+                isinstance(audioIndex, int)
+                and streams.indexIsAudioStream(audioIndex)):
+            raise ValueError("%r is not an audio track of %s." % (
+                audioIndex, episodeToString(episode)))
+        if subIndex is not None and not (
+                isinstance(subIndex, int)
+                and (subIndex < 0 or streams.indexIsSubStream(subIndex))):
+            raise ValueError("%r is not a subtitle track of %s." % (
+                subIndex, episodeToString(episode)))
+        audioTemplate, subtitleTemplate = createTemplates(
+            episodePart, audioIndex, subIndex)
+        resetSubtitles = subIndex is not None and subIndex < 0
+        if audioTemplate is None and subtitleTemplate is None \
+                and not resetSubtitles:
+            raise ValueError("Give an 'audio' or 'subtitles' track to set.")
+        return show, seasons, audioTemplate, subtitleTemplate, resetSubtitles
+
+    def _queue(self, show, seasons, total, templates, episodes=None):
+        """ Create a job applying templates, queue it on the worker pool and
+            return it."""
+        # Snapshots only hold the owner's tracks, which home users' jobs
+        # don't change
+        snapshot = None
+        if not self.servers:
+            snapshot = StreamSnapshot(snapshotPath(self.plexServer, show),
+                                      self.plexServer)
+        with self._lock:
+            job = DaemonJob(
+                self._nextId, show, seasons,
+                BatchProgress(total, self._nullStream), snapshot)
+            self._nextId += 1
+            self._jobs[job.id] = job
+            while len(self._jobs) > DAEMON_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        self.executor.submit(self._run, job, *templates, episodes=episodes)
+        return job
+
+    def _run(self, job, audioTemplate, subtitleTemplate, resetSubtitles,
+             episodes=None):
+        """ Apply templates for a queued job, with its own output so problems
+            are summarized and forgotten once the job ends."""
+        job.state = "running"
+        jobOutput = RunOutput(output.quiet, output.logPath, output.slowCall)
+        try:
+            job.result = applyTemplates(
+                job.show, job.seasons, audioTemplate, subtitleTemplate,
+                resetSubtitles, matchCache=self.matchCache,
+                servers=self.servers, snapshot=job.snapshot,
+                progress=job.progress, workers=self.workers,
+                episodeCache=self.episodeCache, episodes=episodes,
+                runOutput=jobOutput)
+        except Exception as error:
+            job.error = str(error)
+            job.state = "failed"
+        else:
+            job.state = "done"
+        finally:
+            if job.snapshot is not None:
+                job.snapshot.close()
+            job.finished = time.time()
+            jobOutput.summary()
+            jobOutput.close()
+
+    def close(self):
+        """ Apply pending new episodes and wait for running jobs to finish."""
+        self.webhooks.close()
+        self.executor.shutdown(wait=True)
+        self._nullStream.close()
+
+    def findShow(self, libraryTitle, showTitle):
+        """ Return the cached :class:`~plexapi.video.Show` with the given
+            title, listing the library again if it is not cached yet."""
+        with self._lock:
+            shows = self._shows.get(libraryTitle)
+        if shows is None:
+            raise ValueError("No TV library named %r." % libraryTitle)
+        if showTitle not in shows:
+            self.loadLibrary(self.plexServer.library.section(libraryTitle))
+            with self._lock:
+                shows = self._shows[libraryTitle]
+        if showTitle not in shows:
+            raise ValueError("No show named %r in '%s'." % (
+                showTitle, libraryTitle))
+        return shows[showTitle]
+
+    def job(self, jobId):
+        """ Return the state of a job as a dict, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(jobId)
+        return job.toDict() if job is not None else None
+
+    def jobs(self):
+        """ Return the state of every recent job."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.toDict() for job in jobs]
+
+    def libraries(self):
+        """ Return {library title: [show titles]} for every TV library."""
+        with self._lock:
+            return {library: sorted(shows)
+                    for library, shows in self._shows.items()}
+
+    def loadLibrary(self, library):
+        """ Cache every show in a TV library."""
+        shows = {show.title: show for show in library.all()}
+        with self._lock:
+            self._shows[library.title] = shows
+
+    def preview(self, request):
+        """ Return the streams a job request would set for each part, without
+            setting them."""
+        show, seasons, audioTemplate, subtitleTemplate, resetSubtitles = \
+            self._prepare(request)
+        audioMatcher = None
+        subtitleMatcher = None
+        if audioTemplate is not None:
+            audioMatcher = partial(self.matchCache.matchAudio,
+                                   template=audioTemplate)
+        if subtitleTemplate is not None:
+            subtitleMatcher = partial(self.matchCache.matchSubtitles,
+                                      template=subtitleTemplate)
+
+        parts = iterParts(iterEpisodes(show, seasons), workers=self.workers,
+                          episodeCache=self.episodeCache)
+        preview = []
+        for match in matchParts(parts, audioMatcher, subtitleMatcher,
+                                resetSubtitles):
+            entry = {"episode": episodeToString(match.episode),
+                     "part": match.part.id}
+            if audioTemplate is not None:
+                entry["audio"] = None
+                if match.audioStream:
+                    entry["audio"] = {
+                        "id": match.audioStream.id,
+                        "title": match.audioStream.title,
+                        "language": match.audioStream.languageCode}
+            if resetSubtitles:
+                entry["subtitles"] = "disabled"
+            elif subtitleTemplate is not None:
+                entry["subtitles"] = None
+                if match.subtitleStream:
+                    entry["subtitles"] = {
+                        "id": match.subtitleStream.id,
+                        "title": match.subtitleStream.title,
+                        "language": match.subtitleStream.languageCode}
+            preview.append(entry)
+        return preview
+
+    def submit(self, request):
+        """ Queue a job request on the worker pool and return its state. The
+            tracks are also stored for episodes added to the show later."""
+        show, seasons, audioTemplate, subtitleTemplate, resetSubtitles = \
+            self._prepare(request)
+        templates = (audioTemplate, subtitleTemplate, resetSubtitles)
+        self.templates.save(show, *templates)
+        total = sum(s.leafCount for s in show.seasons() if s.index in seasons)
+        return self._queue(show, seasons, total, templates).toDict()
+
+    def submitNew(self, showKey, ratingKeys):
+        """ Queue a job applying a show's stored tracks to newly added
+            episodes, seasons or shows, all fetched in one request."""
+        templates = self.templates.get(self.plexServer, showKey)
+        if templates is None:
+            output.problem("No tracks stored for show %s. New episodes were "
+                           "left unchanged." % showKey)
+            return None
+        try:
+            items = self.plexServer.fetchItems(
+                "/library/metadata/%s" % ",".join(map(str, ratingKeys)))
+            episodes = []
+            for item in items:
+                if item.type == "episode":
+                    # Fetched by id, so streams are already loaded
+                    self.episodeCache.add(item)
+                    episodes.append(item)
+                else:
+                    episodes.extend(item.episodes())
+            show = self.plexServer.fetchItem(int(showKey))
+        except (requests.RequestException, BadRequest, NotFound) as error:
+            output.problem("Failed to fetch new episodes of show %s: %s" % (
+                showKey, error))
+            return None
+        seasons = sorted({episode.seasonNumber for episode in episodes})
+        return self._queue(show, seasons, len(episodes), templates, episodes)
+
+    def webhook(self, payload):
+        """ Queue the item added in a `library.new` webhook payload. Returns
+            True if it was queued."""
+        metadata = payload.get("Metadata") or {}
+        server = payload.get("Server") or {}
+        if payload.get("event") != "library.new" or server.get("uuid") not in (
+                None, self.plexServer.machineIdentifier):
+            return False
+        showKey = {
+            "episode": metadata.get("grandparentRatingKey"),
+            "season": metadata.get("parentRatingKey"),
+            "show": metadata.get("ratingKey"),
+        }.get(metadata.get("type"))
+        if showKey is None or metadata.get("ratingKey") is None:
+            return False
+        self.webhooks.add(str(showKey), str(metadata["ratingKey"]))
+        return True
+
+
+class TemplateStore:
+    """ The tracks chosen for each show, kept in a JSON file so they can be
+        applied again to episodes added later. Safe to share between threads.
+
+        Attributes:
+            path (str): Path of the JSON file.
+    """
+
+    def __init__(self, path=TEMPLATE_FILE):
+        # Initialize variables
+        self.path = path
+        self._lock = threading.Lock()
+        self._templates = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as templateFile:
+                self._templates = json.load(templateFile)
+
+    @staticmethod
+    def _key(plexServer, showKey):
+        """ Return the key a show's templates are stored under."""
+        return "%s:%s" % (plexServer.machineIdentifier, showKey)
+
+    def get(self, plexServer, showKey):
+        """ Return (audioTemplate, subtitleTemplate, resetSubtitles) stored
+            for the show with the given ratingKey, or None."""
+        with self._lock:
+            entry = self._templates.get(self._key(plexServer, showKey))
+        if entry is None:
+            return None
+        audioTemplate = None
+        subtitleTemplate = None
+        audio = entry.get("audio")
+        subtitles = entry.get("subtitles")
+        if audio:
+            audioTemplate = AudioStreamInfo(SimpleNamespace(
+                title=audio["title"], languageCode=audio["languageCode"],
+                codec=audio["codec"],
+                audioChannelLayout=audio["audioChannelLayout"]),
+                audio["index"])
+        if subtitles and subtitles != "disabled":
+            subtitleTemplate = SubtitleStreamInfo(SimpleNamespace(
+                title=subtitles["title"],
+                languageCode=subtitles["languageCode"],
+                codec=subtitles["codec"], forced=subtitles["forced"],
+                index=0 if subtitles["location"] == "Internal" else -1),
+                subtitles["allStreamsIndex"], subtitles["index"])
+        return audioTemplate, subtitleTemplate, subtitles == "disabled"
+
+    def save(self, show, audioTemplate=None, subtitleTemplate=None,
+             resetSubtitles=False):
+        """ Store the templates chosen for a show, replacing any before."""
+        entry = {"show": show.title}
+        if audioTemplate is not None:
+            entry["audio"] = {
+                "title": audioTemplate.title,
+                "languageCode": audioTemplate.languageCode,
+                "codec": audioTemplate.codec,
+                "audioChannelLayout": audioTemplate.audioChannelLayout,
+                "index": audioTemplate.audioStreamsIndex}
+        if resetSubtitles:
+            entry["subtitles"] = "disabled"
+        elif subtitleTemplate is not None:
+            entry["subtitles"] = {
+                "title": subtitleTemplate.title,
+                "languageCode": subtitleTemplate.languageCode,
+                "codec": subtitleTemplate.codec,
+                "forced": subtitleTemplate.forced,
+                "location": subtitleTemplate.location,
+                "allStreamsIndex": subtitleTemplate.allStreamsIndex,
+                "index": subtitleTemplate.subtitleStreamsIndex}
+        with self._lock:
+            self._templates[self._key(show._server, show.ratingKey)] = entry
+
+            # Write a new file and swap it in, so a crash never leaves a
+            # half-written one behind
+            with open(self.path + ".tmp", "w", encoding="utf8") as newFile:
+                json.dump(self._templates, newFile, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+
+class WebhookQueue:
+    """ Collects items from `library.new` webhooks and hands them over per
+        show once no new item arrived for that show for a few seconds, so a
+        whole season landing at once is applied as one batch. Safe to share
+        between threads.
+
+        Attributes:
+            callback (callable): Called as callback(showKey, ratingKeys) for
+                each batch.
+            delay (float): Seconds to wait for more items of a show.
+    """
+
+    def __init__(self, callback, delay=WEBHOOK_DELAY):
+        # Initialize variables
+        self.callback = callback
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timers = {}
+
+    def _flush(self, showKey):
+        """ Hand over the items collected for a show."""
+        with self._lock:
+            ratingKeys = self._pending.pop(showKey, None)
+            self._timers.pop(showKey, None)
+        if ratingKeys:
+            self.callback(showKey, sorted(ratingKeys))
+
+    def add(self, showKey, ratingKey):
+        """ Queue an item of a show, restarting the show's wait."""
+        with self._lock:
+            self._pending.setdefault(showKey, set()).add(ratingKey)
+            if showKey in self._timers:
+                self._timers[showKey].cancel()
+            timer = threading.Timer(self.delay, self._flush, [showKey])
+            timer.daemon = True
+            self._timers[showKey] = timer
+            timer.start()
+
+    def close(self):
+        """ Hand over every pending batch without waiting."""
+        with self._lock:
+            showKeys = list(self._timers)
+            for timer in self._timers.values():
+                timer.cancel()
+        for showKey in showKeys:
+            self._flush(showKey)
+
+
+# Writer for per-part output. Replaced when the script is run from the
+# command line with the options chosen there.
+output = RunOutput()
+
+# Cassette every new session records to or replays from, set by --record and
+# --replay. None to talk to Plex normally.
+cassette = None
+
+# Profiler the phases of a run are marked on, set by --profile.
+profiler = None
+
+# time.monotonic() after which no more requests are sent, set by --deadline.
+# None for no deadline.
+deadline = None
+
 
 ###############################################################################
 # Functions
 ###############################################################################
 
 
+def applyTemplates(show, seasons, audioTemplate=None, subtitleTemplate=None,
+                   resetSubtitles=False, skipPartId=None, matchCache=None,
+                   servers=None, snapshot=None, progress=None, workers=1,
+                   episodeCache=None, episodes=None, watchOrder=False,
+                   verify=False, runOutput=None):
+    """ Sets the closest matching audio and subtitle streams for every
+        MediaPart in the given seasons of a show, and returns an
+        :class:`ApplyResult`.
+
+        Work is streamed through :func:`iterEpisodes`, :func:`iterParts`,
+        :func:`matchParts`, :func:`writeParts` and :func:`verifyParts`, so
+        only one window of episodes is held in memory at a time.
+
+        Parameters:
+            show(:class:`~plexapi.video.Show`): The show to modify.
+            seasons(list<int>): Season numbers to modify.
+            audioTemplate(AudioStreamInfo): Template to match audio against,
+                or None to leave audio untouched.
+            subtitleTemplate(SubtitleStreamInfo): Template to match subtitles
+                against, or None to leave subtitles untouched.
+            resetSubtitles(bool): Disable subtitles instead of matching them.
+            skipPartId(int): Id of a MediaPart that should not be modified
+                (optional).
+            matchCache(:class:`MatchCache`): Cache to share match results
+                through, e.g. across every show in a session (optional).
+            servers(list<:class:`~plexapi.server.PlexServer`>): Servers to
+                write the matches through, one per user (default = the
+                server the show was fetched from).
+            snapshot(:class:`StreamSnapshot`): Snapshot to record each part's
+                current streams to before it is modified (optional).
+            progress(:class:`BatchProgress`): Progress display to update
+                (optional).
+            workers(int): Number of episodes fetched and written at once
+                (default = 1).
+            episodeCache(:class:`EpisodeCache`): Cache of reloaded episodes
+                to reuse (optional).
+            episodes(iterable<:class:`~plexapi.video.Episode`>): Episodes to
+                modify instead of every episode of the seasons (optional).
+            watchOrder(bool): Modify the episodes about to be watched first,
+                see :func:`iterEpisodesByPriority` (default = index order).
+            verify(bool): Read back the streams of written parts and write
+                them again if they were not applied, see :func:`verifyParts`
+                (default = False).
+            runOutput(:class:`RunOutput`): Writer for per-part output, e.g.
+                ``RunOutput(quiet=True)`` when imported (default = the
+                script's output).
+    """
+    audioMatcher = None
+    subtitleMatcher = None
+    if audioTemplate is not None:
+        audioMatcher = partial(
+            matchCache.matchAudio if matchCache else matchAudio,
+            template=audioTemplate)
+    if subtitleTemplate is not None:
+        subtitleMatcher = partial(
+            matchCache.matchSubtitles if matchCache else matchSubtitles,
+            template=subtitleTemplate)
+
+    result = ApplyResult()
+    if episodes is None and watchOrder:
+        episodes = iterEpisodesByPriority(show, seasons)
+    elif episodes is None:
+        episodes = iterEpisodes(show, seasons)
+    parts = iterParts(episodes, skipPartId, progress, workers, episodeCache,
+                      runOutput)
+    matches = matchParts(parts, audioMatcher, subtitleMatcher, resetSubtitles)
+    written = writeParts(matches, audioMatcher is not None,
+                         subtitleMatcher is not None, servers, snapshot,
+                         progress, workers, runOutput)
+    if verify:
+        written = verifyParts(written, servers, runOutput=runOutput)
+    for match in written:
+        result.record(match, audioMatcher is not None,
+                      subtitleMatcher is not None)
+    return result
+
+
+def auditLibraries(plexServer, path, libraryNames=None, rules=None,
+                   workers=1, windowSize=EPISODE_WINDOW, processes=0):
+    """ Writes one row per MediaPart of the given TV libraries to path, with
+        its show, season, episode, every audio and subtitle track and the
+        selected ones. Nothing is modified. Episodes are listed a page at a
+        time and the streams of each page are fetched with one bulk request,
+        several pages at once, and parsed as they download. Rows are written
+        as pages arrive, so memory use does not grow with the size of the
+        libraries. Returns the number of parts written.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server to
+                audit.
+            path(str): File to write. CSV if it ends in ".csv", otherwise
+                JSON Lines.
+            libraryNames(list<str>): Titles of the libraries to audit
+                (default = every TV library).
+            rules(tuple): (audioRule, subtitleRule, resetSubtitles) from
+                :func:`parseRules`. Parts whose selected tracks are not the
+                ones the rules choose are flagged (optional).
+            workers(int): Number of pages fetched at once (default = 1).
+            windowSize(int): Number of episodes per page.
+            processes(int): Number of processes that parse downloaded pages,
+                for when parsing rather than the server limits the audit
+                (default = 0, pages are parsed by the fetching threads).
+    """
+    matchCache = MatchCache()
+    writeCsv = path.lower().endswith(".csv")
+
+    libraries = selectTvLibraries(plexServer, libraryNames)
+
+    # List the episodes of a library, one page of ratingKeys at a time
+    def iterPages(library):
+        key = "/library/sections/%s/all?type=4" % library.key
+        start = 0
+        while True:
+            data = plexServer.query(key, params={
+                "X-Plex-Container-Start": start,
+                "X-Plex-Container-Size": windowSize})
+            if start == 0:
+                progress.total += int(data.attrib.get("totalSize") or 0)
+            ratingKeys = [elem.attrib["ratingKey"] for elem in data
+                          if elem.tag == "Video"]
+            if ratingKeys:
+                yield library, ratingKeys
+
+            # A short page is the last one
+            if len(ratingKeys) != windowSize:
+                break
+            start += windowSize
+
+    # Fetch the streams of a page of episodes and return its rows
+    def fetchRows(page):
+        library, ratingKeys = page
+        chunks = queryChunks(plexServer, "/library/metadata/%s%s" % (
+            ",".join(ratingKeys), STREAMS_QUERY))
+        started = time.monotonic()
+        if parser is None:
+            rows = auditRows(chunks, library.title, rules, writeCsv,
+                             matchCache)
+            progress.recordRequest(time.monotonic() - started)
+            return rows
+        content = b"".join(chunks)
+        progress.recordRequest(time.monotonic() - started)
+        return parser.submit(auditRows, [content], library.title, rules,
+                             writeCsv).result()
+
+    # Write rows as pages arrive
+    count = 0
+    progress = BatchProgress(0)
+    pages = (page for library in libraries for page in iterPages(library))
+    parser = ProcessPoolExecutor(max_workers=processes) if processes else None
+    with open(path, "w", newline="", encoding="utf8") as auditFile, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        writer = None
+        if writeCsv:
+            writer = csv.DictWriter(auditFile, AUDIT_FIELDS)
+            writer.writeheader()
+        try:
+            for rows in mapBounded(fetchRows, pages, executor, workers * 2):
+                for row in rows:
+                    if writer is not None:
+                        row["audio"] = "; ".join(row["audio"])
+                        row["subtitles"] = "; ".join(row["subtitles"])
+                        row["flags"] = ", ".join(row["flags"])
+                        writer.writerow(row)
+                    else:
+                        auditFile.write(json.dumps(row) + "\n")
+                count += len(rows)
+                progress.advance(len({row["ratingKey"] for row in rows}))
+        except requests.RequestException:
+            # Responses cut off at the deadline fail as a timeout or, when
+            # already streaming, as a lost connection
+            if not deadlinePassed():
+                raise
+            print("Run deadline passed. The audit file is incomplete.")
+        finally:
+            if parser is not None:
+                parser.shutdown(cancel_futures=True)
+    progress.finish()
+    return count
+
+
+def auditRows(chunks, libraryTitle, rules=None, writeCsv=False,
+              matchCache=None):
+    """ Returns the audit rows of the MediaParts in a bulk metadata
+        response, see :func:`auditLibraries`. Runs in a parsing process when
+        auditLibraries is given processes, so it only takes picklable
+        arguments besides matchCache.
+
+        Parameters:
+            chunks(iterable<bytes>): The response body, in pieces.
+            libraryTitle(str): Title of the library the episodes are in.
+            rules(tuple): (audioRule, subtitleRule, resetSubtitles) from
+                :func:`parseRules` to flag parts with (optional).
+            writeCsv(bool): Describe streams as text for CSV instead of as
+                dicts.
+            matchCache(MatchCache): Cache shared between calls
+                (default = a new cache).
+    """
+    audioRule, subtitleRule, resetSubtitles = rules or (None, None, False)
+    matchCache = matchCache or MatchCache()
+
+    # Describe a stream, as a dict or as text for CSV
+    def describe(stream):
+        fields = OrderedDict([
+            ("id", stream.id), ("language", stream.languageCode),
+            ("codec", stream.codec)])
+        if stream.streamType == AudioStream.STREAMTYPE:
+            fields["channels"] = stream.audioChannelLayout
+        else:
+            fields["forced"] = bool(stream.forced)
+            fields["external"] = (stream.index or 0) < 0
+        fields["title"] = stream.title
+        if not writeCsv:
+            return fields
+        words = [fields["language"], fields["codec"], fields.get("channels"),
+                 "forced" if fields.get("forced") else None,
+                 "external" if fields.get("external") else None,
+                 '"%s"' % fields["title"] if fields["title"] else None]
+        return " ".join(str(word) for word in words if word)
+
+    # Flag tracks the rules would change
+    def flag(part):
+        flags = []
+        if audioRule is not None:
+            chosen = matchCache.matchAudio(part, audioRule)
+            if chosen is None:
+                flags.append("no audio match")
+            elif not chosen.selected:
+                flags.append("audio")
+        if resetSubtitles:
+            if any(stream.selected for stream in part.subtitleStreams()):
+                flags.append("subtitles")
+        elif subtitleRule is not None:
+            chosen = matchCache.matchSubtitles(part, subtitleRule)
+            if chosen is None:
+                flags.append("no subtitle match")
+            elif not chosen.selected:
+                flags.append("subtitles")
+        return flags
+
+    rows = []
+    for part in parsePartRecords(chunks):
+        episode = part.episode
+        audio = part.audioStreams()
+        subtitles = part.subtitleStreams()
+        selectedAudio = [describe(s) for s in audio if s.selected]
+        selectedSubtitles = [describe(s) for s in subtitles if s.selected]
+        rows.append(OrderedDict([
+            ("library", libraryTitle),
+            ("show", episode.get("grandparentTitle")),
+            ("season", int(episode.get("parentIndex", 0))),
+            ("episode", int(episode.get("index", 0))),
+            ("title", episode.get("title")),
+            ("ratingKey", int(episode["ratingKey"])),
+            ("part", part.id),
+            ("file", part.file),
+            ("audio", [describe(s) for s in audio]),
+            ("subtitles", [describe(s) for s in subtitles]),
+            ("selectedAudio", selectedAudio[0] if selectedAudio else None),
+            ("selectedSubtitles", selectedSubtitles[0]
+             if selectedSubtitles else None),
+            ("flags", flag(part))]))
+    return rows
+
+
+def connectResource(resource, settings=None, store=None):
+    """ Returns a :class:`~plexapi.server.PlexServer` for a server linked to
+        a MyPlex account. Every connection the server offers (local, remote
+        and relay) is tried at once and the first to answer is used, so
+        signing in takes about one round trip instead of waiting on the
+        timeouts of unreachable ones. The connection that answered is
+        remembered and gets a head start on the next sign-in; if it stops
+        answering, the others are used instead.
+
+        Parameters:
+            resource(:class:`~plexapi.myplex.MyPlexResource`): The server to
+                connect to.
+            settings(:class:`configparser.SectionProxy`): Config section for
+                the server's session, see :func:`createSession` (optional).
+            store(:class:`ConnectionStore`): Where the connection that
+                answered is remembered (default = CONNECTION_FILE).
+    """
+    if store is None:
+        store = ConnectionStore()
+
+    # Candidate URIs, local and HTTPS first. Local connections are only
+    # tried for servers the account owns, as plexapi does.
+    connections = sorted(resource.connections, key=lambda c: c.local,
+                         reverse=True)
+    connections = [c for c in connections if resource.owned or not c.local]
+    uris = list(OrderedDict.fromkeys(
+        [c.uri for c in connections] + [c.httpuri for c in connections]))
+    remembered = store.get(resource.clientIdentifier)
+    if remembered in uris:
+        uris.remove(remembered)
+        uris.insert(0, remembered)
+
+    # Try a candidate, through its own session
+    def probe(uri):
+        return PlexServer(uri, resource.accessToken,
+                          session=createSession(settings),
+                          timeout=CONNECT_TIMEOUT)
+
+    # Race the candidates, the remembered one with a head start
+    executor = ThreadPoolExecutor(max_workers=len(uris) or 1)
+    futures = []
+    try:
+        for uri in uris:
+            futures.append(executor.submit(probe, uri))
+            if uri == remembered:
+                wait(futures, timeout=CONNECT_HEAD_START)
+                if futures[0].done() and futures[0].exception() is None:
+                    break
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=futures.index):
+                if future.exception() is None:
+                    plexServer = future.result()
+                    store.save(resource.clientIdentifier,
+                               uris[futures.index(future)])
+                    return plexServer
+    finally:
+        # Abandon the rest
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+    raise NotFound("Unable to connect to server '%s'." % resource.name)
+
+
+def createSession(settings=None):
+    """ Returns a :class:`requests.Session` for talking to one Plex server,
+        with its own connection pool, rate limit, timeouts, hedged GETs and
+        response cache. Traffic goes through the active :data:`cassette`, if
+        any.
+
+        Parameters:
+            settings(:class:`configparser.SectionProxy`): Config section to
+                read POOL_SIZE, RATE_LIMIT (requests per second), CACHE_TTL
+                (seconds, 0 to disable), CACHE_SIZE, TIMEOUT (seconds) and
+                HEDGE (yes/no) from (optional).
+    """
+    poolSize = POOL_SIZE
+    rateLimit = 0
+    cacheTtl = CACHE_TTL
+    cacheSize = CACHE_SIZE
+    timeout = REQUEST_TIMEOUT
+    hedge = True
+    if settings is not None:
+        poolSize = int(settings.get("POOL_SIZE") or poolSize)
+        rateLimit = float(settings.get("RATE_LIMIT") or rateLimit)
+        cacheTtl = float(settings.get("CACHE_TTL") or cacheTtl)
+        cacheSize = int(settings.get("CACHE_SIZE") or cacheSize)
+        timeout = float(settings.get("TIMEOUT") or timeout)
+        hedge = (settings.get("HEDGE") or "yes").strip().lower() in (
+            "yes", "y", "true", "1")
+
+    requests.packages.urllib3.disable_warnings()
+    session = requests.Session()
+    session.verify = False
+    adapter = RateLimitAdapter(rateLimit, pool_connections=poolSize,
+                               pool_maxsize=poolSize)
+    adapter = HedgingAdapter(adapter, timeout, hedge, poolSize)
+    if cassette is not None:
+        adapter = CassetteAdapter(cassette, adapter)
+    if cacheTtl > 0:
+        adapter = CachingAdapter(adapter, cacheTtl, cacheSize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def createTemplates(episodePart, audioIndex=None, subIndex=None):
+    """ Returns (audioTemplate, subtitleTemplate) for the chosen streams of a
+        MediaPart. Either template is None if its index is None or negative.
+
+        Parameters:
+            episodePart(:class:`~plexapi.media.MediaPart`): MediaPart the
+                streams were chosen from.
+            audioIndex(int): 1-index of the chosen AudioStream among all
+                streams, as returned by :func:`selectAudio`.
+            subIndex(int): 1-index of the chosen SubtitleStream among all
+                streams, as returned by :func:`selectSubtitles`.
+    """
+    episodeStreams = OrganizedStreams(episodePart)
+    audioTemplate = None
+    subtitleTemplate = None
+    if audioIndex is not None and audioIndex > 0:
+        audioTemplate = AudioStreamInfo(
+            episodeStreams.getStreamFromIndex(audioIndex), audioIndex)
+    if subIndex is not None and subIndex > 0:
+        subtitleTemplate = SubtitleStreamInfo(
+            episodeStreams.getStreamFromIndex(subIndex), subIndex,
+            subIndex - len(episodeStreams.audioStreams))
+    return audioTemplate, subtitleTemplate
+
+
+def deadlinePassed():
+    """ Returns True if the run :data:`deadline` set by --deadline has
+        passed.
+    """
+    return deadline is not None and time.monotonic() >= deadline
+
+
 def disableAutoComplete():
     """ Disables tab-autocomplete functionality in user input."""
     readline.set_completer(None)
@@ -164,22 +2550,29 @@ def enableAutoComplete(matchList):
     """ Enables tab-autocomplete functionality in user input.
 
         Parameters:
-            matchList(list<str>): List of strings that can be matched to.
+            matchList(list<str>): List of strings that can be matched to, or
+                a function returning the strings that match given text.
     """
     readline.parse_and_bind("tab: complete")
     readline.set_completer_delims("")
+    found = {"text": None, "matches": []}
 
     def complete(text, state):
         """ Credit Chris Siebenmann: https://bit.ly/2E0pNDB"""
-        # generate candidate completion list
-        if text == "":
-            matches = matchList
-        else:
-            matches = [x for x in matchList if
-                       x.lower().startswith(text.lower())]
+        # generate candidate completion list, once per press of tab
+        if state == 0 or text != found["text"]:
+            if callable(matchList):
+                found["matches"] = matchList(text)
+            elif text == "":
+                found["matches"] = matchList
+            else:
+                found["matches"] = [x for x in matchList if
+                                    x.lower().startswith(text.lower())]
+            found["text"] = text
+        matches = found["matches"]
 
         # return current completion match
-        if state > len(matches):
+        if state >= len(matches):
             return None
         else:
             return matches[state]
@@ -198,6 +2591,67 @@ def episodeToString(episode):
     return "%s - %s" % (episode.seasonEpisode.upper(), episode.title)
 
 
+def fetchStreams(episode):
+    """ Loads the media, parts and streams of an episode and returns it.
+        Unlike episode.reload(), the server is asked for only what matching
+        needs (see STREAMS_QUERY), and only the Media elements of the
+        response are turned into objects.
+
+        Parameters:
+            episode(:class:`~plexapi.video.Episode`): The episode to load
+                streams for.
+    """
+    data = episode._server.query(episode.key + STREAMS_QUERY)
+    for video in data:
+        episode.media = [Media(episode._server, elem, episode.key)
+                         for elem in video.iter("Media")]
+        break
+    return episode
+
+
+def findMirroredShow(plexServer, show):
+    """ Returns the :class:`~plexapi.video.Show` on another server that
+        mirrors the given show, preferring a GUID match over a title match,
+        or None if the server does not have it.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server to
+                look for the show on.
+            show(:class:`~plexapi.video.Show`): The show to look for.
+    """
+    titleMatch = None
+    for library in plexServer.library.sections():
+        if library.type != "show":
+            continue
+        for candidate in library.search(title=show.title, libtype="show"):
+            if show.guid and candidate.guid == show.guid:
+                return candidate
+            if titleMatch is None and \
+                    candidate.title.lower() == show.title.lower():
+                titleMatch = candidate
+    return titleMatch
+
+
+def findTitleMatch(titleIndex, template):
+    """ Returns the stream whose title and language code match the template's,
+        or None. Titles are compared after :func:`normalizeTitle`, preferring
+        a stream whose title is exactly equal.
+
+        Parameters:
+            titleIndex(dict): Title index from :class:`OrganizedStreams`.
+            template(AudioStreamInfo or SubtitleStreamInfo): Template whose
+                title will be looked up.
+    """
+    streams = titleIndex.get(
+        (template.normalizedTitle, template.languageCode))
+    if not streams:
+        return None
+    for stream in streams:
+        if stream.title == template.title:
+            return stream
+    return streams[0]
+
+
 def getNumFromUser(prompt):
     """ Prompts for an integer from the user, only returning when a valid
         integer was entered.
@@ -230,6 +2684,319 @@ def getYesOrNoFromUser(prompt):
             print("Error: Invalid input")
 
 
+def iterEpisodes(show, seasons, windowSize=EPISODE_WINDOW):
+    """ Yields every :class:`~plexapi.video.Episode` in the given seasons of a
+        show, requesting them from the server one page at a time.
+
+        Parameters:
+            show(:class:`~plexapi.video.Show`): The show to list episodes of.
+            seasons(list<int>): Season numbers to list.
+            windowSize(int): Number of episodes to request per page.
+    """
+    for seasonNum in seasons:
+        season = show.season(int(seasonNum))
+        key = "/library/metadata/%s/children" % season.ratingKey
+        start = 0
+        while True:
+            episodes = season.fetchItems(key, container_start=start,
+                                         container_size=windowSize)
+            for episode in episodes:
+                yield episode
+
+            # A short page is the last one. A long page means the server
+            # ignored paging and already sent the whole season.
+            if len(episodes) != windowSize:
+                break
+            start += windowSize
+
+
+def iterEpisodesByPriority(show, seasons, windowSize=EPISODE_WINDOW):
+    """ Yields every :class:`~plexapi.video.Episode` in the given seasons of a
+        show, those about to be watched first: on-deck episodes (the next
+        episode to watch, or the one in progress), then unwatched episodes,
+        then watched ones. On-deck episodes come from a single request; the
+        rest are listed page by page in two passes, so memory stays bounded.
+
+        Parameters:
+            show(:class:`~plexapi.video.Show`): The show to list episodes of.
+            seasons(list<int>): Season numbers to list.
+            windowSize(int): Number of episodes to request per page.
+    """
+    seasonNumbers = {int(seasonNum) for seasonNum in seasons}
+
+    # On deck for this show, from the library's on-deck list, which also
+    # holds other shows and, for /library/onDeck, movies
+    key = "/library/onDeck"
+    if show.librarySectionID:
+        key = "/library/sections/%s/onDeck" % show.librarySectionID
+    onDeck = set()
+    for episode in show.fetchItems(key):
+        if episode.type == "episode" \
+                and episode.grandparentRatingKey == show.ratingKey \
+                and episode.seasonNumber in seasonNumbers \
+                and episode.ratingKey not in onDeck:
+            onDeck.add(episode.ratingKey)
+            yield episode
+
+    # Then unwatched episodes, then the back catalog
+    for watched in (False, True):
+        for episode in iterEpisodes(show, seasons, windowSize):
+            if episode.ratingKey not in onDeck \
+                    and bool(episode.viewCount) == watched:
+                yield episode
+
+
+def iterParts(episodes, skipPartId=None, progress=None, workers=1,
+              episodeCache=None, runOutput=None):
+    """ Fetches the streams of each episode and yields (episode, part) for
+        every MediaPart of every version (Media) of it, in order.
+
+        Parameters:
+            episodes(iterable<:class:`~plexapi.video.Episode`>): Episodes to
+                get MediaParts from.
+            skipPartId(int): Id of a MediaPart that should not be yielded
+                (optional).
+            progress(:class:`BatchProgress`): Progress display to report
+                request latency to (optional).
+            workers(int): Number of episodes fetched at once (default = 1).
+            episodeCache(:class:`EpisodeCache`): Cache of reloaded episodes
+                to reuse (optional).
+            runOutput(:class:`RunOutput`): Writer for per-part output
+                (default = the script's output).
+    """
+    runOutput = runOutput or output
+
+    def reload(episode):
+        started = time.monotonic()
+        try:
+            if episodeCache is not None:
+                episode = episodeCache.reload(episode)
+            else:
+                fetchStreams(episode)
+        except (requests.RequestException, BadRequest, NotFound) as error:
+            return episode, error
+        finally:
+            seconds = time.monotonic() - started
+            if progress is not None:
+                progress.recordRequest(seconds)
+            runOutput.slow(seconds, "GET %s" % episode.key, episode)
+        return episode, None
+
+    stopped = False
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for episode, error in mapBounded(reload, episodes, executor,
+                                             workers * 2):
+
+                # Skip episodes that could not be fetched, and stop once
+                # the run deadline has passed
+                if error is not None and deadlinePassed():
+                    stopped = True
+                    break
+                if error is not None:
+                    runOutput.problem(
+                        "Failed to fetch tracks for '%s': %s" % (
+                            episodeToString(episode), error))
+                    continue
+
+                # Each MediaPart (file) of each version of the episode,
+                # all from the same fetch
+                for media in episode.media:
+                    for part in media.parts:
+
+                        # Skip re-adjusting file we already modified
+                        if part.id == skipPartId:
+                            continue
+                        yield episode, part
+        except requests.Timeout:
+            # Listing more episodes ran into the deadline
+            if not deadlinePassed():
+                raise
+            stopped = True
+    if stopped:
+        runOutput.problem("Run deadline passed. Episodes not reached yet "
+                          "were left unchanged.")
+
+
+def iterShowTitles(library, title=None, windowSize=SHOW_WINDOW):
+    """ Yields the titles of the shows in a library, in the server's order,
+        requesting one page at a time. Only titles are read from each page,
+        so memory use does not grow with the size of the library.
+
+        Parameters:
+            library(:class:`~plexapi.library.LibrarySection`): The library to
+                list.
+            title(str): Only list shows whose title contains this, searched
+                on the server (optional).
+            windowSize(int): Number of titles to request per page.
+    """
+    key = "/library/sections/%s/all?type=2" % library.key
+    if title:
+        key += "&title=%s" % quote(title, safe="")
+    start = 0
+    while True:
+        data = library._server.query(key, params={
+            "X-Plex-Container-Start": start,
+            "X-Plex-Container-Size": windowSize})
+        titles = [elem.attrib.get("title") for elem in data
+                  if elem.tag == "Directory"]
+        for showTitle in titles:
+            yield showTitle
+
+        # A short page is the last one
+        if len(titles) != windowSize:
+            break
+        start += windowSize
+
+
+def main(argv=None):
+    """ Runs the interactive script.
+
+        Parameters:
+            argv(list<str>): Command-line arguments (default = sys.argv).
+    """
+    global cassette, deadline, output, profiler
+
+    # Get command-line options
+    args = parseArguments(argv)
+    output = RunOutput(args.quiet, args.log, args.slow_call)
+    if args.deadline:
+        deadline = time.monotonic() + args.deadline
+    if args.profile:
+        profiler = RunProfiler(args.profile)
+        atexit.register(profiler.close)
+    if args.replay:
+        cassette = Cassette(args.replay, "replay", args.replay_speed)
+    elif args.record:
+        cassette = Cassette(args.record, "record")
+
+    # Snapshots only hold the tracks of the account that took them
+    if args.rollback and args.users is not None:
+        print("Error: --rollback can't be combined with --users. Snapshots "
+              "only hold the tracks of the account that took them.")
+        sys.exit(1)
+
+    # Daemon jobs and audits only read or write the signed-in server
+    if args.servers and (args.daemon is not None or args.audit):
+        print("Error: --servers can't be combined with --%s."
+              % ("daemon" if args.daemon is not None else "audit"))
+        sys.exit(1)
+
+    # Check preference rules before signing in
+    rules = None
+    if args.rules:
+        try:
+            rules = parseRules(args.rules)
+        except ValueError as error:
+            print("Error: Invalid rules. %s" % error)
+            sys.exit(1)
+
+    # Get Plex server instance
+    plex = signIn()
+
+    # Get a server instance for each user changes are applied for
+    targets = None
+    if args.users is not None:
+        targets = signInHomeUsers(plex, args.users)
+
+    # Get other servers changes are mirrored to
+    mirrorServers = []
+    if args.servers:
+        mirrorServers = signInServers(plex, args.servers)
+    if profiler is not None:
+        profiler.mark("sign-in")
+
+    # Restore a snapshot instead of choosing new streams
+    if args.rollback:
+        try:
+            count = rollbackSnapshot(plex, args.rollback, mirrorServers)
+        except (OSError, ValueError) as error:
+            print("Error: Could not restore snapshot. %s" % error)
+            sys.exit(1)
+        if profiler is not None:
+            profiler.mark("apply")
+        print("Restored %d parts from '%s'." % (count, args.rollback))
+        sys.exit(0)
+
+    # Take jobs over HTTP instead of prompting
+    if args.daemon is not None:
+        runDaemon(plex, args.daemon, targets, args.workers, args.bind)
+        output.close()
+        return
+
+    # Write every library's tracks to a file instead of changing them
+    if args.audit:
+        try:
+            count = auditLibraries(plex, args.audit, args.library, rules,
+                                   args.workers,
+                                   processes=args.parse_processes)
+        except (requests.RequestException, BadRequest, NotFound) as error:
+            print("Error: Could not read libraries from the server. %s"
+                  % error)
+            sys.exit(1)
+        except OSError as error:
+            print("Error: Could not write audit file. %s" % error)
+            sys.exit(1)
+        if profiler is not None:
+            profiler.mark("apply")
+        print("Audited %d parts to '%s'." % (count, args.audit))
+        output.close()
+        return
+
+    # Apply rules to whole libraries instead of prompting, on this server
+    # and then every mirror. Rules don't depend on a sample episode, so
+    # each mirror's libraries are swept directly.
+    if rules is not None:
+        sweepLibraries(plex, rules, args.library, targets, args.workers,
+                       args.order == "watch", args.verify)
+        for mirrorServer in mirrorServers:
+            if deadlinePassed():
+                break
+            sweepLibraries(mirrorServer, rules, args.library, None,
+                           args.workers, args.order == "watch", args.verify)
+        if profiler is not None:
+            profiler.mark("apply")
+        output.close()
+        return
+
+    # Match results are shared between every show modified this session
+    matchCache = MatchCache()
+
+    # Begin program loop
+    settingStreams = True
+    while settingStreams:
+        modifyShow(plex, matchCache, targets, mirrorServers, args.workers,
+                   args.order == "watch", args.verify)
+
+        # Completed!
+        newShow = getYesOrNoFromUser(
+            "Operations complete! Modify another show? [y/n]: ")
+        if newShow == 'n':
+            settingStreams = False
+    output.close()
+
+
+def mapBounded(function, items, executor, limit):
+    """ Yields function(item) for each item, in order, running up to limit
+        calls at once in executor. Items are only taken from the iterable as
+        calls finish, so at most limit of them are held at a time.
+
+        Parameters:
+            function(callable): Function to call on each item.
+            items(iterable): Items to call function on.
+            executor(:class:`~concurrent.futures.Executor`): Executor to run
+                the calls in.
+            limit(int): Maximum number of calls in flight.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
 def matchAudio(episodePart, template):
     """ Returns the :class:`~plexapi.media.AudioStream` from the given
         MediaPart that is the closest match to the given template.
@@ -238,24 +3005,29 @@ def matchAudio(episodePart, template):
             episodePart(:class:`~plexapi.media.MediaPart`): MediaPart whose
                 AudioStreams will be parsed to find the closest match.
             template(AudioStreamInfo): Info of an AudioStream that will act as
-                a template for matching a stream from episodePart.
+                a template for matching a stream from episodePart, or a
+                :class:`StreamRule`.
     """
 
+    # Rules choose in one pass over the streams
+    if isinstance(template, StreamRule):
+        return template.match(episodePart.audioStreams())
+
     # Get episode streams
     episodeStreams = OrganizedStreams(episodePart)
     audioStreams = episodeStreams.audioStreams
 
+    # If title and language code match, AudioStream automatically matches
+    titleMatch = findTitleMatch(episodeStreams.audioTitleIndex, template)
+    if titleMatch:
+        return titleMatch
+
     # Initialize variables
     winningIndex = -1  # Index of AudioStream in the lead (1-indexed)
     winningScore = -1  # Score of AudioStream in the lead
 
     for i, stream in enumerate(audioStreams, 1):
 
-        # If title and language code match, AudioStream automatically matches
-        if (stream.title and stream.title == template.title and
-                stream.languageCode == template.languageCode):
-            return stream
-
         # Languages must be the same to even be considered for a match
         if stream.languageCode == template.languageCode:
 
@@ -281,6 +3053,31 @@ def matchAudio(episodePart, template):
             winningIndex - 1]  # Must subtract one because array is 0-indexed
 
 
+def matchParts(parts, audioMatcher=None, subtitleMatcher=None,
+               resetSubtitles=False):
+    """ Yields a :class:`PartMatch` for each (episode, part) pair, holding the
+        streams that should be set as default.
+
+        Parameters:
+            parts(iterable<tuple>): (episode, part) pairs from
+                :func:`iterParts`.
+            audioMatcher(callable): Returns the AudioStream to set for a given
+                MediaPart, or None to leave audio untouched.
+            subtitleMatcher(callable): Returns the SubtitleStream to set for a
+                given MediaPart, or None to leave subtitles untouched.
+            resetSubtitles(bool): Disable subtitles instead of matching them.
+    """
+    for episode, part in parts:
+        match = PartMatch(episode, part)
+        if audioMatcher is not None:
+            match.audioStream = audioMatcher(part)
+        if resetSubtitles:
+            match.resetSubtitles = True
+        elif subtitleMatcher is not None:
+            match.subtitleStream = subtitleMatcher(part)
+        yield match
+
+
 def matchSubtitles(episodePart, template):
     """ Returns the :class:`~plexapi.media.SubtitleStream` from the given
         MediaPart that is the closest match to the given template.
@@ -289,25 +3086,29 @@ def matchSubtitles(episodePart, template):
             episodePart(:class:`~plexapi.media.MediaPart`): MediaPart whose
                 AudioStreams will be parsed to find the closest match.
             template(SubtitleStreamInfo): Info of a SubtitleStream that will
-                act as a template for matching a stream from episodePart.
+                act as a template for matching a stream from episodePart, or
+                a :class:`StreamRule`.
     """
 
+    # Rules choose in one pass over the streams
+    if isinstance(template, StreamRule):
+        return template.match(episodePart.subtitleStreams())
+
     # Get episode streams
     episodeStreams = OrganizedStreams(episodePart)
     subtitleStreams = episodeStreams.subtitleStreams
 
+    # If title and language code match, SubtitleStream automatically matches
+    titleMatch = findTitleMatch(episodeStreams.subtitleTitleIndex, template)
+    if titleMatch:
+        return titleMatch
+
     # Initialize variables
     winningIndex = -1  # Index of AudioStream in the lead (1-indexed)
     winningScore = -1  # Score of AudioStream in the lead
 
     for i, stream in enumerate(subtitleStreams, 1):
 
-        # If title and language code match, SubtitleStream automatically
-        # matches
-        if (stream.title and stream.title == template.title and
-                stream.languageCode == template.languageCode):
-            return stream
-
         # Languages must be the same to even be considered for a match
         if stream.languageCode == template.languageCode:
 
@@ -341,14 +3142,497 @@ def matchSubtitles(episodePart, template):
             winningIndex - 1]  # Must subtract one because array is 0-indexed
 
 
-def printResetSubSuccess(episode):
+def modifyShow(plex, matchCache, targets=None, mirrorServers=(), workers=1,
+               watchOrder=False, verify=False):
+    """ Prompts user for a show, seasons and tracks, then sets the closest
+        matching tracks for every episode of those seasons.
+
+        Parameters:
+            plex(:class:`~plexapi.server.PlexServer`): The server signed into.
+            matchCache(:class:`MatchCache`): Cache shared by every show
+                modified in the session.
+            targets(list<:class:`~plexapi.server.PlexServer`>): Servers to
+                write through, one per user (default = plex).
+            mirrorServers(list<:class:`~plexapi.server.PlexServer`>): Other
+                servers to apply the same tracks to (optional).
+            workers(int): Number of episodes fetched and written at once
+                (default = 1).
+            watchOrder(bool): Modify the episodes about to be watched first
+                (default = index order).
+            verify(bool): Read back the tracks of every part written
+                (default = False).
+    """
+    # Choose library
+    library = selectLibrary(plex)
+
+    # Choose show
+    show = selectShow(library)
+
+    # Get seasons of show to modify from user
+    seasons = selectSeasons(show)
+
+    # Print all seasons we'll modify
+    print("Adjusting audio & subtitle settings for Season%s %s of '%s'."
+          % ("s" if len(seasons) > 1 else "", seasonsToString(seasons),
+             show.title))
+
+    # Print audio & subtitle streams for first episode, listing only it
+    try:
+        episode = next(iterEpisodes(show, seasons[:1], 1))
+    except StopIteration:
+        print("Error: Season %d of '%s' has no episodes." % (
+            seasons[0], show.title))
+        return
+    printStreams(episode)
+
+    # Continuously display episodes until user chooses not to
+    displayingEpisodes = True
+    while displayingEpisodes:
+        # Display another episode?
+        displayEpisode = getYesOrNoFromUser(
+            "Display settings for another episode? [y/n]: ")
+
+        if displayEpisode == 'y':
+
+            # Get season/episode number
+            seasonNum = getNumFromUser("Season number: ")
+            episodeNum = getNumFromUser("Episode number: ")
+
+            # Print episode settings
+            try:
+                episode = show.episode(season=seasonNum,
+                                       episode=episodeNum)
+            except (BadRequest, NotFound):
+                print("S%02dE%02d of '%s' is not in your library." % (
+                    seasonNum, episodeNum, show.title))
+            else:
+                printStreams(episode)
+        else:  # User done displaying episodes
+            displayingEpisodes = False
+
+    # Get audio and subtitle streams of displayed episode. Other versions
+    # of it are matched in the batch like every other episode.
+    episodePart = episode.media[0].parts[0]  # The episode file
+    episodeStreams = OrganizedStreams(
+        episodePart)  # Audio & subtitle streams
+
+    # Get index of new audio stream from user
+    audioIndex = None
+    adjustAudio = getYesOrNoFromUser(
+        "Do you want to switch audio tracks? [y/n]: ")
+    if adjustAudio == 'y':
+        audioIndex = selectAudio(episodeStreams)
+
+    # Get index of new subtitle stream from user
+    subIndex = None
+    adjustSubtitles = getYesOrNoFromUser(
+        "Do you want to switch subtitle tracks? [y/n]: ")
+    if adjustSubtitles == 'y':
+        subIndex = selectSubtitles(episodeStreams)
+    resetSubtitles = True if subIndex is not None and subIndex < 0 \
+        else False
+
+    # Final prompt
+    if adjustAudio == 'y' or adjustSubtitles == 'y':
+
+        # Print show and seasons we will modify
+        print("Matching Season%s %s of %s to the following tracks:\n" % (
+            "s" if len(seasons) > 1 else "", seasonsToString(seasons),
+            show.title))
+
+        # Print audio stream template
+        if adjustAudio == 'y':
+            newAudio = episodeStreams.getStreamFromIndex(audioIndex)
+            print("\tAudio | Title: %s | Language: %s | "
+                  "Codec: %s | Channels: %s"
+                  % (newAudio.title, newAudio.languageCode,
+                     newAudio.codec, newAudio.audioChannelLayout))
+
+        # Print subtitle stream template
+        if adjustSubtitles == 'y' and not resetSubtitles:
+            newSubtitle = episodeStreams.getStreamFromIndex(subIndex)
+            print("\tSubtitles | Title: %s | Language: %s | Format: %s | "
+                  "Forced: %s"
+                  % (newSubtitle.title, newSubtitle.languageCode,
+                     newSubtitle.codec, newSubtitle.forced))
+        elif adjustSubtitles == 'y' and resetSubtitles:
+            print("\tSubtitles | Disabled")
+
+        # Ask user whether to proceed
+        willProceed = getYesOrNoFromUser("\nProceed? [y/n]: ")
+        if willProceed == 'n':
+            adjustAudio = 'n'
+            adjustSubtitles = 'n'
+
+    # Skip batch if no adjustments will be made
+    if profiler is not None:
+        profiler.mark("selection")
+    if adjustAudio == 'n' and adjustSubtitles == 'n':
+        return
+
+    # Create templates for matching future episodes
+    audioTemplate, subtitleTemplate = createTemplates(
+        episodePart, audioIndex if adjustAudio == 'y' else None,
+        subIndex if adjustSubtitles == 'y' else None)
+    resetSubtitles = adjustSubtitles == 'y' and resetSubtitles
+
+    # Remember tracks for episodes added later (see --daemon)
+    TemplateStore().save(show, audioTemplate, subtitleTemplate,
+                         resetSubtitles)
+
+    # Snapshot current streams of every part this run modifies. Snapshots
+    # only hold the owner's tracks, which runs for home users don't change.
+    snapshot = None
+    if not targets:
+        snapshot = StreamSnapshot(snapshotPath(plex, show), plex)
+
+    # Set audio/subtitle streams for highlighted episode
+    sampleMatch = PartMatch(episode, episodePart)
+    if audioTemplate is not None:
+        sampleMatch.audioStream = newAudio
+    if resetSubtitles:
+        sampleMatch.resetSubtitles = True
+    elif subtitleTemplate is not None:
+        sampleMatch.subtitleStream = newSubtitle
+    for match in writeParts([sampleMatch], False, False, targets, snapshot):
+        pass
+
+    # Batch set audio/subtitle streams for all chosen episodes
+    templates = {
+        "audioTemplate": audioTemplate,
+        "subtitleTemplate": subtitleTemplate,
+        "resetSubtitles": resetSubtitles,
+        "matchCache": matchCache,
+        "workers": workers,
+        "watchOrder": watchOrder,
+        "verify": verify,
+    }
+
+    # Find the show on every mirror
+    mirrors = []
+    mirrorSnapshots = []
+    for mirrorServer in mirrorServers:
+        mirrorShow = findMirroredShow(mirrorServer, show)
+        if mirrorShow is None:
+            print("Error: '%s' not found on server '%s'." % (
+                show.title, mirrorServer.friendlyName))
+            continue
+        mirrorSeasons = [s for s in mirrorShow.seasons()
+                         if s.index in seasons]
+        mirrors.append((mirrorShow, mirrorSeasons))
+        mirrorSnapshots.append(StreamSnapshot(
+            snapshotPath(mirrorServer, mirrorShow), mirrorServer))
+
+    # Count episodes up front from the season listings
+    total = sum(s.leafCount for s in show.seasons() if s.index in seasons)
+    for mirrorShow, mirrorSeasons in mirrors:
+        total += sum(s.leafCount for s in mirrorSeasons)
+    progress = BatchProgress(total)
+    if episode.seasonNumber in seasons:
+        progress.advancePart(episode)  # Highlighted part is already done
+
+    # Apply to this server and every mirror at the same time
+    with ThreadPoolExecutor(max_workers=1 + len(mirrors)) as executor:
+        jobs = [executor.submit(
+            applyTemplates, show, seasons, skipPartId=episodePart.id,
+            servers=targets, snapshot=snapshot, progress=progress,
+            **templates)]
+        for (mirrorShow, mirrorSeasons), mirrorSnapshot in zip(
+                mirrors, mirrorSnapshots):
+            jobs.append(executor.submit(
+                applyTemplates, mirrorShow, [s.index for s in mirrorSeasons],
+                snapshot=mirrorSnapshot, progress=progress, **templates))
+        for job in jobs:
+            job.result()
+    progress.finish()
+    output.summary()
+
+    # Tell user how to undo this run
+    if snapshot is not None:
+        snapshot.close()
+        print("Previous tracks saved. Undo with: --rollback \"%s\""
+              % snapshot.path)
+    else:
+        print("Previous tracks of home users are not saved, so this run "
+              "can't be rolled back.")
+    for (mirrorShow, mirrorSeasons), mirrorSnapshot in zip(
+            mirrors, mirrorSnapshots):
+        mirrorServer = mirrorShow._server
+        mirrorSnapshot.close()
+        print("Previous tracks saved. Undo with: --rollback \"%s\" "
+              "--servers \"%s\"" % (mirrorSnapshot.path, getattr(
+                  mirrorServer, "mirrorName", mirrorServer.friendlyName)))
+    printCacheStats(plex, matchCache)
+    if profiler is not None:
+        profiler.mark("apply")
+
+
+def normalizeTitle(title):
+    """ Returns a stream title reduced to lowercase words without punctuation,
+        with common spelling variants unified, so that e.g. "English (SDH)",
+        "English SDH" and "english sdh" compare equal. Returns "" for None.
+
+        Parameters:
+            title(str): The stream title to normalize.
+    """
+    if not title:
+        return ""
+    words = []
+    for word in re.findall(r"[^\W_]+", title.lower()):
+        word = TITLE_TOKEN_ALIASES.get(word, word)
+        if word:
+            words.append(word)
+    return " ".join(words)
+
+
+def parseArguments(args=None):
+    """ Returns the parsed command-line options of the script.
+
+        Parameters:
+            args(list<str>): Arguments to parse (default = sys.argv).
+    """
+    parser = argparse.ArgumentParser(
+        description="Batch audio & subtitle switcher for Plex.")
+    parser.add_argument(
+        "--users", nargs="?", const="", metavar="NAMES",
+        help="Apply changes for several home users at once. Takes a "
+             "comma-separated list of users or 'all', and prompts if omitted.")
+    parser.add_argument(
+        "--servers", metavar="NAMES",
+        help="Also apply changes to the same shows on other servers. Takes a "
+             "comma-separated list of [SERVER <name>] sections in config.ini "
+             "or server names linked to your account, or 'all'.")
+    parser.add_argument(
+        "--rollback", metavar="SNAPSHOT",
+        help="Restore the streams recorded in a snapshot file from the "
+             "%s folder, then exit." % SNAPSHOT_FOLDER)
+    parser.add_argument(
+        "--rules", metavar="RULES",
+        help="Apply preference rules to every show instead of prompting, "
+             "e.g. \"audio: jpn > eng, prefer 5.1; subtitles: eng full > "
+             "eng, not forced\". See the readme for the syntax.")
+    parser.add_argument(
+        "--audit", metavar="FILE",
+        help="Write every episode's tracks to FILE (CSV if it ends in .csv, "
+             "otherwise JSON Lines) instead of changing them. With --rules, "
+             "flags episodes whose tracks the rules would change")
+    parser.add_argument(
+        "--library", action="append", metavar="NAME",
+        help="Library --rules or --audit applies to. Can be given more than "
+             "once. Default: every TV library")
+    parser.add_argument(
+        "--daemon", nargs="?", const=DAEMON_PORT, type=int, metavar="PORT",
+        help="Stay signed in and take jobs through a local HTTP API instead "
+             "of prompting. Default port: %d" % DAEMON_PORT)
+    parser.add_argument(
+        "--bind", default="127.0.0.1", metavar="ADDRESS",
+        help="Address the daemon listens on, e.g. 0.0.0.0 to receive "
+             "webhooks from a Plex server on another computer. Other "
+             "computers can only reach /webhook. Default: 127.0.0.1")
+    parser.add_argument(
+        "--order", choices=["watch", "index"], default="watch",
+        help="Order episodes are modified in: 'watch' does on-deck, then "
+             "unwatched, then watched episodes first; 'index' goes season by "
+             "season. Default: watch")
+    parser.add_argument(
+        "--verify", action="store_true",
+        help="After writing, read back the tracks of every episode with a "
+             "few bulk requests and write again any that were not applied")
+    parser.add_argument(
+        "--workers", type=int, default=1, metavar="N",
+        help="Number of episodes fetched and written at once. Default: 1")
+    parser.add_argument(
+        "--parse-processes", type=int, default=0, metavar="N",
+        help="Parse --audit pages in N processes once downloaded, instead "
+             "of as they download. Helps when parsing, rather than the "
+             "server, is what limits a large audit. Default: 0")
+    parser.add_argument(
+        "--record", metavar="CASSETTE",
+        help="Save every request to Plex and its response, without tokens, "
+             "to this file.")
+    parser.add_argument(
+        "--replay", metavar="CASSETTE",
+        help="Answer requests from a file saved with --record instead of "
+             "Plex, e.g. to investigate a slow run offline.")
+    parser.add_argument(
+        "--replay-speed", type=float, default=1.0, metavar="FACTOR",
+        help="Multiply recorded latencies by this when replaying, 0 for no "
+             "delay. Default: 1")
+    parser.add_argument(
+        "--profile", nargs="?", const=PROFILE_PREFIX, metavar="PREFIX",
+        help="Profile CPU time and memory of the run and write the results "
+             "to PREFIX.pstats and PREFIX.txt at exit. Default: %s" %
+             PROFILE_PREFIX)
+    parser.add_argument(
+        "--quiet", action="store_true",
+        help="Don't print a line for every episode. Ends each run with a "
+             "summary and the episodes that were not matched or failed.")
+    parser.add_argument(
+        "--log", metavar="FILE",
+        help="Write a line for every episode to this file.")
+    parser.add_argument(
+        "--slow-call", type=float, default=SLOW_CALL, metavar="SECONDS",
+        help="Log fetches and writes slower than this, with the episode, "
+             "and list the slowest in the summary. Default: %g" % SLOW_CALL)
+    parser.add_argument(
+        "--deadline", type=float, metavar="SECONDS",
+        help="Stop sending requests this many seconds after the script "
+             "starts. Meant for --rules and --audit runs; episodes not "
+             "reached by then are left unchanged.")
+    return parser.parse_args(args)
+
+
+def parsePartRecords(chunks):
+    """ Yields a :class:`PartRecord` for each Part element of an XML
+        response, as the chunks of it arrive. Each element under the root is
+        discarded once read, so memory use does not grow with the size of
+        the response.
+
+        Parameters:
+            chunks(iterable<bytes>): The response body in pieces, e.g. from
+                :func:`queryChunks`.
+    """
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+
+    # Read events as chunks are fed, then the last ones
+    def events():
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    # Initialize variables
+    root = None
+    depth = 0
+    episode = {}
+    mediaId = None
+    record = None
+
+    for event, elem in events():
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = elem
+            elif depth == 2:
+                episode = dict(elem.attrib)
+            elif elem.tag == "Media":
+                mediaId = int(elem.get("id") or 0)
+            elif elem.tag == "Part":
+                record = PartRecord(episode, mediaId, elem)
+            elif elem.tag == "Stream" and record is not None:
+                record.addStream(elem)
+            continue
+
+        # Hand over finished parts and drop finished episodes
+        depth -= 1
+        if elem.tag == "Part" and record is not None:
+            yield record
+            record = None
+        elif depth == 1:
+            del root[:]
+
+
+def parseRules(text):
+    """ Returns (audioRule, subtitleRule, resetSubtitles) compiled from
+        preference rules, e.g.
+
+            "audio: jpn > eng, prefer 5.1;
+             subtitles: eng full > eng, not forced, prefer internal srt"
+
+        Each part names "audio" or "subtitles", then comma-separated clauses:
+        the first ranks languages (best first, "any" for any language), with
+        words that stream must also have; "not ..." rules streams out;
+        "prefer ..." breaks ties, most important first; other clauses are
+        required of every language. Words can be "forced", "internal",
+        "external", a channel layout (5.1, stereo), a codec (srt, ac3) or
+        else a word of the stream title. "subtitles: off" disables
+        subtitles. A rule missing for a kind leaves those streams untouched.
+
+        Parameters:
+            text(str): The rules to compile.
+    """
+    audioRule = None
+    subtitleRule = None
+    resetSubtitles = False
+    for section in text.split(";"):
+        if not section.strip():
+            continue
+        kind, separator, body = section.partition(":")
+        kind = kind.strip().lower()
+        if not separator or kind not in ("audio", "subtitle", "subtitles"):
+            raise ValueError("Rule '%s' must start with 'audio:' or "
+                             "'subtitles:'." % section.strip())
+        if kind == "audio":
+            audioRule = StreamRule(body)
+        elif body.strip().lower() in ("off", "none", "disabled"):
+            resetSubtitles = True
+        else:
+            subtitleRule = StreamRule(body)
+    return audioRule, subtitleRule, resetSubtitles
+
+
+def parseWebhook(contentType, body):
+    """ Returns the JSON payload of a Plex webhook request. Plex sends it as
+        the "payload" field of a multipart form; a plain JSON body is also
+        accepted, e.g. from scripts.
+
+        Parameters:
+            contentType(str): Content-Type header of the request.
+            body(bytes): Body of the request.
+    """
+    if contentType.startswith("multipart/"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + contentType.encode("latin-1") + b"\r\n\r\n"
+            + body)
+        for field in message.iter_parts():
+            if field.get_param("name", header="content-disposition") \
+                    == "payload":
+                body = field.get_payload(decode=True)
+                break
+        else:
+            raise ValueError("Webhook has no payload field.")
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise ValueError("Webhook payload is not valid JSON.")
+
+
+def printCacheStats(plexServer, matchCache):
+    """ Prints how often matches and server responses were reused.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server whose
+                response cache to report on.
+            matchCache(:class:`MatchCache`): The match cache to report on.
+    """
+    print("Match cache: %d hits, %d misses (%.0f%% hit rate)" % (
+        matchCache.hits, matchCache.misses, matchCache.hitRate() * 100))
+    httpCache = plexServer._session.get_adapter(plexServer._baseurl)
+    if isinstance(httpCache, CachingAdapter):
+        print("HTTP cache: %d hits, %d revalidated, %d misses (%.0f%% "
+              "reused)" % (httpCache.hits, httpCache.revalidations,
+                           httpCache.misses, httpCache.hitRate() * 100))
+    hedging = httpCache
+    while hedging is not None and not isinstance(hedging, HedgingAdapter):
+        hedging = getattr(hedging, "adapter", None)
+    if hedging is not None and hedging.hedged:
+        print("Hedged requests: %d of %d slow GETs sent twice, %d answered "
+              "first by the second copy" % (hedging.hedged, hedging.requests,
+                                            hedging.hedgeWins))
+
+
+def printResetSubSuccess(episode, runOutput=None):
     """ Prints a success message when subtitles are reset.
 
         Parameters:
             episode(:class:`plexapi.video.Episode`): The episode whose
                 subtitles are reset.
+            runOutput(:class:`RunOutput`): Writer for per-part output
+                (default = the script's output).
     """
-    print("Reset subtitles for '%s'" % episodeToString(episode))
+    (runOutput or output).success("Reset subtitles for '%s'" %
+                                  episodeToString(episode))
 
 
 def printStreams(episode):
@@ -359,7 +3643,7 @@ def printStreams(episode):
                 MediaPartStreams will be printed.
     """
     # Get audio & subtitle streams
-    episode.reload()
+    fetchStreams(episode)
     part = episode.media[0].parts[0]
     streams = OrganizedStreams(part)
 
@@ -367,6 +3651,9 @@ def printStreams(episode):
     count = 1
     print("\nAudio & subtitle settings for '%s %s':\n" % (
         episode.show().title, episodeToString(episode)))
+    if len(episode.media) > 1:
+        print("Showing the first of %d versions. The others are matched to "
+              "the tracks you choose.\n" % len(episode.media))
     print("Audio:\n")
     for stream in streams.audioStreams:
         selected = ""
@@ -414,7 +3701,7 @@ def printSubtitles(streams, startIndex=1):
     return startIndex + len(streams)
 
 
-def printSuccess(episode, newStream):
+def printSuccess(episode, newStream, runOutput=None):
     """ Prints stream set successfully.
 
         Parameters:
@@ -422,6 +3709,8 @@ def printSuccess(episode, newStream):
                 was set.
             newStream(:class:`~plexapi.media.AudioStream`): The AudioStream
                 that was applied.
+            runOutput(:class:`RunOutput`): Writer for per-part output
+                (default = the script's output).
     """
     if newStream.title:
         descriptor = "'%s' " % newStream.title
@@ -433,10 +3722,111 @@ def printSuccess(episode, newStream):
         streamType = "audio"
     elif isinstance(newStream, SubtitleStream):
         streamType = "subtitle"
-    print("Set %s %sfor '%s'" % (
+    (runOutput or output).success("Set %s %sfor '%s'" % (
         streamType, descriptor, episodeToString(episode)))
 
 
+def queryChunks(plexServer, key, chunkSize=PARSE_CHUNK_SIZE):
+    """ Yields the body of the response to a GET of key in chunks, as it
+        downloads, instead of reading it all first like
+        :meth:`~plexapi.server.PlexServer.query`. Raises NotFound or
+        BadRequest if the server refuses the request.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): Server to ask.
+            key(str): Path and query string to fetch.
+            chunkSize(int): Bytes read at a time
+                (default = PARSE_CHUNK_SIZE).
+    """
+    response = plexServer._session.get(
+        plexServer.url(key), headers=plexServer._headers(), stream=True)
+    with response:
+        if response.status_code != 200:
+            error = NotFound if response.status_code == 404 else BadRequest
+            raise error("(%s) %s" % (response.status_code, response.url))
+        yield from response.iter_content(chunkSize)
+
+
+def readConfig():
+    """ Returns a :class:`configparser.ConfigParser` loaded from config.ini.
+    """
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    return config
+
+
+def rollbackSnapshot(plexServer, path, mirrorServers=()):
+    """ Restores the streams recorded in a :class:`StreamSnapshot` file for
+        the account that took it. Nothing is fetched or matched; every part
+        is written in parallel. Returns the number of parts restored.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server
+                signed into.
+            path(str): Path of the snapshot file.
+            mirrorServers(list<:class:`~plexapi.server.PlexServer`>): Other
+                servers, from :func:`signInServers`. A snapshot taken on one
+                of them is restored there.
+    """
+    # Read snapshot, finding the server it was taken on. The first line of
+    # a part holds the streams it had before the run.
+    rows = OrderedDict()
+    with open(path, encoding="utf8") as handle:
+        for line in handle:
+            fields = line.rstrip("\n").split("\t")
+            if line.startswith("# snapshot"):
+                servers = [server for server in
+                           [plexServer] + list(mirrorServers)
+                           if server.machineIdentifier == fields[1]]
+                if not servers:
+                    raise ValueError("Snapshot was taken on server '%s'. "
+                                     "Add it with --servers." % fields[2])
+                plexServer = servers[0]
+            elif not line.startswith("#") and line.strip():
+                row = [int(field) if field else None for field in fields]
+                rows.setdefault(row[0], row)
+
+    # Restore every part at once, leaving unrecorded stream types alone
+    def restore(row):
+        partId, audioId, subtitleId = row
+        setPartStreamIds(plexServer, partId, audioId or None, subtitleId)
+
+    with ThreadPoolExecutor(max_workers=POOL_SIZE) as executor:
+        jobs = [executor.submit(restore, row) for row in rows.values()]
+        for job in jobs:
+            job.result()
+    return len(rows)
+
+
+def runDaemon(plexServer, port=DAEMON_PORT, servers=None, workers=1,
+              address="127.0.0.1"):
+    """ Serves the daemon's local HTTP API until interrupted. See
+        :class:`DaemonRequestHandler` for the endpoints.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server
+                signed into.
+            port(int): Port to listen on.
+            servers(list<:class:`~plexapi.server.PlexServer`>): Servers to
+                write through, one per user (default = plexServer).
+            workers(int): Number of episodes each job fetches and writes at
+                once (default = 1).
+            address(str): Address to listen on (default = this computer
+                only).
+    """
+    switcher = SwitcherDaemon(plexServer, servers, workers)
+    httpServer = ThreadingHTTPServer((address, port), DaemonRequestHandler)
+    httpServer.switcher = switcher
+    print("Listening on http://%s:%d (Ctrl+C to stop)" % (address, port))
+    try:
+        httpServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpServer.server_close()
+        switcher.close()
+
+
 def selectAudio(streams):
     """ Prompts user to choose AudioStream, then returns their choice.
 
@@ -566,23 +3956,26 @@ def selectShow(library):
             library(:class:`~plexapi.library.LibrarySection`): The library to
                 select a show from.
     """
-    # Get list of shows from library
-    showTitles = []
-    for show in library.search(libtype="show"):
-        showTitles.append(show.title)
+    # Complete show titles with a search on the server, as the library may
+    # be too large to list up front
+    def completeShow(text):
+        matches = ["list"] if "list".startswith(text.lower()) else []
+        matches += islice((title for title in iterShowTitles(library, text)
+                           if title.lower().startswith(text.lower())),
+                          COMPLETION_LIMIT)
+        return matches
 
     # Get show to modify from user
-    enableAutoComplete(
-        showTitles + ["list"])  # Enable autocomplete to shows in library
+    enableAutoComplete(completeShow)  # Enable autocomplete to shows in library
     inLibrary = False
     while not inLibrary:
         givenShow = input(
             "Which show should we adjust? (Type 'list' to see all shows): ")
 
-        # If 'list' is typed, print shows in library
+        # If 'list' is typed, print shows in library one page at a time
         if givenShow.lower() == "list":
-            for show in showTitles:
-                print(show)
+            for title in iterShowTitles(library):
+                print(title)
 
         # Otherwise, get show
         else:
@@ -633,6 +4026,39 @@ def selectSubtitles(streams):
     return index
 
 
+def selectTvLibraries(plexServer, names=None):
+    """ Returns the TV libraries with the given titles, printing an error for
+        each title that is not a TV library.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server to
+                search.
+            names(list<str>): Titles of the libraries to return (default =
+                every TV library).
+    """
+    libraries = [library for library in plexServer.library.sections()
+                 if library.type == "show"
+                 and (not names or library.title in names)]
+    found = {library.title for library in libraries}
+    for name in set(names or []) - found:
+        print("Error: No TV library named '%s'." % name)
+    return libraries
+
+
+def snapshotPath(plexServer, show):
+    """ Returns a new snapshot file path for a run on the given show.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server the
+                show is on.
+            show(:class:`~plexapi.video.Show`): The show being modified, or
+                the library when a whole library is.
+    """
+    name = "%s %s (%s).tsv" % (datetime.now().strftime("%Y-%m-%d %H%M%S"),
+                               show.title, plexServer.friendlyName)
+    return os.path.join(SNAPSHOT_FOLDER, re.sub(r'[\\/:*?"<>|]', "", name))
+
+
 def seasonsToString(seasons):
     """ Given list of season numbers, returns string of seasons ina readable
         format. Ex: "1, 2, 4, and 5"
@@ -654,6 +4080,49 @@ def seasonsToString(seasons):
     return seasonString
 
 
+def setPartStreams(plexServer, match):
+    """ Sets the default streams chosen in a :class:`PartMatch` through the
+        given server. Stream ids are the same for every user, so one match
+        can be written through the server instance of each user.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): Server instance
+                of the user to write for.
+            match(:class:`PartMatch`): The streams to set.
+    """
+    subtitleId = None
+    if match.resetSubtitles:
+        subtitleId = 0
+    elif match.subtitleStream:
+        subtitleId = match.subtitleStream.id
+    setPartStreamIds(plexServer, match.part.id,
+                     match.audioStream.id if match.audioStream else None,
+                     subtitleId)
+
+
+def setPartStreamIds(plexServer, partId, audioStreamId=None,
+                     subtitleStreamId=None):
+    """ Sets the default streams of a MediaPart by id.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): Server instance
+                of the user to write for.
+            partId(int): Id of the MediaPart.
+            audioStreamId(int): Id of the AudioStream to set, or None to leave
+                audio untouched.
+            subtitleStreamId(int): Id of the SubtitleStream to set, 0 to
+                disable subtitles, or None to leave subtitles untouched.
+    """
+    key = "/library/parts/%d?%s=%d&allParts=1"
+    put = plexServer._session.put
+    if audioStreamId is not None:
+        plexServer.query(key % (partId, "audioStreamID", audioStreamId),
+                         method=put)
+    if subtitleStreamId is not None:
+        plexServer.query(key % (partId, "subtitleStreamID",
+                                subtitleStreamId), method=put)
+
+
 def signIn():
     """ Prompts user for Plex server info, then returns a
         :class:`~plexapi.server.PlexServer` instance.
@@ -682,9 +4151,8 @@ def signInLocally():
     # Get URL and token from config.ini
     plexURL = ""
     plexToken = ""
-    config = configparser.ConfigParser()
+    config = readConfig()
     try:
-        config.read('config.ini')
         plexURL = config['LOGIN']['PLEX_URL']
         plexToken = config['LOGIN']['PLEX_TOKEN']
     except KeyError:
@@ -704,9 +4172,8 @@ def signInLocally():
         # Sign in
         print("Signing in...")
         try:
-            requests.packages.urllib3.disable_warnings()
-            session = requests.Session()
-            session.verify = False
+            session = createSession(config['NETWORK']
+                                    if config.has_section('NETWORK') else None)
             plexServer = PlexServer(plexURL, plexToken, session=session)
             account = plexServer.myPlexAccount()
             isSignedIn = True
@@ -736,6 +4203,59 @@ def signInLocally():
     return plexServer
 
 
+def signInHomeUsers(plexServer, givenUsers=""):
+    """ Returns a list of :class:`~plexapi.server.PlexServer` instances, one
+        for each chosen home user. Users are listed once and their tokens are
+        requested concurrently, so the servers can be reused for every show
+        modified in the session.
+
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): PlexServer of the
+                account owner.
+            givenUsers(str): Comma-separated user names or 'all'. Prompts for
+                users if empty.
+    """
+    # Get all home users
+    account = plexServer.myPlexAccount()
+    homeUsers = {}
+    for user in account.users():
+        if user.home:
+            homeUsers[user.title.lower()] = user
+
+    # Which users?
+    enableAutoComplete([user.title for user in homeUsers.values()] + ["all"])
+    chosenUsers = None
+    while chosenUsers is None:
+        if not givenUsers:
+            givenUsers = input("Home users to apply changes for [%s] "
+                               "(comma-separated, 'all' for every user): " %
+                               "|".join(u.title for u in homeUsers.values()))
+        if givenUsers.strip().lower() == "all":
+            chosenUsers = list(homeUsers.values())
+        else:
+            names = [n.strip().lower() for n in givenUsers.split(",")]
+            unknown = [n for n in names if n and n not in homeUsers]
+            if "" in names:
+                print("Error: Empty user name in '%s'." % givenUsers.strip())
+                givenUsers = ""
+            elif unknown:
+                print("Error: User '%s' does not exist." % ", ".join(unknown))
+                givenUsers = ""
+            else:
+                chosenUsers = [homeUsers[n] for n in names]
+    disableAutoComplete()
+
+    # Get a token for each user at once
+    def userServer(user):
+        return PlexServer(plexServer._baseurl,
+                          user.get_token(plexServer.machineIdentifier),
+                          session=plexServer._session)
+
+    print("Signing in as %d home users..." % len(chosenUsers))
+    with ThreadPoolExecutor(max_workers=len(chosenUsers) or 1) as executor:
+        return list(executor.map(userServer, chosenUsers))
+
+
 def signInManagedUser(plexServer):
     """ Prompts for a managed user, then returns a
         :class:`~plexapi.server.PlexServer` instance for said user.
@@ -799,10 +4319,15 @@ def signInOnline():
         serverName = input("Plex server name: ")
 
         # Sign in via MyPlex
-        print("Signing in (this may take awhile)...")
+        print("Signing in...")
         try:
-            account = MyPlexAccount(username, password)
-            plexServer = account.resource(serverName).connect()
+            config = readConfig()
+            settings = config['NETWORK'] \
+                if config.has_section('NETWORK') else None
+            account = MyPlexAccount(username, password,
+                                    session=createSession(settings))
+            plexServer = connectResource(account.resource(serverName),
+                                         settings)
             isSignedIn = True
         except BadRequest:
             print("Error: Login failed. Are your credentials correct?")
@@ -812,211 +4337,323 @@ def signInOnline():
     return plexServer
 
 
-###############################################################################
-# Start Script
-###############################################################################
-
-
-if __name__ == "__main__":
+def signInServers(plexServer, givenServers):
+    """ Returns a list of :class:`~plexapi.server.PlexServer` instances for
+        other servers to mirror changes to. Servers are looked up in the
+        [SERVER <name>] sections of config.ini first, then in the servers
+        linked to the account, and each gets its own session. Settings a
+        [SERVER <name>] section leaves out are taken from [NETWORK]. The
+        account is only asked for its servers if a name isn't configured.
 
-    # Get Plex server instance
-    plex = signIn()
-
-    # Begin program loop
-    settingStreams = True
-    while settingStreams:
-
-        # Choose library
-        library = selectLibrary(plex)
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server signed
+                into, which will not be returned.
+            givenServers(str): Comma-separated server names or 'all'.
+    """
+    config = readConfig()
+    store = ConnectionStore()
+    network = config['NETWORK'] if config.has_section('NETWORK') else {}
+    configured = {}
+    for section in config.sections():
+        if section.upper().startswith("SERVER "):
+            settings = {key.upper(): value for key, value in network.items()}
+            settings.update((key.upper(), value)
+                            for key, value in config[section].items()
+                            if value)
+            configured[section[7:].strip().lower()] = settings
+
+    # Which servers?
+    showAll = givenServers.strip().lower() == "all"
+    names = list(configured) if showAll else \
+        [n.strip().lower() for n in givenServers.split(",")]
+
+    # Servers linked to the account, only when needed
+    resources = {}
+    if showAll or any(name not in configured for name in names):
+        for resource in plexServer.myPlexAccount().resources():
+            if "server" in resource.provides and \
+                    resource.clientIdentifier != \
+                    plexServer.machineIdentifier:
+                resources[resource.name.lower()] = resource
+    if showAll:
+        names += [n for n in resources if n not in configured]
+
+    # Connect to every server at once
+    def connect(name):
+        try:
+            if name in configured:
+                settings = configured[name]
+                server = PlexServer(settings.get('PLEX_URL'),
+                                    settings.get('PLEX_TOKEN'),
+                                    session=createSession(settings))
+            elif name in resources:
+                server = connectResource(
+                    resources[name],
+                    config['NETWORK'] if config.has_section('NETWORK')
+                    else None, store)
+            else:
+                print("Error: Server '%s' not found in config.ini or linked "
+                      "to your account." % name)
+                return None
+        except (requests.ConnectionError, BadRequest, NotFound):
+            print("Error: Could not connect to server '%s'." % name)
+            return None
+        print("Signed into server '%s'." % server.friendlyName)
+        server.mirrorName = name  # For --servers in undo hints
+        return server
 
-        # Choose show
-        show = selectShow(library)
+    with ThreadPoolExecutor(max_workers=len(names) or 1) as executor:
+        servers = list(executor.map(connect, names))
+    return [server for server in servers if server is not None]
 
-        # Get seasons of show to modify from user
-        seasons = selectSeasons(show)
 
-        # Print all seasons we'll modify
-        print("Adjusting audio & subtitle settings for Season%s %s of '%s'."
-              % ("s" if len(seasons) > 1 else "", seasonsToString(seasons),
-                 show.title))
+def sweepLibraries(plexServer, rules, libraryNames=None, servers=None,
+                   workers=1, watchOrder=False, verify=False):
+    """ Applies preference rules to every show of the given TV libraries,
+        without prompting.
 
-        # Print audio & subtitle streams for first episode
-        episode = show.season(seasons[0]).episodes()[0]
-        printStreams(episode)
+        Parameters:
+            plexServer(:class:`~plexapi.server.PlexServer`): The server to
+                modify.
+            rules(tuple): (audioRule, subtitleRule, resetSubtitles) from
+                :func:`parseRules`.
+            libraryNames(list<str>): Titles of the libraries to sweep
+                (default = every TV library).
+            servers(list<:class:`~plexapi.server.PlexServer`>): Servers to
+                write through, one per user (default = plexServer).
+            workers(int): Number of episodes fetched and written at once
+                (default = 1).
+            watchOrder(bool): Modify the episodes about to be watched first
+                in each show (default = index order).
+            verify(bool): Read back the tracks of every part written
+                (default = False).
+    """
+    audioRule, subtitleRule, resetSubtitles = rules
+    matchCache = MatchCache()
+
+    libraries = selectTvLibraries(plexServer, libraryNames)
+
+    for library in libraries:
+        if deadlinePassed():
+            break
+        print("Applying rules to every show in '%s'." % library.title)
+        shows = library.all()
+        progress = BatchProgress(sum(show.leafCount for show in shows))
+        snapshot = None
+        if not servers:
+            snapshot = StreamSnapshot(snapshotPath(plexServer, library),
+                                      plexServer)
+        for show in shows:
+            try:
+                seasons = [season.index for season in show.seasons()]
+                applyTemplates(show, seasons, audioRule, subtitleRule,
+                               resetSubtitles, matchCache=matchCache,
+                               servers=servers, snapshot=snapshot,
+                               progress=progress, workers=workers,
+                               watchOrder=watchOrder, verify=verify)
+            except requests.Timeout:
+                if not deadlinePassed():
+                    raise
+            if deadlinePassed():
+                break
+        progress.finish()
+        if snapshot is not None and hasattr(plexServer, "mirrorName"):
+            snapshot.close()
+            print("Previous tracks saved. Undo with: --rollback \"%s\" "
+                  "--servers \"%s\"" % (snapshot.path, plexServer.mirrorName))
+        elif snapshot is not None:
+            snapshot.close()
+            print("Previous tracks saved. Undo with: --rollback \"%s\""
+                  % snapshot.path)
+        else:
+            print("Previous tracks of home users are not saved, so this run "
+                  "can't be rolled back.")
+    output.summary()
+    printCacheStats(plexServer, matchCache)
 
-        # Continuously display episodes until user chooses not to
-        displayingEpisodes = True
-        while displayingEpisodes:
-            # Display another episode?
-            displayEpisode = getYesOrNoFromUser(
-                "Display settings for another episode? [y/n]: ")
 
-            if displayEpisode == 'y':
+def verifyParts(matches, servers=None, windowSize=VERIFY_WINDOW,
+                retries=VERIFY_RETRIES, runOutput=None):
+    """ Reads back the streams selected in each written :class:`PartMatch`
+        and yields it with `verified` set, in order. A window of parts is
+        checked with one bulk request per server; parts whose streams don't
+        match are written and checked again, up to `retries` times.
 
-                # Get season/episode number
-                seasonNum = getNumFromUser("Season number: ")
-                episodeNum = getNumFromUser("Episode number: ")
+        Parameters:
+            matches(iterable<:class:`PartMatch`>): Matches from
+                :func:`writeParts`.
+            servers(list<:class:`~plexapi.server.PlexServer`>): Servers the
+                matches were written through (default = the server each part
+                came from).
+            windowSize(int): Number of parts checked per request
+                (default = VERIFY_WINDOW).
+            retries(int): Times a part is written again
+                (default = VERIFY_RETRIES).
+            runOutput(:class:`RunOutput`): Writer for per-part output
+                (default = the script's output).
+    """
+    runOutput = runOutput or output
 
-                # Print episode settings
-                try:
-                    episode = show.episode(season=seasonNum,
-                                           episode=episodeNum)
-                except (BadRequest, NotFound):
-                    print("S%02dE%02d of '%s' is not in your library." % (
-                        seasonNum, episodeNum, show.title))
-                else:
-                    printStreams(episode)
-            else:  # User done displaying episodes
-                displayingEpisodes = False
-
-        # Get audio and subtitle streams of displayed episode
-        episodePart = episode.media[0].parts[0]  # The episode file
-        episodeStreams = OrganizedStreams(
-            episodePart)  # Audio & subtitle streams
-
-        # Get index of new audio stream from user
-        audioIndex = None
-        adjustAudio = getYesOrNoFromUser(
-            "Do you want to switch audio tracks? [y/n]: ")
-        if adjustAudio == 'y':
-            audioIndex = selectAudio(episodeStreams)
-
-        # Get index of new subtitle stream from user
-        subIndex = None
-        adjustSubtitles = getYesOrNoFromUser(
-            "Do you want to switch subtitle tracks? [y/n]: ")
-        if adjustSubtitles == 'y':
-            subIndex = selectSubtitles(episodeStreams)
-        resetSubtitles = True if subIndex is not None and subIndex < 0 \
-            else False
-
-        # Final prompt
-        if adjustAudio == 'y' or adjustSubtitles == 'y':
-
-            # Print show and seasons we will modify
-            print("Matching Season%s %s of %s to the following tracks:\n" % (
-                "s" if len(seasons) > 1 else "", seasonsToString(seasons),
-                show.title))
-
-            # Print audio stream template
-            if adjustAudio == 'y':
-                newAudio = episodeStreams.getStreamFromIndex(audioIndex)
-                print("\tAudio | Title: %s | Language: %s | "
-                      "Codec: %s | Channels: %s"
-                      % (newAudio.title, newAudio.languageCode,
-                         newAudio.codec, newAudio.audioChannelLayout))
-
-            # Print subtitle stream template
-            if adjustSubtitles == 'y' and not resetSubtitles:
-                newSubtitle = episodeStreams.getStreamFromIndex(subIndex)
-                print("\tSubtitles | Title: %s | Language: %s | Format: %s | "
-                      "Forced: %s"
-                      % (newSubtitle.title, newSubtitle.languageCode,
-                         newSubtitle.codec, newSubtitle.forced))
-            elif adjustSubtitles == 'y' and resetSubtitles:
-                print("\tSubtitles | Disabled")
-
-            # Ask user whether to proceed
-            willProceed = getYesOrNoFromUser("\nProceed? [y/n]: ")
-            if willProceed == 'n':
-                adjustAudio = 'n'
-                adjustSubtitles = 'n'
-
-        # Set audio/subtitle streams for highlighted episode
-        if adjustAudio == 'y':
-            # Set audio settings for chosen episode
-            episodePart.setDefaultAudioStream(newAudio)
+    # Return the parts of a window whose streams the server doesn't have
+    def mismatched(plexServer, window):
+        keys = OrderedDict.fromkeys(str(m.episode.ratingKey) for m in window)
+        selected = {}
+        try:
+            for record in parsePartRecords(queryChunks(
+                    plexServer, "/library/metadata/%s%s" % (
+                        ",".join(keys), STREAMS_QUERY))):
+                streams = {AudioStream.STREAMTYPE: 0,
+                           SubtitleStream.STREAMTYPE: 0}
+                for stream in record.streams:
+                    if stream.selected:
+                        streams[stream.streamType] = stream.id
+                selected[record.id] = streams
+        except (requests.RequestException, BadRequest, NotFound,
+                ElementTree.ParseError):
+            return window
+        mismatches = []
+        for match in window:
+            streams = selected.get(match.part.id, {})
+            subtitleId = 0 if match.resetSubtitles else \
+                match.subtitleStream and match.subtitleStream.id
+            if (match.audioStream and
+                    streams.get(AudioStream.STREAMTYPE) !=
+                    match.audioStream.id) or \
+                    (subtitleId is not None and
+                     streams.get(SubtitleStream.STREAMTYPE) != subtitleId):
+                mismatches.append(match)
+        return mismatches
+
+    # Check a window of parts for every server, writing mismatches again
+    def verify(window):
+        written = [m for m in window if m.error is None and (
+            m.audioStream or m.subtitleStream or m.resetSubtitles)]
+        if not written:
+            return
+        for match in written:
+            match.verified = True
+        for plexServer in servers or [written[0].part._server]:
+            pending = mismatched(plexServer, written)
+            for attempt in range(retries):
+                if not pending:
+                    break
+                for match in pending:
+                    try:
+                        setPartStreams(plexServer, match)
+                    except (requests.RequestException, BadRequest, NotFound):
+                        pass
+                pending = mismatched(plexServer, pending)
+            for match in pending:
+                match.verified = False
+        failed = [m for m in written if not m.verified]
+        for match in failed:
+            runOutput.problem("Tracks were not applied to '%s'" %
+                              episodeToString(match.episode))
+        runOutput.confirm(len(written) - len(failed))
+
+    window = []
+    for match in matches:
+        window.append(match)
+        if len(window) >= windowSize:
+            verify(window)
+            yield from window
+            window = []
+    verify(window)
+    yield from window
+
+
+def writeParts(matches, adjustAudio=True, adjustSubtitles=True,
+               servers=None, snapshot=None, progress=None, workers=1,
+               runOutput=None):
+    """ Applies each :class:`PartMatch` to the server, printing the result,
+        and yields it once written, in order. When several servers (users)
+        are given, each match is written for all of them concurrently.
 
-            # Create template for matching future episodes
-            audioTemplate = AudioStreamInfo(newAudio, audioIndex)
+        Parameters:
+            matches(iterable<:class:`PartMatch`>): Matches from
+                :func:`matchParts`.
+            adjustAudio(bool): Report missing audio matches (default = True).
+            adjustSubtitles(bool): Report missing subtitle matches
+                (default = True).
+            servers(list<:class:`~plexapi.server.PlexServer`>): Servers to
+                write through (default = the server each part came from).
+            snapshot(:class:`StreamSnapshot`): Snapshot to record each part's
+                current streams to before it is modified (optional).
+            progress(:class:`BatchProgress`): Progress display to update
+                (optional).
+            workers(int): Number of parts written at once (default = 1).
+            runOutput(:class:`RunOutput`): Writer for per-part output
+                (default = the script's output).
+    """
+    runOutput = runOutput or output
+
+    userExecutor = ThreadPoolExecutor(max_workers=len(servers or [None]))
+    partExecutor = ThreadPoolExecutor(max_workers=workers)
+
+    def write(match):
+        # Record current streams before changing anything
+        if snapshot is not None:
+            snapshot.record(
+                match.part, audio=match.audioStream is not None,
+                subtitles=match.resetSubtitles or
+                match.subtitleStream is not None)
+
+        # Set streams for MediaPart, for every user at once
+        started = time.monotonic()
+        targets = servers or [match.part._server]
+        try:
+            list(userExecutor.map(partial(setPartStreams, match=match),
+                                  targets))
+        except (requests.RequestException, BadRequest, NotFound) as error:
+            match.error = error
+        else:
+            # Keep the part in step with the server, in case it is cached
+            if match.audioStream:
+                for stream in match.part.audioStreams():
+                    stream.selected = stream.id == match.audioStream.id
+            if match.resetSubtitles or match.subtitleStream:
+                for stream in match.part.subtitleStreams():
+                    stream.selected = bool(match.subtitleStream) and \
+                        stream.id == match.subtitleStream.id
+        seconds = time.monotonic() - started
+        if progress is not None:
+            progress.recordRequest(seconds)
+        runOutput.slow(seconds, "PUT /library/parts/%s" % match.part.id,
+                       match.episode)
+        return match
+
+    with userExecutor, partExecutor:
+        for match in mapBounded(write, matches, partExecutor, workers * 2):
+            episode = match.episode
+            if progress is not None:
+                progress.clear()
 
             # Print result
-            printSuccess(episode, newAudio)
-
-        # Adjust subtitles
-        if adjustSubtitles == 'y':
-
-            # Reset subtitles if user chose to do so
-            if resetSubtitles:
-
-                # Reset subtitles
-                episodePart.resetDefaultSubtitleStream()
-                printResetSubSuccess(episode)
-
+            if match.error is not None:
+                runOutput.problem("Failed to set tracks for '%s': %s" % (
+                    episodeToString(episode), match.error))
             else:
+                if match.audioStream:
+                    printSuccess(episode, match.audioStream, runOutput)
+                elif adjustAudio:
+                    runOutput.problem("No audio matches found for '%s'" %
+                                      episodeToString(episode))
+                if match.resetSubtitles:
+                    printResetSubSuccess(episode, runOutput)
+                elif match.subtitleStream:
+                    printSuccess(episode, match.subtitleStream, runOutput)
+                elif adjustSubtitles:
+                    runOutput.problem("No subtitle matches found for '%s'" %
+                                      episodeToString(episode))
+            if progress is not None:
+                progress.advancePart(episode)
+            yield match
 
-                # Set subtitle settings for the chosen episode
-                episodePart.setDefaultSubtitleStream(newSubtitle)
-
-                # Create template for matching future episodes
-                subtitleTemplate = SubtitleStreamInfo(
-                    newSubtitle, subIndex,
-                    subIndex - len(episodeStreams.audioStreams))
-
-                # Print result
-                printSuccess(episode, newSubtitle)
-
-        # Batch set audio/subtitle streams for all chosen episodes
-        # Skip loop if no adjustments will be made
-        if adjustAudio == 'y' or adjustSubtitles == 'y':
-
-            # Each season
-            for seasonNum in seasons:
-                season = show.season(int(seasonNum))
-
-                # Each episode in each season
-                for episode in season.episodes():
-                    episode.reload()
-
-                    # Each MediaPart (file) for each episode
-                    for part in episode.media[0].parts:
-
-                        # Skip re-adjusting file we already modified
-                        if part.id == episodePart.id:
-                            continue  # Next file
-
-                        # Set audio settings for MediaPart
-                        if adjustAudio == 'y':
-
-                            # Get closest match from template audio
-                            newAudio = matchAudio(part, audioTemplate)
-
-                            if newAudio:
-                                # Set audio as default
-                                part.setDefaultAudioStream(newAudio)
 
-                                # Print result
-                                printSuccess(episode, newAudio)
-                            else:
-                                print(
-                                    "No audio matches found for '%s'" %
-                                    episodeToString(episode))
-
-                        # Reset subtitles if user chose to
-                        if adjustSubtitles == 'y' and resetSubtitles:
-                            part.resetDefaultSubtitleStream()
-                            printResetSubSuccess(episode)
-
-                        # Set subtitle settings for MediaPart
-                        elif adjustSubtitles == 'y':
-
-                            # Get closest match from template subtitle
-                            newSubtitle = matchSubtitles(
-                                part, subtitleTemplate)
-
-                            if newSubtitle:
-                                # Set subtitle as default
-                                part.setDefaultSubtitleStream(newSubtitle)
+###############################################################################
+# Start Script
+###############################################################################
 
-                                # Print result
-                                printSuccess(episode, newSubtitle)
-                            else:
-                                print(
-                                    "No subtitle matches found for '%s'" %
-                                    episodeToString(episode))
 
-        # Completed!
-        newShow = getYesOrNoFromUser(
-            "Operations complete! Modify another show? [y/n]: ")
-        if newShow == 'n':
-            settingStreams = False
+if __name__ == "__main__":
+    main()
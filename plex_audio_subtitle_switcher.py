@@ -0,0 +1,26 @@
+""" Importable name for plex-audio-subtitle-switcher.py.
+
+    The script's file name contains hyphens, so it cannot be imported
+    directly. Importing this module loads the script under this name without
+    running the interactive prompts. Per-part lines go to the script's
+    output unless a :class:`RunOutput` is passed as `runOutput`.
+
+    Example:
+        import plex_audio_subtitle_switcher as switcher
+
+        audioTemplate, subtitleTemplate = switcher.createTemplates(
+            episodePart, audioIndex=2, subIndex=5)
+        result = switcher.applyTemplates(
+            show, [1, 2], audioTemplate, subtitleTemplate, workers=8,
+            runOutput=switcher.RunOutput(quiet=True))
+"""
+import importlib.util
+import os.path
+import sys
+
+_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "plex-audio-subtitle-switcher.py")
+_spec = importlib.util.spec_from_file_location(__name__, _path)
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
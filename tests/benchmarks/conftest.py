@@ -0,0 +1,281 @@
+import re
+import zlib
+from itertools import islice
+from urllib.parse import unquote, urlsplit
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from plexapi.server import PlexServer
+import plex_audio_subtitle_switcher
+
+BASEURL = "http://synthetic.plex:32400"
+
+###############################################################################
+# Synthetic Plex Server
+###############################################################################
+
+
+class SyntheticPlexAdapter(BaseAdapter):
+    """ Transport adapter that answers Plex API requests with generated XML
+        for a single show, so real plexapi objects can be exercised offline.
+        Responses are built on demand, so the adapter itself holds no per-
+        episode state however large the show is.
+
+        Parameters:
+            seasons(int): Number of seasons in the show.
+            episodes(int): Number of episodes in each season.
+            audio(int): Number of audio streams in each episode.
+            subtitles(int): Number of subtitle streams in each episode.
+            shows(int): Number of shows listed in the library. Only the first
+                has seasons and episodes.
+            watched(int): Number of episodes at the start of each season
+                that have been watched.
+            onDeck(list<tuple>): (season, index) of the episodes on deck.
+            applyWrites(bool): Keep the streams set by PUT requests and
+                report them as selected. Off by default, so the adapter holds
+                no per-part state.
+            ignoreWrites(int): Number of PUT requests to accept without
+                applying, with applyWrites.
+            versions(int): Number of media versions of each episode. Part
+                ids of later versions are offset by 10 ** 8.
+    """
+
+    SHOW_KEY = 1
+
+    def __init__(self, seasons=1, episodes=10, audio=2, subtitles=3,
+                 shows=1, watched=0, onDeck=(), applyWrites=False,
+                 ignoreWrites=0, versions=1):
+        super().__init__()
+        self.shows = shows
+        self.seasons = seasons
+        self.episodes = episodes
+        self.audio = audio
+        self.subtitles = subtitles
+        self.watched = watched
+        self.onDeck = list(onDeck)
+        self.applyWrites = applyWrites
+        self.ignoreWrites = ignoreWrites
+        self.selected = {}
+        self.versions = versions
+        self.bytes = 0
+        self.requests = 0
+        self.writes = 0
+
+    def close(self):
+        pass
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        url = urlsplit(request.url)
+        params = dict(p.split("=", 1) for p in url.query.split("&") if p)
+        if request.method == "PUT":
+            self.writes += 1
+            body = ""
+            if self.applyWrites and self.writes > self.ignoreWrites:
+                part = int(re.search(r"/parts/(\d+)", url.path).group(1))
+                streams = self.selected.setdefault(part, {})
+                for streamType, name in ((2, "audioStreamID"),
+                                         (3, "subtitleStreamID")):
+                    if name in params:
+                        streams[streamType] = int(params[name])
+        else:
+            body = self.route(url.path, params)
+        etag = '"%08x"' % zlib.crc32(body.encode("utf8"))
+        response = requests.Response()
+        response.status_code = 200
+        if request.headers.get("If-None-Match") == etag:
+            response.status_code = 304
+            body = ""
+        response._content = body.encode("utf8")
+        response._content_consumed = True
+        self.bytes += len(response._content)
+        response.encoding = "utf-8"
+        response.headers = CaseInsensitiveDict({"Content-Type": "text/xml",
+                                                "ETag": etag})
+        response.url = request.url
+        response.request = request
+        return response
+
+    # An episode of another show and a movie, both on deck
+    OTHER_ON_DECK = (
+        '<Video ratingKey="9000001" key="/library/metadata/9000001" '
+        'parentRatingKey="9000010" grandparentRatingKey="9000000" '
+        'type="episode" title="Other Episode" index="1" parentIndex="1" '
+        'grandparentTitle="Other Show" />'
+        '<Video ratingKey="9000002" key="/library/metadata/9000002" '
+        'type="movie" title="Synthetic Movie" />')
+
+    def route(self, path, params):
+        if path == "/":
+            return ('<MediaContainer friendlyName="Synthetic" '
+                    'machineIdentifier="synthetic" version="1.20.0" />')
+        if path == "/library":
+            return '<MediaContainer size="0" title1="Plex Library" />'
+        if path == "/library/sections":
+            return ('<MediaContainer size="1"><Directory key="1" '
+                    'type="show" title="TV Shows" /></MediaContainer>')
+        if path == "/library/sections/1/all" and params.get("type") == "4":
+            return self.allEpisodesXml(params)
+        if path == "/library/sections/1/all":
+            return self.libraryXml(params)
+        if path in ("/library/onDeck", "/library/sections/1/onDeck"):
+            # Listed for every show, as the filter may not be honoured
+            return '<MediaContainer size="%d">%s%s</MediaContainer>' % (
+                len(self.onDeck) + 2, "".join(
+                    self.episodeXml(season, index)
+                    for season, index in self.onDeck), self.OTHER_ON_DECK)
+        match = re.match(r"^/library/metadata/([\d,]+)(/children)?$", path)
+        if "," in match.group(1):
+            keys = [int(k) - 10 ** 6 for k in match.group(1).split(",")]
+            return '<MediaContainer size="%d">%s</MediaContainer>' % (
+                len(keys), "".join(self.episodeXml(*divmod(k, 10 ** 5),
+                                                   streams=True)
+                                   for k in keys))
+        key = int(match.group(1))
+        if key == self.SHOW_KEY:
+            return self.seasonsXml() if match.group(2) else self.showXml()
+        if match.group(2):
+            start = int(params.get("X-Plex-Container-Start", 0))
+            size = int(params.get("X-Plex-Container-Size", self.episodes))
+            return self.episodesXml(key - 1000, start, size)
+        season, index = divmod(key - 10 ** 6, 10 ** 5)
+        lean = "Role" in unquote(params.get("excludeElements", ""))
+        return ('<MediaContainer size="1">%s</MediaContainer>' %
+                self.episodeXml(season, index, streams=True, lean=lean))
+
+    def libraryXml(self, params):
+        search = unquote(params.get("title", "")).lower()
+        titles = ((i, "Synthetic Show" if i == 1 else "Show %05d" % i)
+                  for i in range(1, self.shows + 1))
+        matches = ((i, t) for i, t in titles if search in t.lower())
+        start = int(params.get("X-Plex-Container-Start", 0))
+        size = int(params.get("X-Plex-Container-Size", self.shows))
+        page = list(islice(matches, start, start + size))
+        directories = "".join(
+            self.showXml()[len('<MediaContainer size="1">'):
+                           -len('</MediaContainer>')] if i == 1 else
+            '<Directory ratingKey="%d" key="/library/metadata/%d/children" '
+            'type="show" title="%s" leafCount="0" childCount="0" />' % (
+                10 ** 9 + i, 10 ** 9 + i, title)
+            for i, title in page)
+        return '<MediaContainer size="%d">%s</MediaContainer>' % (
+            len(page), directories)
+
+    def allEpisodesXml(self, params):
+        start = int(params.get("X-Plex-Container-Start", 0))
+        size = int(params.get("X-Plex-Container-Size", 10 ** 9))
+        total = self.seasons * self.episodes
+        videos = "".join(self.episodeXml(i // self.episodes + 1,
+                                         i % self.episodes + 1)
+                         for i in range(start, min(start + size, total)))
+        return ('<MediaContainer size="%d" totalSize="%d">%s'
+                '</MediaContainer>' % (
+                    max(min(size, total - start), 0), total, videos))
+
+    def showXml(self):
+        return ('<MediaContainer size="1"><Directory ratingKey="%d" '
+                'key="/library/metadata/%d/children" type="show" '
+                'guid="com.plexapp.agents.thetvdb://1?lang=en" '
+                'title="Synthetic Show" leafCount="%d" childCount="%d" />'
+                '</MediaContainer>' % (self.SHOW_KEY, self.SHOW_KEY,
+                                       self.seasons * self.episodes,
+                                       self.seasons))
+
+    def seasonsXml(self):
+        seasons = "".join(
+            '<Directory ratingKey="%d" key="/library/metadata/%d/children" '
+            'parentRatingKey="%d" type="season" title="Season %d" index="%d" '
+            'leafCount="%d" />' % (1000 + s, 1000 + s, self.SHOW_KEY, s, s,
+                                   self.episodes)
+            for s in range(1, self.seasons + 1))
+        return '<MediaContainer size="%d">%s</MediaContainer>' % (
+            self.seasons, seasons)
+
+    def episodesXml(self, season, start, size):
+        end = min(start + size, self.episodes)
+        videos = "".join(self.episodeXml(season, e)
+                         for e in range(start + 1, end + 1))
+        return ('<MediaContainer size="%d" totalSize="%d">%s'
+                '</MediaContainer>' % (
+                    max(end - start, 0), self.episodes, videos))
+
+    def episodeXml(self, season, index, streams=False, lean=False):
+        key = 10 ** 6 + season * 10 ** 5 + index
+        media = "".join(self.mediaXml(key, season, index, version, streams)
+                        for version in range(self.versions))
+        if streams and not lean:
+            media += ''.join('<Role tag="Actor %d" />' % r for r in range(10))
+        return (
+            '<Video ratingKey="%d" key="/library/metadata/%d" '
+            'parentRatingKey="%d" grandparentRatingKey="%d" type="episode" '
+            'title="Episode %d" index="%d" parentIndex="%d" '
+            'updatedAt="1600000000" viewCount="%d" '
+            'grandparentTitle="Synthetic Show" summary="%s">%s</Video>' % (
+                key, key, 1000 + season, self.SHOW_KEY, index, index, season,
+                int(index <= self.watched),
+                "" if lean else "Lorem ipsum " * 20, media))
+
+    def mediaXml(self, key, season, index, version, streams):
+        # Later versions list their audio tracks in reverse order
+        part = key + version * 10 ** 8
+        elements = ""
+        selected = self.selected.get(part, {})
+        audioId = selected.get(2, part * 100 + 1)
+        subtitleId = selected.get(3, 0)
+        if streams:
+            elements += '<Stream id="%d" streamType="1" codec="h264" ' \
+                        'index="0" />' % (part * 100)
+            audio = range(1, self.audio + 1)
+            for a in reversed(audio) if version % 2 else audio:
+                elements += (
+                    '<Stream id="%d" streamType="2" codec="%s" index="%d" '
+                    'languageCode="%s" title="%s" audioChannelLayout="%s" '
+                    '%s/>' % (part * 100 + a, "ac3" if a % 2 else "aac", a,
+                              "eng" if a % 2 else "jpn",
+                              "Surround" if a % 2 else "Stereo",
+                              "5.1(side)" if a % 2 else "stereo",
+                              'selected="1" ' if part * 100 + a == audioId
+                              else ""))
+            for t in range(1, self.subtitles + 1):
+                elements += (
+                    '<Stream id="%d" streamType="3" codec="srt" index="%d" '
+                    'languageCode="eng" title="%s" forced="%d" %s/>' % (
+                        part * 100 + 50 + t,
+                        self.audio + t if t < self.subtitles else -1,
+                        "Signs" if t == 1 else "Full", int(t == 1),
+                        'selected="1" ' if part * 100 + 50 + t == subtitleId
+                        else ""))
+        return ('<Media id="%d"><Part id="%d" '
+                'key="/library/parts/%d/file.mkv" '
+                'file="/tv/Synthetic Show/S%02dE%02d%s.mkv">%s</Part></Media>'
+                % (part, part, part, season, index,
+                   " v%d" % (version + 1) if version else "", elements))
+
+
+###############################################################################
+# Fixtures
+###############################################################################
+
+
+@pytest.fixture(scope='session')
+def switcher():
+    return plex_audio_subtitle_switcher
+
+
+###############################################################################
+# Helper Functions
+###############################################################################
+
+
+def synthetic_server(**shape):
+    """ Returns a (:class:`~plexapi.server.PlexServer`, SyntheticPlexAdapter)
+        pair for a synthetic show with the given shape.
+
+        Parameters:
+            shape(dict): Keyword arguments for SyntheticPlexAdapter.
+    """
+    adapter = SyntheticPlexAdapter(**shape)
+    session = requests.Session()
+    session.mount(BASEURL, adapter)
+    return PlexServer(BASEURL, "synthetic-token", session=session), adapter
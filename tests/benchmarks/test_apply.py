@@ -0,0 +1,38 @@
+import random
+import time
+from .conftest import synthetic_server
+
+
+def test_apply_result_counts_in_episode_order(switcher, monkeypatch):
+    server, adapter = synthetic_server(seasons=1, episodes=20)
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audio, subtitles = switcher.createTemplates(part, 2, 4)
+    setPartStreams = switcher.setPartStreams
+
+    # Finish writes out of order, and fail every fourth episode
+    def scrambled(plexServer, match):
+        time.sleep(random.random() / 100)
+        if match.episode.index % 4 == 0:
+            raise switcher.BadRequest("Rejected.")
+        setPartStreams(plexServer, match)
+    monkeypatch.setattr(switcher, "setPartStreams", scrambled)
+
+    run_output = switcher.RunOutput(quiet=True)
+    successes = switcher.output.successes
+    result = switcher.applyTemplates(show, [1], audio, subtitles, workers=8,
+                                     runOutput=run_output)
+
+    failed = [switcher.episodeToString(episode)
+              for episode in show.season(1).episodes()
+              if episode.index % 4 == 0]
+    assert result.parts == 20
+    assert result.audioSet == result.subtitlesSet == 15
+    assert result.failed == failed
+    assert result.unmatched == [] and result.unverified == []
+    assert result.verified == 0
+
+    # Per-part lines went to the given writer, in the same order
+    assert run_output.successes == 30
+    assert [line.split("'")[1] for line in run_output.failures] == failed
+    assert switcher.output.successes == successes
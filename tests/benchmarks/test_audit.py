@@ -0,0 +1,74 @@
+import csv
+import json
+import os
+from contextlib import redirect_stdout
+import pytest
+import requests
+from .conftest import synthetic_server
+
+
+def audit(switcher, path, rules=None, **shape):
+    server, adapter = synthetic_server(**shape)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        count = switcher.auditLibraries(server, str(path), rules=rules,
+                                        workers=4, windowSize=20)
+    return count, adapter
+
+
+def test_audit_writes_one_json_line_per_part(switcher, tmp_path):
+    path = tmp_path / "audit.jsonl"
+    count, adapter = audit(switcher, path, seasons=3, episodes=30)
+
+    with open(str(path)) as auditFile:
+        rows = [json.loads(line) for line in auditFile]
+    assert count == len(rows) == 90
+    assert [(r["season"], r["episode"]) for r in rows] == \
+        [(s, e) for s in range(1, 4) for e in range(1, 31)]
+    assert rows[0]["show"] == "Synthetic Show"
+    assert rows[0]["part"] == 1100001
+    assert [t["language"] for t in rows[0]["audio"]] == ["eng", "jpn"]
+    assert rows[0]["subtitles"][2]["external"]
+    assert rows[0]["selectedAudio"]["id"] == 110000101
+    assert rows[0]["selectedSubtitles"] is None
+
+    # One listing page and one bulk stream fetch per 20 episodes
+    pages = -(-90 // 20)
+    assert adapter.requests <= 2 + 2 * pages + 1
+
+
+def test_audit_csv_flags_rule_violations(switcher, tmp_path):
+    path = tmp_path / "audit.csv"
+    rules = switcher.parseRules("audio: jpn; subtitles: eng full")
+    count, adapter = audit(switcher, path, rules, seasons=1, episodes=5)
+
+    with open(str(path), newline="") as auditFile:
+        rows = list(csv.DictReader(auditFile))
+    assert count == len(rows) == 5
+    assert list(rows[0]) == switcher.AUDIT_FIELDS
+    assert rows[0]["audio"] == \
+        'eng ac3 5.1(side) "Surround"; jpn aac stereo "Stereo"'
+    assert rows[0]["flags"] == "audio, subtitles"
+    assert adapter.writes == 0
+
+
+def test_audit_reports_missing_libraries(switcher, tmp_path, capsys):
+    server, adapter = synthetic_server(seasons=1, episodes=5)
+    count = switcher.auditLibraries(server, str(tmp_path / "audit.jsonl"),
+                                    ["TV Shows", "Anime"])
+    assert count == 5
+    assert "No TV library named 'Anime'" in capsys.readouterr().out
+
+
+def test_audit_request_failures_exit(switcher, tmp_path, monkeypatch,
+                                     capsys):
+    def unreachable(*args, **kwargs):
+        raise requests.ConnectionError("Server went away.")
+    server, adapter = synthetic_server(seasons=1, episodes=5)
+    monkeypatch.setattr(switcher, "signIn", lambda: server)
+    monkeypatch.setattr(switcher, "auditLibraries", unreachable)
+
+    with pytest.raises(SystemExit) as raised:
+        switcher.main(["--audit", str(tmp_path / "audit.jsonl")])
+    assert raised.value.code == 1
+    assert "Error: Could not read libraries from the server. Server went " \
+        "away." in capsys.readouterr().out
@@ -0,0 +1,54 @@
+import json
+import time
+import requests
+from plexapi.server import PlexServer
+from .conftest import BASEURL, SyntheticPlexAdapter
+
+
+def run(switcher, adapter):
+    session = requests.Session()
+    session.mount(BASEURL, adapter)
+    server = PlexServer(BASEURL, "secret-token", session=session)
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audio, subtitles = switcher.createTemplates(part, 2, 4)
+    return switcher.applyTemplates(show, [1, 2], audio, subtitles, workers=4)
+
+
+def test_record_then_replay_offline(switcher, tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    synthetic = SyntheticPlexAdapter(seasons=2, episodes=10)
+    recorder = switcher.Cassette(path, "record")
+    recorded = run(switcher, switcher.CassetteAdapter(recorder, synthetic))
+    recorder.close()
+    with open(path) as cassette_file:
+        entries = [json.loads(line) for line in cassette_file]
+    assert len(entries) == synthetic.requests
+    assert "secret-token" not in open(path).read()
+
+    # Replay without the synthetic server, without and with latency
+    player = switcher.Cassette(path, "replay", speed=0)
+    replayed = run(switcher, switcher.CassetteAdapter(player))
+    assert replayed.parts == recorded.parts == 20
+    assert replayed.audioSet == recorded.audioSet
+    assert replayed.subtitlesSet == recorded.subtitlesSet
+
+    for entry in entries:
+        entry["seconds"] = 0.01
+    with open(path, "w") as cassette_file:
+        cassette_file.write("".join(json.dumps(e) + "\n" for e in entries))
+    started = time.monotonic()
+    run(switcher, switcher.CassetteAdapter(
+        switcher.Cassette(path, "replay", speed=2)))
+    assert time.monotonic() - started >= 0.02 * len(entries) / 4
+
+
+def test_sanitize_tokens(switcher):
+    sanitize = switcher.Cassette.sanitize
+    assert sanitize('<user authToken="abc123" email="a@b.c" />') == \
+        '<user authToken="REDACTED" email="a@b.c" />'
+    assert sanitize('{"authToken": "abc123"}') == '{"authToken": "REDACTED"}'
+    assert sanitize('<Device accessToken="x" /><Server token="y" />') == \
+        '<Device accessToken="REDACTED" /><Server token="REDACTED" />'
+    assert sanitize("http://s:32400/library?X-Plex-Token=abc&a=1") == \
+        "http://s:32400/library?X-Plex-Token=REDACTED&a=1"
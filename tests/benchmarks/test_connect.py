@@ -0,0 +1,76 @@
+import time
+from types import SimpleNamespace
+import requests
+from requests.adapters import BaseAdapter
+from .conftest import BASEURL, SyntheticPlexAdapter
+
+
+class UnreachableAdapter(BaseAdapter):
+    """ Fails every request after a delay, like a connection timing out."""
+
+    def __init__(self, delay=1.0):
+        super().__init__()
+        self.delay = delay
+        self.requests = 0
+
+    def close(self):
+        pass
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        time.sleep(self.delay)
+        raise requests.ConnectionError("Timed out: %s" % request.url)
+
+
+def setup(switcher, monkeypatch, tmp_path):
+    synthetic = SyntheticPlexAdapter()
+    unreachable = UnreachableAdapter()
+
+    def createSession(settings=None):
+        session = requests.Session()
+        session.mount("http://", unreachable)
+        session.mount("https://", unreachable)
+        session.mount(BASEURL, synthetic)
+        return session
+
+    monkeypatch.setattr(switcher, "createSession", createSession)
+    resource = SimpleNamespace(
+        name="Synthetic", clientIdentifier="synthetic", owned=True,
+        accessToken="synthetic-token", connections=[
+            SimpleNamespace(local=False, uri="https://relay.plex:443",
+                            httpuri=BASEURL),
+            SimpleNamespace(local=True, uri="https://192.168.1.50:32400",
+                            httpuri="http://192.168.1.50:32400")])
+    store = switcher.ConnectionStore(str(tmp_path / "connections.json"))
+    return resource, store, synthetic, unreachable
+
+
+def test_first_connection_to_answer_wins(switcher, monkeypatch, tmp_path):
+    resource, store, synthetic, unreachable = setup(switcher, monkeypatch,
+                                                    tmp_path)
+
+    started = time.monotonic()
+    server = switcher.connectResource(resource, store=store)
+
+    assert time.monotonic() - started < unreachable.delay
+    assert server.friendlyName == "Synthetic"
+    assert server._baseurl == BASEURL
+    assert switcher.ConnectionStore(store.path).get("synthetic") == BASEURL
+
+
+def test_remembered_connection_then_fallback(switcher, monkeypatch,
+                                             tmp_path):
+    resource, store, synthetic, unreachable = setup(switcher, monkeypatch,
+                                                    tmp_path)
+
+    # The remembered connection answers alone
+    store.save("synthetic", BASEURL)
+    switcher.connectResource(resource, store=store)
+    assert synthetic.requests == 1
+    assert unreachable.requests == 0
+
+    # A remembered connection that stopped answering is replaced
+    store.save("synthetic", "https://relay.plex:443")
+    server = switcher.connectResource(resource, store=store)
+    assert server.friendlyName == "Synthetic"
+    assert store.get("synthetic") == BASEURL
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import pytest
+from .conftest import synthetic_server
+
+
+@pytest.fixture
+def daemon(switcher, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    server, adapter = synthetic_server(seasons=2, episodes=30)
+    state = switcher.SwitcherDaemon(server, workers=4)
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                      switcher.DaemonRequestHandler)
+    http_server.switcher = state
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % http_server.server_port, state, adapter
+    http_server.shutdown()
+    http_server.server_close()
+    state.close()
+
+
+def call(url, body=None):
+    data = json.dumps(body).encode("utf8") if body is not None else None
+    with urlopen(Request(url, data=data)) as response:
+        return json.loads(response.read())
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for jobs."
+        time.sleep(0.01)
+
+
+def test_warm_daemon_job_only_lists_and_writes(daemon):
+    url, state, adapter = daemon
+    request = {"library": "TV Shows", "show": "Synthetic Show",
+               "seasons": [1], "audio": 2, "subtitles": 5}
+
+    assert call(url + "/libraries") == {"TV Shows": ["Synthetic Show"]}
+    preview = call(url + "/preview", request)
+    assert len(preview) == 30
+    assert preview[0]["audio"]["language"] == "jpn"
+    assert preview[0]["subtitles"]["title"] == "Full"
+
+    # Stream metadata is warm, so a job costs listings and writes only
+    before = adapter.requests
+    job = call(url + "/jobs", request)
+    state.executor.shutdown(wait=True)
+    job = call(url + "/jobs/%d" % job["id"])
+    assert job["state"] == "done"
+    assert job["parts"] == 30 and job["done"] == 30
+    assert job["audioSet"] == 30 and job["subtitlesSet"] == 30
+    assert adapter.writes == 60
+    assert adapter.requests - before - adapter.writes < 10
+
+
+def post_webhook(url, payload):
+    boundary = "----synthetic"
+    body = ('--%s\r\nContent-Disposition: form-data; name="payload"\r\n'
+            'Content-Type: application/json\r\n\r\n%s\r\n--%s--\r\n' % (
+                boundary, json.dumps(payload), boundary)).encode("utf8")
+    request = Request(url + "/webhook", data=body, headers={
+        "Content-Type": "multipart/form-data; boundary=%s" % boundary})
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_new_episodes_are_coalesced_into_one_job(daemon):
+    url, state, adapter = daemon
+    state.webhooks.delay = 0.2
+    job = call(url + "/jobs", {"library": "TV Shows", "show": "Synthetic Show",
+                               "seasons": [1], "audio": 2, "subtitles": 5})
+    wait_until(lambda: call(url + "/jobs/%d" % job["id"])["state"] == "done")
+    before = adapter.requests
+
+    # A season landing at once, plus events the receiver should ignore
+    for episode in (1200001, 1200002, 1200003):
+        assert post_webhook(url, {
+            "event": "library.new",
+            "Server": {"uuid": "synthetic"},
+            "Metadata": {"type": "episode", "ratingKey": str(episode),
+                         "grandparentRatingKey": "1"}})["queued"]
+    assert not post_webhook(url, {"event": "media.play", "Metadata": {}})[
+        "queued"]
+    assert not post_webhook(url, {
+        "event": "library.new", "Server": {"uuid": "other"},
+        "Metadata": {"type": "episode", "ratingKey": "1200004",
+                     "grandparentRatingKey": "1"}})["queued"]
+
+    wait_until(lambda: [job["state"] for job in call(url + "/jobs")] ==
+               ["done", "done"])
+    new = call(url + "/jobs")[1]
+    assert new["state"] == "done" and new["seasons"] == [2]
+    assert new["parts"] == 3 and new["audioSet"] == 3
+    assert new["subtitlesSet"] == 3
+    # One bulk fetch of the new episodes, the show and the writes
+    assert adapter.requests - before == 2 + 6
+
+
+def test_other_computers_only_reach_webhook(switcher, daemon, monkeypatch):
+    url, state, adapter = daemon
+    monkeypatch.setattr(switcher.DaemonRequestHandler, "_isLocal",
+                        lambda handler: False)
+    request = {"library": "TV Shows", "show": "Synthetic Show",
+               "audio": 2, "subtitles": 5}
+
+    for path, body in (("/libraries", None), ("/jobs", None),
+                       ("/jobs/1", None), ("/jobs", request),
+                       ("/preview", request)):
+        with pytest.raises(HTTPError) as error:
+            call(url + path, body)
+        assert error.value.code == 403
+    assert not state.jobs()
+    assert adapter.writes == 0
+
+    # Plex can still deliver webhooks
+    assert not post_webhook(url, {"event": "media.play", "Metadata": {}})[
+        "queued"]
+
+
+def test_unexpected_errors_are_reported_as_json(daemon, monkeypatch):
+    url, state, adapter = daemon
+
+    def broken():
+        raise KeyError("TV Shows")
+    monkeypatch.setattr(state, "libraries", broken)
+
+    with pytest.raises(HTTPError) as error:
+        call(url + "/libraries")
+    assert error.value.code == 500
+    assert "TV Shows" in json.loads(error.value.read())["error"]
+    # The daemon keeps serving
+    assert call(url + "/jobs") == []
+
+
+def test_job_problems_are_not_kept_after_the_job(switcher, daemon,
+                                                 monkeypatch, capsys):
+    url, state, adapter = daemon
+    monkeypatch.setattr(switcher, "output", switcher.RunOutput())
+
+    def rejected(plexServer, match):
+        raise switcher.BadRequest("Rejected.")
+    monkeypatch.setattr(switcher, "setPartStreams", rejected)
+
+    job = call(url + "/jobs", {"library": "TV Shows", "show": "Synthetic Show",
+                               "seasons": [1], "audio": 2, "subtitles": 5})
+    state.executor.shutdown(wait=True)
+    job = call(url + "/jobs/%d" % job["id"])
+
+    assert job["state"] == "done" and len(job["failed"]) == 30
+    assert switcher.output.failures == []
+    assert "Summary: 0 tracks set, 30 problems." in capsys.readouterr().out
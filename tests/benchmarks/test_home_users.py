@@ -0,0 +1,75 @@
+import os
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from .conftest import synthetic_server
+
+
+class HomeUser:
+    home = True
+
+    def __init__(self, title):
+        self.title = title
+
+    def get_token(self, machineIdentifier):
+        return "token-%s" % self.title.lower()
+
+
+def sign_in(switcher, monkeypatch, givenUsers, answers=()):
+    server, adapter = synthetic_server(seasons=1, episodes=5)
+    account = SimpleNamespace(users=lambda: [
+        HomeUser("Alice"), HomeUser("Bob"), HomeUser("Carol")])
+    monkeypatch.setattr(server, "myPlexAccount", lambda: account)
+    answers = iter(answers)
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+
+    # Note the token each write is sent with
+    tokens = []
+    send = adapter.send
+
+    def record(request, **kwargs):
+        if request.method == "PUT":
+            tokens.append(request.headers["X-Plex-Token"])
+        return send(request, **kwargs)
+
+    monkeypatch.setattr(adapter, "send", record)
+    servers = switcher.signInHomeUsers(server, givenUsers)
+    return server, servers, tokens
+
+
+def test_every_user_receives_each_write(switcher, monkeypatch):
+    server, servers, tokens = sign_in(switcher, monkeypatch, "alice,Bob")
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audio, subtitles = switcher.createTemplates(part, 2, 4)
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = switcher.applyTemplates(show, [1], audio, subtitles,
+                                         servers=servers, workers=2)
+
+    assert result.parts == 5
+    # Audio and subtitles of each part, for both users
+    assert sorted(set(tokens)) == ["token-alice", "token-bob"]
+    assert tokens.count("token-alice") == tokens.count("token-bob") == 10
+
+
+def test_empty_user_names_are_rejected(switcher, monkeypatch, capsys):
+    server, servers, tokens = sign_in(switcher, monkeypatch, "alice,,bob",
+                                      answers=["carol"])
+    assert "Error: Empty user name in 'alice,,bob'." in \
+        capsys.readouterr().out
+    assert [s._token for s in servers] == ["token-carol"]
+
+
+def test_runs_for_users_save_no_snapshot(switcher, monkeypatch, tmp_path,
+                                         capsys):
+    monkeypatch.chdir(tmp_path)
+    server, servers, tokens = sign_in(switcher, monkeypatch, "alice")
+    rules = switcher.parseRules("audio: jpn; subtitles: eng full")
+
+    switcher.sweepLibraries(server, rules, servers=servers, workers=2)
+
+    out = capsys.readouterr().out
+    assert "--rollback" not in out
+    assert "can't be rolled back" in out
+    assert not os.listdir(str(tmp_path))
+    assert set(tokens) == {"token-alice"}
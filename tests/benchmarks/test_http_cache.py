@@ -0,0 +1,46 @@
+import requests
+from plexapi.server import PlexServer
+from .conftest import BASEURL, SyntheticPlexAdapter
+
+EPISODE = "/library/metadata/%d" % (10 ** 6 + 10 ** 5 + 1)
+OTHER_EPISODE = "/library/metadata/%d" % (10 ** 6 + 10 ** 5 + 2)
+
+
+def cached_server(switcher, ttl, token="token"):
+    synthetic = SyntheticPlexAdapter(seasons=1, episodes=5)
+    cache = switcher.CachingAdapter(synthetic, ttl=ttl)
+    session = requests.Session()
+    session.mount(BASEURL, cache)
+    return PlexServer(BASEURL, token, session=session), cache, synthetic
+
+
+def test_repeat_gets_are_served_from_memory(switcher):
+    server, cache, synthetic = cached_server(switcher, ttl=60)
+    part = server.fetchItem(EPISODE).media[0].parts[0]
+    server.fetchItem(OTHER_EPISODE)
+    before = synthetic.requests
+    assert server.fetchItem(EPISODE).media[0].parts[0].id == part.id
+    assert synthetic.requests == before and cache.hits == 1
+
+    # A write drops only the responses containing the written part
+    switcher.setPartStreamIds(server, part.id, audioStreamId=part.id * 100 + 2)
+    before = synthetic.requests
+    server.fetchItem(EPISODE)
+    server.fetchItem(OTHER_EPISODE)
+    assert synthetic.requests == before + 1
+    assert cache.hits == 2
+
+    # Each user token has its own entries
+    other_user = PlexServer(BASEURL, "other-token", session=server._session)
+    before = synthetic.requests
+    other_user.fetchItem(EPISODE)
+    assert synthetic.requests == before + 1
+
+
+def test_expired_responses_are_revalidated(switcher):
+    server, cache, synthetic = cached_server(switcher, ttl=0.000001)
+    first = server.fetchItem(EPISODE)
+    second = server.fetchItem(EPISODE)
+    assert cache.revalidations == 1 and cache.hits == 0
+    assert [s.id for s in second.media[0].parts[0].streams] == \
+        [s.id for s in first.media[0].parts[0].streams]
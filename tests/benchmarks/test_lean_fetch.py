@@ -0,0 +1,25 @@
+from .conftest import synthetic_server
+
+
+def stream_fields(part):
+    return [(s.id, s.streamType, s.codec, s.languageCode, s.title,
+             s.selected, s.index) for s in part.streams]
+
+
+def test_fetch_streams_matches_full_reload(switcher):
+    server, adapter = synthetic_server(audio=3, subtitles=5)
+    full = server.fetchItem(1).season(1).episodes()[0]
+    lean = server.fetchItem(1).season(1).episodes()[0]
+
+    before = adapter.bytes
+    full.reload()
+    full_bytes = adapter.bytes - before
+    before = adapter.bytes
+    assert switcher.fetchStreams(lean) is lean
+    lean_bytes = adapter.bytes - before
+
+    assert [p.id for p in lean.media[0].parts] == \
+        [p.id for p in full.media[0].parts]
+    assert stream_fields(lean.media[0].parts[0]) == \
+        stream_fields(full.media[0].parts[0])
+    assert lean_bytes < full_bytes * 0.8
@@ -0,0 +1,133 @@
+import random
+from functools import partial
+from xml.etree import ElementTree
+import pytest
+from plexapi.media import MediaPart
+
+pytest.importorskip("pytest_benchmark")
+
+AUDIO_LANGUAGES = ["jpn", "eng", "spa", "fre", "ger", "ita", "por", "rus"]
+AUDIO_CODECS = ["aac", "ac3", "eac3", "dca", "truehd", "flac"]
+AUDIO_LAYOUTS = ["stereo", "5.1(side)", "7.1", "mono"]
+AUDIO_TITLES = ["", "Stereo", "Surround 5.1", "Commentary", "Dolby TrueHD",
+                "Original Japanese"]
+SUBTITLE_LANGUAGES = ["eng", "spa", "fre", "ger", "ita", "por", "rus", "ara",
+                      "chi", "jpn", "kor", "pol", "tur", "swe", "nor", "dan",
+                      "fin", "dut", "hun", "cze"]
+SUBTITLE_CODECS = ["srt", "ass", "pgs"]
+SUBTITLE_TITLES = ["", "Full", "Signs & Songs", "SDH", "Forced",
+                   "English [CC]", "Full Subtitles (Fansub)"]
+
+# (audio, subtitles) stream counts, from a plain rip to multi-language anime
+SHAPES = [(1, 0), (2, 3), (4, 12), (8, 40)]
+SHAPE_IDS = ["%da-%ds" % shape for shape in SHAPES]
+
+
+def synthetic_part(audio, subtitles, seed=0, variant=None):
+    """ Returns a plexapi MediaPart with the given number of audio and
+        subtitle streams, with languages, codecs and titles drawn from
+        realistic pools. Parts with the same variant (default = seed) have
+        the same stream layout."""
+    rng = random.Random(seed if variant is None else variant)
+    streams = ['<Stream id="%d" streamType="1" codec="h264" index="0" />'
+               % (seed * 100)]
+    for a in range(1, audio + 1):
+        streams.append(
+            '<Stream id="%d" streamType="2" codec="%s" index="%d" '
+            'languageCode="%s" title="%s" audioChannelLayout="%s" />' % (
+                seed * 100 + a, rng.choice(AUDIO_CODECS), a,
+                AUDIO_LANGUAGES[(a - 1) % len(AUDIO_LANGUAGES)],
+                rng.choice(AUDIO_TITLES), rng.choice(AUDIO_LAYOUTS)))
+    for t in range(1, subtitles + 1):
+        external = t > subtitles - subtitles // 8
+        streams.append(
+            '<Stream id="%d" streamType="3" codec="%s" index="%d" '
+            'languageCode="%s" title="%s" forced="%d" />' % (
+                seed * 100 + 50 + t, rng.choice(SUBTITLE_CODECS),
+                -1 if external else audio + t,
+                SUBTITLE_LANGUAGES[(t - 1) // 2 % len(SUBTITLE_LANGUAGES)],
+                rng.choice(SUBTITLE_TITLES).replace("&", "&amp;"),
+                int(rng.random() < 0.1)))
+    data = ElementTree.fromstring('<Part id="%d">%s</Part>' % (
+        seed, "".join(streams)))
+    return MediaPart(None, data)
+
+
+def season_parts(audio, subtitles, episodes=24):
+    """ Returns the parts of a season. Like a real season, most episodes
+        share a stream layout, with a few releases that differ."""
+    return [synthetic_part(audio, subtitles, seed,
+                           variant=0 if seed % 6 else seed)
+            for seed in range(1, episodes + 1)]
+
+
+def templates(switcher, audio, subtitles):
+    """ Returns (audioTemplate, subtitleTemplate) chosen from a sample part
+        of the given shape: its last audio and second subtitle track."""
+    sample = synthetic_part(audio, subtitles, seed=1000)
+    return switcher.createTemplates(
+        sample, audio, audio + min(2, subtitles) if subtitles else None)
+
+
+@pytest.mark.parametrize("shape", SHAPES, ids=SHAPE_IDS)
+def test_match_audio(benchmark, switcher, shape):
+    part = synthetic_part(*shape, seed=7)
+    audioTemplate, subtitleTemplate = templates(switcher, *shape)
+    benchmark(switcher.matchAudio, part, audioTemplate)
+
+
+@pytest.mark.parametrize("shape", SHAPES[1:], ids=SHAPE_IDS[1:])
+def test_match_subtitles(benchmark, switcher, shape):
+    part = synthetic_part(*shape, seed=7)
+    audioTemplate, subtitleTemplate = templates(switcher, *shape)
+    benchmark(switcher.matchSubtitles, part, subtitleTemplate)
+
+
+@pytest.mark.parametrize("shape", SHAPES, ids=SHAPE_IDS)
+def test_organized_streams(benchmark, switcher, shape):
+    part = synthetic_part(*shape, seed=7)
+    benchmark(switcher.OrganizedStreams, part)
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "cached"])
+@pytest.mark.parametrize("shape", SHAPES[1:], ids=SHAPE_IDS[1:])
+def test_match_season(benchmark, switcher, shape, cached):
+    parts = season_parts(*shape)
+    audioTemplate, subtitleTemplate = templates(switcher, *shape)
+
+    def matchSeason():
+        matchCache = switcher.MatchCache() if cached else None
+        audioMatcher = partial(
+            matchCache.matchAudio if cached else switcher.matchAudio,
+            template=audioTemplate)
+        subtitleMatcher = partial(
+            matchCache.matchSubtitles if cached else switcher.matchSubtitles,
+            template=subtitleTemplate)
+        for match in switcher.matchParts(((None, part) for part in parts),
+                                         audioMatcher, subtitleMatcher):
+            pass
+
+    benchmark(matchSeason)
+
+
+@pytest.mark.parametrize("prefix", ["", "the", "zzz"])
+def test_complete_titles(benchmark, switcher, prefix):
+    readline = switcher.readline
+    rng = random.Random(0)
+    words = ["The", "Of", "Star", "Night", "House", "Dragon", "City", "Last",
+             "Blue", "Game", "Wire", "Office", "Lost", "Crown", "Dark"]
+    titles = ["%s %s %d" % (rng.choice(words), rng.choice(words), i)
+              for i in range(10000)]
+    switcher.enableAutoComplete(titles)
+    complete = readline.get_completer()
+
+    def tab():
+        # Readline asks for matches one state at a time until None
+        state = 0
+        while state < 200 and complete(prefix, state) is not None:
+            state += 1
+
+    try:
+        benchmark(tab)
+    finally:
+        switcher.disableAutoComplete()
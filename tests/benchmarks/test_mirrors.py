@@ -0,0 +1,104 @@
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+import requests
+from .conftest import BASEURL, SyntheticPlexAdapter, synthetic_server
+
+GUID = "com.plexapp.agents.thetvdb://1?lang=en"
+
+
+def test_mirrored_show_is_found_by_guid_then_title(switcher):
+    server, adapter = synthetic_server(shows=3)
+
+    show = switcher.findMirroredShow(server, SimpleNamespace(
+        title="Synthetic Show", guid=GUID))
+    assert show.ratingKey == 1
+    renamed = switcher.findMirroredShow(server, SimpleNamespace(
+        title="SYNTHETIC SHOW", guid="plex://show/other"))
+    assert renamed.ratingKey == 1
+    assert switcher.findMirroredShow(server, SimpleNamespace(
+        title="Missing Show", guid=GUID)) is None
+
+
+def test_configured_servers_inherit_network_settings(switcher, monkeypatch,
+                                                     tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config.ini").write_text(
+        "[NETWORK]\nPOOL_SIZE: 4\nRATE_LIMIT: 8\nTIMEOUT: 12\n\n"
+        "[SERVER Backup]\nPLEX_URL: %s\nPLEX_TOKEN: backup-token\n"
+        "RATE_LIMIT: 2\nTIMEOUT: \n" % BASEURL)
+    server, adapter = synthetic_server()
+
+    # Connect through the synthetic server, noting the settings used
+    used = []
+
+    def createSession(settings=None):
+        used.append(settings)
+        session = requests.Session()
+        session.mount(BASEURL, SyntheticPlexAdapter())
+        return session
+
+    def offline():
+        raise AssertionError("The account was asked for its servers.")
+
+    monkeypatch.setattr(switcher, "createSession", createSession)
+    monkeypatch.setattr(server, "myPlexAccount", offline)
+    mirrors = switcher.signInServers(server, "backup")
+
+    assert [mirror._token for mirror in mirrors] == ["backup-token"]
+    assert used[0]["POOL_SIZE"] == "4"
+    assert used[0]["RATE_LIMIT"] == "2"
+    assert used[0]["TIMEOUT"] == "12"
+
+
+def test_rate_limit_spaces_out_requests(switcher, monkeypatch):
+    sent = []
+
+    def send(adapter, request, **kwargs):
+        sent.append(time.monotonic())
+        return requests.Response()
+
+    monkeypatch.setattr(switcher.HTTPAdapter, "send", send)
+    adapter = switcher.RateLimitAdapter(20)
+    request = requests.Request("GET", BASEURL).prepare()
+    threads = [threading.Thread(target=adapter.send, args=(request,))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    gaps = [b - a for a, b in zip(sorted(sent), sorted(sent)[1:])]
+    assert len(sent) == 5
+    assert min(gaps) > 0.04
+
+
+def test_rules_sweep_every_mirror(switcher, monkeypatch, tmp_path, capsys):
+    monkeypatch.chdir(tmp_path)
+    server, adapter = synthetic_server(seasons=1, episodes=5)
+    mirror, mirrorAdapter = synthetic_server(seasons=1, episodes=5)
+    mirror.mirrorName = "Backup"
+    monkeypatch.setattr(switcher, "signIn", lambda: server)
+    monkeypatch.setattr(switcher, "signInServers",
+                        lambda plex, names: [mirror])
+
+    switcher.main(["--rules", "audio: jpn; subtitles: eng full",
+                   "--servers", "backup"])
+
+    assert adapter.writes == mirrorAdapter.writes == 10
+    assert capsys.readouterr().out.count('--servers "Backup"') == 1
+
+
+def test_servers_are_refused_for_daemon_and_audit(switcher, monkeypatch,
+                                                  capsys):
+    def signIn():
+        raise AssertionError("Signed in before checking options.")
+    monkeypatch.setattr(switcher, "signIn", signIn)
+
+    for option in (["--daemon"], ["--audit", "audit.jsonl"]):
+        with pytest.raises(SystemExit) as raised:
+            switcher.main(option + ["--servers", "backup"])
+        assert raised.value.code == 1
+        assert "--servers can't be combined with %s" % option[0] in \
+            capsys.readouterr().out
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+
+def test_run_output_quiet(switcher, capsys, tmp_path):
+    log = tmp_path / "run.log"
+    run_output = switcher.RunOutput(quiet=True, logPath=str(log))
+    run_output.success("Set audio 'English' for 'S01E01 - Pilot'")
+    run_output.problem("No audio matches found for 'S01E02 - Two'")
+    assert capsys.readouterr().out == ""
+
+    run_output.summary()
+    run_output.close()
+    assert capsys.readouterr().out == "Summary: 1 tracks set, 1 problems.\n" \
+                                      "\tNo audio matches found for " \
+                                      "'S01E02 - Two'\n"
+    assert len(log.read_text().splitlines()) == 2
+
+
+def test_run_output_buffers_per_part_lines_off_a_terminal(switcher, capsys):
+    run_output = switcher.RunOutput()
+    run_output.success("Set audio 'English' for 'S01E01 - Pilot'")
+    run_output.problem("No audio matches found for 'S01E02 - Two'")
+    assert capsys.readouterr().out == ""
+
+    # Written out in order, ahead of the summary
+    run_output.summary()
+    assert capsys.readouterr().out.splitlines() == [
+        "Set audio 'English' for 'S01E01 - Pilot'",
+        "No audio matches found for 'S01E02 - Two'",
+        "Summary: 1 tracks set, 1 problems."]
+
+    run_output.success("Set audio 'English' for 'S01E03 - Three'")
+    run_output.flush()
+    assert capsys.readouterr().out == \
+        "Set audio 'English' for 'S01E03 - Three'\n"
+
+
+def test_log_and_snapshot_files_are_utf8(tmp_path):
+    # Without a UTF-8 locale, e.g. on Windows, open() would default to
+    # another encoding. Titles are escaped to keep the command ASCII.
+    script = (
+        "from types import SimpleNamespace\n"
+        "import plex_audio_subtitle_switcher as switcher\n"
+        "run_output = switcher.RunOutput(True, 'run.log')\n"
+        "run_output.success(\"Set audio for '\\u9032\\u6483 S01E01'\")\n"
+        "run_output.close()\n"
+        "server = SimpleNamespace(machineIdentifier='m',\n"
+        "                         friendlyName='\\u30b5\\u30fc\\u30d0',\n"
+        "                         _session=SimpleNamespace(put=None))\n"
+        "snapshot = switcher.StreamSnapshot('snapshot.tsv', server)\n"
+        "snapshot.record(SimpleNamespace(id=1), False, False)\n"
+        "snapshot.close()\n"
+        "print(switcher.rollbackSnapshot(server, 'snapshot.tsv'))\n")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ, LC_ALL="C", PYTHONCOERCECLOCALE="0",
+               PYTHONUTF8="0", PYTHONPATH=root)
+    assert subprocess.check_output([sys.executable, "-c", script],
+                                   cwd=str(tmp_path), env=env) == b"1\n"
+    assert "進撃" in (tmp_path / "run.log").read_text("utf8")
+    assert "サーバ" in (tmp_path / "snapshot.tsv").read_text("utf8")
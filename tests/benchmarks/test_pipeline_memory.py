@@ -0,0 +1,48 @@
+import os
+import tracemalloc
+from contextlib import redirect_stdout
+import pytest
+from .conftest import synthetic_server
+
+
+def peak_memory_of_run(switcher, monkeypatch, seasons, episodes):
+    """ Runs the interactive flow over every season of a synthetic show and
+        returns (peak traced bytes, parts written).
+    """
+    plex, adapter = synthetic_server(seasons=seasons, episodes=episodes)
+    show = plex.fetchItem(1)
+    monkeypatch.setattr(switcher, "selectLibrary", lambda plex: None)
+    monkeypatch.setattr(switcher, "selectShow", lambda library: show)
+    monkeypatch.setattr(switcher, "selectSeasons",
+                        lambda show: list(range(1, seasons + 1)))
+
+    # No other episode shown, audio track 2, subtitle track 4, proceed
+    answers = iter(["n", "y", "2", "y", "4", "y"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        tracemalloc.start()
+        switcher.modifyShow(plex, switcher.MatchCache())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak, adapter.writes // 2
+
+
+@pytest.mark.timeout(600)
+def test_pipeline_memory_is_independent_of_series_length(switcher,
+                                                         monkeypatch,
+                                                         tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+    # A single long season, since listing a whole season at once is what
+    # made memory grow
+    small_peak, small_parts = peak_memory_of_run(switcher, monkeypatch, 1,
+                                                 2000)
+    large_peak, large_parts = peak_memory_of_run(switcher, monkeypatch, 1,
+                                                 20000)
+
+    print("\nPeak memory: %d parts -> %.1f KiB, %d parts -> %.1f KiB" % (
+        small_parts, small_peak / 1024, large_parts, large_peak / 1024))
+    assert small_parts == 2000
+    assert large_parts == 20000
+    assert large_peak < small_peak * 1.25
@@ -0,0 +1,41 @@
+import os
+import pstats
+import threading
+from contextlib import redirect_stdout
+from .conftest import synthetic_server
+
+
+def test_profile_covers_worker_threads_and_phases(switcher, tmp_path):
+    prefix = str(tmp_path / "run")
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        profiler = switcher.RunProfiler(prefix)
+        server, adapter = synthetic_server(seasons=2, episodes=20)
+        show = server.fetchItem(1)
+        profiler.mark("sign-in")
+        part = show.season(1).episodes()[0].reload().media[0].parts[0]
+        audio, subtitles = switcher.createTemplates(part, 2, 4)
+        profiler.mark("selection")
+        switcher.applyTemplates(show, [1, 2], audio, subtitles, workers=4)
+        profiler.mark("apply")
+        profiler.close()
+
+    assert [phase[0] for phase in profiler.phases] == \
+        ["sign-in", "selection", "apply", "exit"]
+    functions = {name for path, line, name in
+                 pstats.Stats(prefix + ".pstats").stats}
+    assert {"fetchStreams", "matchAudio", "setPartStreamIds"} <= functions
+    with open(prefix + ".txt") as report:
+        text = report.read()
+    for heading in ("Phases:", "XML parsing and plexapi objects", "Matching",
+                    "Network", "Top allocations of each phase:"):
+        assert heading in text
+
+
+def test_profile_uses_one_profile_from_python_3_12(switcher, tmp_path,
+                                                   monkeypatch):
+    # A second cProfile can't be enabled on 3.12, so none are per thread
+    monkeypatch.setattr(switcher.sys, "version_info", (3, 12, 0))
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        profiler = switcher.RunProfiler(str(tmp_path / "run"))
+        assert threading.getprofile() is None
+        profiler.close()
@@ -0,0 +1,27 @@
+import io
+from types import SimpleNamespace
+
+
+def test_progress_counts_episodes_once_all_parts_are_done(switcher,
+                                                          monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(switcher.time, "monotonic", lambda: clock[0])
+    progress = switcher.BatchProgress(4, io.StringIO())
+    episode = SimpleNamespace(ratingKey=1, media=[
+        SimpleNamespace(parts=[1, 2]), SimpleNamespace(parts=[3])])
+
+    # Two versions with three files between them make one episode
+    progress.advancePart(episode)
+    progress.advancePart(episode)
+    assert progress.done == 0
+    clock[0] = 10.0
+    progress.advancePart(episode)
+    progress.recordRequest(0.05)
+    assert progress._status() == \
+        "1/4 episodes (25%) | 0.0 episodes/s | latency 50 ms | ETA ?"
+
+    clock[0] = 20.0
+    progress.advance(2)
+    assert progress._status() == \
+        "3/4 episodes (75%) | 0.2 episodes/s | latency 50 ms | ETA 0:00:05"
+    assert progress.total == 4
@@ -0,0 +1,78 @@
+import os
+from contextlib import redirect_stdout
+import pytest
+from .conftest import synthetic_server
+
+
+def run(switcher, path, audio=2, subtitles=4, **shape):
+    server, adapter = synthetic_server(seasons=1, episodes=10,
+                                       applyWrites=True, **shape)
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audioTemplate, subtitleTemplate = switcher.createTemplates(
+        part, audio, subtitles)
+    snapshot = switcher.StreamSnapshot(str(path), server)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        switcher.applyTemplates(show, [1], audioTemplate, subtitleTemplate,
+                                snapshot=snapshot, workers=4)
+    snapshot.close()
+    return server, adapter
+
+
+def test_rollback_restores_previous_tracks(switcher, tmp_path):
+    path = tmp_path / "snapshot.tsv"
+    server, adapter = run(switcher, path)
+    assert all(streams == {2: part * 100 + 2, 3: part * 100 + 52}
+               for part, streams in adapter.selected.items())
+
+    assert switcher.rollbackSnapshot(server, str(path)) == 10
+    assert all(streams == {2: part * 100 + 1, 3: 0}
+               for part, streams in adapter.selected.items())
+
+
+def test_rollback_restores_parts_from_their_first_line(switcher, tmp_path):
+    path = tmp_path / "snapshot.tsv"
+    server, adapter = run(switcher, path)
+
+    # Record every part again, with the tracks set by the first run
+    snapshot = switcher.StreamSnapshot(str(path), server)
+    for episode in server.fetchItem(1).season(1).episodes():
+        snapshot.record(episode.reload().media[0].parts[0])
+    snapshot.close()
+
+    assert switcher.rollbackSnapshot(server, str(path)) == 10
+    assert all(streams == {2: part * 100 + 1, 3: 0}
+               for part, streams in adapter.selected.items())
+
+
+def test_rollback_leaves_unchanged_stream_types_alone(switcher, tmp_path):
+    path = tmp_path / "snapshot.tsv"
+    server, adapter = run(switcher, path, subtitles=None)
+    switcher.rollbackSnapshot(server, str(path))
+
+    # Only audio was changed, so subtitles are never written
+    assert all(streams == {2: part * 100 + 1}
+               for part, streams in adapter.selected.items())
+    assert adapter.writes == 10 + 10
+
+
+def test_rollback_restores_mirror_snapshots_on_the_mirror(switcher,
+                                                          tmp_path):
+    path = tmp_path / "snapshot.tsv"
+    mirror, adapter = run(switcher, path)
+    main, mainAdapter = synthetic_server(applyWrites=True)
+    main.machineIdentifier = "main"
+
+    with pytest.raises(ValueError):
+        switcher.rollbackSnapshot(main, str(path))
+    assert switcher.rollbackSnapshot(main, str(path), [mirror]) == 10
+    assert all(streams == {2: part * 100 + 1, 3: 0}
+               for part, streams in adapter.selected.items())
+    assert not mainAdapter.selected
+
+
+def test_rollback_refuses_users(switcher, capsys):
+    with pytest.raises(SystemExit) as raised:
+        switcher.main(["--rollback", "snapshot.tsv", "--users", "all"])
+    assert raised.value.code == 1
+    assert "--users" in capsys.readouterr().out
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import pytest
+from .conftest import synthetic_server
+
+
+def first_part(server):
+    show = server.fetchItem(1)
+    return show.season(1).episodes()[0].reload().media[0].parts[0]
+
+
+def test_rules_choose_streams(switcher):
+    server, adapter = synthetic_server(audio=4, subtitles=3)
+    part = first_part(server)
+    key = part.id * 100
+
+    audio, subtitles, reset = switcher.parseRules(
+        "audio: jpn > eng, prefer 5.1; "
+        "subtitles: eng full, not forced, prefer internal srt")
+    assert not reset
+    assert switcher.matchAudio(part, audio).id == key + 2
+    assert switcher.matchSubtitles(part, subtitles).id == key + 52
+
+    audio, subtitles, reset = switcher.parseRules(
+        "audio: fre > eng, prefer stereo aac; subtitles: eng external")
+    assert switcher.matchAudio(part, audio).id == key + 1
+    assert switcher.matchSubtitles(part, subtitles).id == key + 53
+
+    audio, subtitles, reset = switcher.parseRules(
+        "audio: kor; subtitles: off")
+    assert switcher.matchAudio(part, audio) is None
+    assert subtitles is None and reset
+
+
+def test_preferences_keep_written_order_under_any_hash_seed():
+    # Sets iterate in hash order, which changes with PYTHONHASHSEED
+    script = (
+        "from types import SimpleNamespace as Stream\n"
+        "import plex_audio_subtitle_switcher as switcher\n"
+        "rule = switcher.StreamRule('eng, prefer internal srt')\n"
+        "print(rule.match([\n"
+        "    Stream(id=1, languageCode='eng', codec='ass', index=2,\n"
+        "           title='', forced=False),\n"
+        "    Stream(id=2, languageCode='eng', codec='srt', index=-1,\n"
+        "           title='', forced=False)]).id)\n")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    chosen = set()
+    for seed in ("1", "2", "3", "4"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        chosen.add(subprocess.check_output(
+            [sys.executable, "-c", script], cwd=root, env=env).strip())
+    assert chosen == {b"1"}
+
+
+def test_invalid_rules(switcher):
+    for text in ("audio jpn", "video: eng", "audio: prefer 5.1",
+                 "audio: japanese"):
+        with pytest.raises(ValueError):
+            switcher.parseRules(text)
+
+
+def test_sweep_applies_rules_without_sampling(switcher, monkeypatch,
+                                              tmp_path):
+    monkeypatch.chdir(tmp_path)
+    server, adapter = synthetic_server(seasons=2, episodes=20)
+    rules = switcher.parseRules(
+        "audio: jpn; subtitles: eng, not forced, prefer internal")
+    switcher.sweepLibraries(server, rules, workers=4)
+    assert adapter.writes == 2 * 40
@@ -0,0 +1,45 @@
+import tracemalloc
+from .conftest import synthetic_server
+
+
+def library_of(shows):
+    server, adapter = synthetic_server(shows=shows)
+    return server.library.section("TV Shows"), adapter
+
+
+def test_show_titles_are_listed_page_by_page(switcher):
+    library, adapter = library_of(1000)
+    before = adapter.requests
+    titles = list(switcher.iterShowTitles(library, windowSize=300))
+    assert len(titles) == 1000 and titles[0] == "Synthetic Show"
+    assert adapter.requests - before == 4
+
+    # Searches run on the server, so only matching titles are sent
+    before = adapter.bytes
+    assert list(switcher.iterShowTitles(library, "show 0099")) == \
+        ["Show %05d" % i for i in range(990, 1000)]
+    assert adapter.bytes - before < 2000
+
+
+def test_select_show_completes_from_server(switcher, monkeypatch):
+    library, adapter = library_of(5000)
+    monkeypatch.setattr("builtins.input", lambda prompt: "synthetic show")
+    assert switcher.selectShow(library).title == "Synthetic Show"
+
+    switcher.enableAutoComplete(lambda text: ["a", "b"])
+    complete = switcher.readline.get_completer()
+    assert [complete("", i) for i in range(3)] == ["a", "b", None]
+    switcher.disableAutoComplete()
+
+
+def test_listing_memory_is_flat(switcher):
+    def peak(shows):
+        library, adapter = library_of(shows)
+        tracemalloc.start()
+        for title in switcher.iterShowTitles(library):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    assert peak(20000) < peak(2000) * 1.5
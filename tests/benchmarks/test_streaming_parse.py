@@ -0,0 +1,50 @@
+import os
+from contextlib import redirect_stdout
+from xml.etree import ElementTree
+from plexapi.media import Media
+from .conftest import synthetic_server
+
+FIELDS = ["id", "streamType", "index", "languageCode", "codec", "title",
+          "audioChannelLayout", "forced", "selected"]
+
+
+def test_records_match_plexapi_parts(switcher):
+    server, adapter = synthetic_server(seasons=1, episodes=6, versions=2)
+    key = "/library/metadata/%s%s" % (
+        ",".join(str(key) for key in range(1001, 1007)),
+        switcher.STREAMS_QUERY)
+    content = b"".join(switcher.queryChunks(server, key))
+
+    # Parse a few bytes at a time, so elements span chunks
+    chunks = (content[i:i + 7] for i in range(0, len(content), 7))
+    records = list(switcher.parsePartRecords(chunks))
+    parts = [part for video in ElementTree.fromstring(content)
+             for media in video.iter("Media")
+             for part in Media(server, media, video.get("key")).parts]
+
+    assert len(records) == len(parts) == 12
+    for record, part in zip(records, parts):
+        assert record.id == part.id
+        assert record.file == part.file
+        for streams in ("audioStreams", "subtitleStreams"):
+            assert [[getattr(s, f, None) for f in FIELDS]
+                    for s in getattr(record, streams)()] == \
+                [[getattr(s, f, None) for f in FIELDS]
+                 for s in getattr(part, streams)()]
+    assert records[0].episode["ratingKey"] == "1001"
+
+
+def test_audit_parse_processes_write_the_same_rows(switcher, tmp_path):
+    rules = switcher.parseRules("audio: jpn; subtitles: eng full")
+    contents = []
+    for processes in (0, 2):
+        server, adapter = synthetic_server(seasons=2, episodes=25)
+        path = tmp_path / ("audit%d.jsonl" % processes)
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            count = switcher.auditLibraries(
+                server, str(path), rules=rules, workers=4, windowSize=20,
+                processes=processes)
+        assert count == 50
+        with open(str(path)) as auditFile:
+            contents.append(auditFile.read())
+    assert contents[0] == contents[1]
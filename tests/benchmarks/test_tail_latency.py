@@ -0,0 +1,106 @@
+import os
+import time
+from contextlib import redirect_stdout
+import requests
+from plexapi.server import PlexServer
+from .conftest import BASEURL, SyntheticPlexAdapter
+
+
+class StallingAdapter(SyntheticPlexAdapter):
+    """ Synthetic server whose first answer to one URL path stalls, and that
+        notes whether that answer is closed."""
+
+    def __init__(self, stallPath, seconds, **shape):
+        super().__init__(**shape)
+        self.seconds = seconds
+        self.stallPath = stallPath
+        self.stalled = False
+        self.stalledClosed = False
+
+    def send(self, request, **kwargs):
+        if not self.stalled and self.stallPath in request.url:
+            self.stalled = True
+            time.sleep(self.seconds)
+            response = super().send(request, **kwargs)
+            response.close = lambda: setattr(self, "stalledClosed", True)
+            return response
+        return super().send(request, **kwargs)
+
+
+class TimeoutRecorder(SyntheticPlexAdapter):
+    """ Synthetic server that notes the timeout of every request."""
+
+    def __init__(self, **shape):
+        super().__init__(**shape)
+        self.timeouts = []
+
+    def send(self, request, **kwargs):
+        self.timeouts.append(kwargs.get("timeout"))
+        return super().send(request, **kwargs)
+
+
+def server_for(switcher, adapter, **options):
+    session = requests.Session()
+    session.mount(BASEURL, switcher.HedgingAdapter(adapter, **options))
+    return PlexServer(BASEURL, "synthetic-token", session=session)
+
+
+def test_slow_get_is_hedged(switcher):
+    synthetic = StallingAdapter("/library/metadata/1100030?", 2.0,
+                                episodes=40)
+    server = server_for(switcher, synthetic, timeout=10)
+    hedging = server._session.get_adapter(BASEURL)
+    episodes = server.fetchItem(1).season(1).episodes()
+
+    started = time.monotonic()
+    for episode in episodes:
+        switcher.fetchStreams(episode)
+    assert time.monotonic() - started < 1.5
+    assert hedging.hedged >= 1
+    assert hedging.hedgeWins >= 1
+    assert hedging.hedged <= switcher.HEDGE_BUDGET * hedging.requests
+
+    # The stalled copy lost, so its response is closed once it arrives
+    deadline = time.monotonic() + 5
+    while not synthetic.stalledClosed:
+        assert time.monotonic() < deadline, "Losing response not closed."
+        time.sleep(0.05)
+
+
+def test_configured_timeout_replaces_plexapi_default(switcher):
+    synthetic = TimeoutRecorder()
+    server = server_for(switcher, synthetic, timeout=120, hedge=False)
+    server.fetchItem(1)
+    assert synthetic.timeouts == [120, 120]
+
+    # Timeouts plexapi is given explicitly still apply
+    session = server._session
+    PlexServer(BASEURL, "synthetic-token", session=session,
+               timeout=switcher.CONNECT_TIMEOUT)
+    assert synthetic.timeouts[-1] == switcher.CONNECT_TIMEOUT
+
+
+def test_deadline_stops_run_and_slow_calls_are_logged(switcher, monkeypatch,
+                                                      tmp_path):
+    synthetic = StallingAdapter("/library/parts/1100005", 0.6, episodes=40)
+    server = server_for(switcher, synthetic, hedge=False)
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audio, subtitles = switcher.createTemplates(part, 2, 4)
+    log = str(tmp_path / "run.log")
+    monkeypatch.setattr(switcher, "output",
+                        switcher.RunOutput(True, log, slowCall=0.2))
+    monkeypatch.setattr(switcher, "deadline", time.monotonic() + 0.3)
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = switcher.applyTemplates(show, [1], audio, subtitles)
+        assert switcher.output.slowCalls == 1
+        switcher.output.close()
+
+    assert 5 <= result.parts < 40
+    assert any(line.startswith("Run deadline passed.")
+               for line in switcher.output.failures)
+    with open(log) as logFile:
+        text = logFile.read()
+    assert "Slow call: PUT /library/parts/1100005 for 'Synthetic Show " \
+        "S01E05" in text
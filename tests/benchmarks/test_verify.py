@@ -0,0 +1,41 @@
+import os
+from contextlib import redirect_stdout
+from .conftest import synthetic_server
+
+
+def run(switcher, verify=True, workers=4, **shape):
+    server, adapter = synthetic_server(seasons=2, episodes=30,
+                                       applyWrites=True, **shape)
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audio, subtitles = switcher.createTemplates(part, 2, 4)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = switcher.applyTemplates(show, [1, 2], audio, subtitles,
+                                         workers=workers, verify=verify)
+    return result, adapter
+
+
+def test_verify_reads_back_in_bulk(switcher):
+    unverified, plain = run(switcher, verify=False)
+    result, adapter = run(switcher)
+
+    assert result.parts == result.verified == 60
+    assert not result.unverified
+    assert unverified.verified == 0
+    assert adapter.writes == plain.writes == 120
+    assert all(streams == {2: part * 100 + 2, 3: part * 100 + 52}
+               for part, streams in adapter.selected.items())
+
+    # One read back per window of parts
+    windows = -(-60 // switcher.VERIFY_WINDOW)
+    assert adapter.requests - plain.requests == windows
+
+
+def test_verify_retries_only_mismatches(switcher):
+    result, adapter = run(switcher, workers=1, ignoreWrites=5)
+
+    # The first 5 writes cover the streams of 3 parts, written again
+    assert result.verified == 60
+    assert not result.unverified
+    assert adapter.writes == 120 + 3 * 2
+    assert len(adapter.selected) == 60
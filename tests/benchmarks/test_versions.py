@@ -0,0 +1,26 @@
+import os
+from contextlib import redirect_stdout
+from .conftest import synthetic_server
+
+
+def test_every_version_is_matched_from_one_fetch(switcher):
+    server, adapter = synthetic_server(seasons=1, episodes=10, versions=2,
+                                       applyWrites=True)
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audio, subtitles = switcher.createTemplates(part, 2, 4)
+
+    before = adapter.requests
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = switcher.applyTemplates(show, [1], audio, subtitles,
+                                         verify=True)
+    reads = adapter.requests - before - adapter.writes
+
+    assert result.parts == result.verified == 20
+    assert not result.unmatched
+    # Each version's "jpn Stereo" track, wherever it is listed
+    assert adapter.selected == {
+        part: {2: part * 100 + 2, 3: part * 100 + 52}
+        for key in range(1100001, 1100011) for part in (key, key + 10 ** 8)}
+    # Season and episode listings, one fetch per episode and one read back
+    assert reads == 2 + 10 + 1
@@ -0,0 +1,48 @@
+from .conftest import synthetic_server
+
+
+def episode_ids(episodes):
+    return [(e.seasonNumber, e.index) for e in episodes]
+
+
+def test_watch_order_puts_on_deck_then_unwatched_first(switcher):
+    server, adapter = synthetic_server(seasons=3, episodes=4, watched=2,
+                                       onDeck=[(2, 3), (3, 1), (1, 1)])
+    show = server.fetchItem(1)
+
+    episodes = episode_ids(switcher.iterEpisodesByPriority(show, [1, 2],
+                                                           windowSize=3))
+
+    assert episodes == [
+        (2, 3), (1, 1),
+        (1, 3), (1, 4), (2, 4),
+        (1, 2), (2, 1), (2, 2),
+    ]
+    assert sorted(episodes) == \
+        episode_ids(switcher.iterEpisodes(show, [1, 2]))
+
+
+def test_watch_order_skips_other_shows_and_movies_on_deck(switcher):
+    server, adapter = synthetic_server(seasons=1, episodes=3, onDeck=[(1, 2)])
+    show = server.fetchItem(1)
+
+    episodes = list(switcher.iterEpisodesByPriority(show, [1]))
+
+    # The on-deck list also has season 1 of another show, and a movie
+    assert episode_ids(episodes) == [(1, 2), (1, 1), (1, 3)]
+    assert {e.grandparentRatingKey for e in episodes} == {show.ratingKey}
+
+
+def test_apply_templates_in_watch_order_writes_every_episode(switcher):
+    server, adapter = synthetic_server(seasons=2, episodes=5, watched=3,
+                                       onDeck=[(2, 4)])
+    show = server.fetchItem(1)
+    part = show.season(1).episodes()[0].reload().media[0].parts[0]
+    audio, subtitles = switcher.createTemplates(part, 2, 4)
+
+    result = switcher.applyTemplates(show, [1, 2], audio, subtitles,
+                                     watchOrder=True)
+
+    assert result.parts == 10
+    assert result.audioSet == result.subtitlesSet == 10
+    assert not result.unmatched and not result.failed
@@ -10,6 +10,7 @@ def test_audiostream_info(audiostream):
     assert audiostream_info.audioStreamsIndex == 1
     assert audiostream_info.codec == "ac3"
     assert audiostream_info.languageCode == "eng"
+    assert audiostream_info.normalizedTitle == "dolby digital ex 5 1 640 kbps"
     assert audiostream_info.title == "Dolby Digital-EX 5.1 @ 640 kbps"
 
 
@@ -55,6 +56,16 @@ def test_organized_streams(mediapart, audiostreams, subtitlestreams,
     assert organized_streams.indexIsSubStream(3)
 
 
+def test_normalize_title():
+    normalize = plex-audio-subtitle-switcher.normalizeTitle
+    assert normalize("English (SDH)") == "english sdh"
+    assert normalize("English SDH") == normalize("english  sdh")
+    assert normalize("English [Subtitles]") == normalize("english subs")
+    assert normalize("Commentary Track") == "commentary"
+    assert normalize(None) == ""
+    assert normalize("---") == ""
+
+
 def test_print_reset_subs(capsys, episode):
     plex-audio-subtitle-switcher.printResetSubSuccess(episode)
     captured = capsys.readouterr()
@@ -87,6 +98,24 @@ def test_match_subtitles(subtitlestream, mediapart2, mediapart3):
     assert matched_subtitle.languageCode == subtitlestream.languageCode
 
 
+def test_match_cache(audiostream, subtitlestream, mediapart2, mediapart3):
+    cache = plex-audio-subtitle-switcher.MatchCache()
+    audio_template = plex-audio-subtitle-switcher.AudioStreamInfo(audiostream, 1)
+    subtitle_template = plex-audio-subtitle-switcher.SubtitleStreamInfo(subtitlestream, 3, 1)
+
+    # First match of each part is computed, repeats come from the cache
+    for part in (mediapart2, mediapart3, mediapart2, mediapart3):
+        matched_audio = cache.matchAudio(part, audio_template)
+        assert matched_audio.id == plex-audio-subtitle-switcher.matchAudio(
+            part, audio_template).id
+        matched_subtitle = cache.matchSubtitles(part, subtitle_template)
+        assert matched_subtitle.id == plex-audio-subtitle-switcher.matchSubtitles(
+            part, subtitle_template).id
+    assert cache.misses == 4
+    assert cache.hits == 4
+    assert cache.hitRate() == 0.5
+
+
 def test_print_streams(capsys, episode):
     plex-audio-subtitle-switcher.printStreams(episode)
     captured = capsys.readouterr()